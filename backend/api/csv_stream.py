@@ -0,0 +1,84 @@
+import codecs
+import csv
+from typing import AsyncIterator, BinaryIO, Iterator, List
+
+from fastapi import UploadFile
+from starlette.concurrency import run_in_threadpool
+
+# Bytes read from the upload per chunk
+CSV_CHUNK_SIZE = 64 * 1024
+
+# Expressions evaluated and persisted together
+CSV_BATCH_SIZE = 1000
+
+
+def iter_lines(file: BinaryIO, chunk_size: int = CSV_CHUNK_SIZE) -> Iterator[str]:
+    """
+    Read a UTF-8 file chunk by chunk and yield its lines, keeping their line
+    endings, so memory use is bounded by the chunk size and the longest line
+    rather than the file size.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pending = ""
+
+    while True:
+        chunk = file.read(chunk_size)
+        text = pending + decoder.decode(chunk, final=not chunk)
+        if not chunk:
+            if text:
+                yield text
+            return
+
+        lines = text.split("\n")
+        # Keep the trailing partial line for the next chunk
+        pending = lines.pop()
+        for line in lines:
+            yield line + "\n"
+
+
+def iter_csv_records(file: BinaryIO, chunk_size: int = CSV_CHUNK_SIZE) -> Iterator[List[str]]:
+    """
+    Yield the parsed records of a CSV file read chunk by chunk.
+
+    One csv.reader parses every line, so quoted fields may span lines and
+    chunks, and malformed quoting is handled as leniently as when the whole
+    file is parsed at once.
+    """
+    return csv.reader(iter_lines(file, chunk_size))
+
+
+def _next_expressions(records: Iterator[List[str]], batch_size: int) -> List[str]:
+    # The non-empty expressions from the first column of the next records
+    batch = []
+    for row in records:
+        if not row:
+            continue
+
+        expression = row[0].strip()
+        if not expression:
+            continue
+
+        batch.append(expression)
+        if len(batch) >= batch_size:
+            break
+    return batch
+
+
+async def iter_expression_batches(
+    file: UploadFile,
+    batch_size: int = CSV_BATCH_SIZE,
+    chunk_size: int = CSV_CHUNK_SIZE
+) -> AsyncIterator[List[str]]:
+    """
+    Yield the non-empty expressions from the first column of an uploaded CSV
+    file in batches of at most batch_size.
+
+    Each batch is read and parsed on a worker thread, since the upload may
+    have been spooled to disk.
+    """
+    records = iter_csv_records(file.file, chunk_size)
+    while True:
+        batch = await run_in_threadpool(_next_expressions, records, batch_size)
+        if not batch:
+            return
+        yield batch
@@ -0,0 +1,154 @@
+from fastapi import APIRouter, Response
+from starlette.routing import Match
+from typing import Iterable
+import time
+
+from core.db.db import get_pool_stats
+from core.logs import dropped_records
+from core.metrics import Sample, record, registry, start_timings
+from core.rpn.calculator import error_log
+from backend.api.routes import calculator, error_counter, history_writer, parallel_evaluator, isolated_calculator
+
+router = APIRouter()
+
+HTTP_SECONDS = registry.histogram(
+    "http_request_duration_seconds", "Time spent handling HTTP requests", ["method", "route", "status"]
+)
+
+
+class MetricsMiddleware:
+    """
+    Times every HTTP request by method, route template and status, and
+    optionally reports the request's stage timings (parse, evaluate, db,
+    persist) in a Server-Timing header.
+
+    Only added to the application when metrics are enabled.
+    """
+
+    def __init__(self, app, server_timing: bool = False):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not registry.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        timings = start_timings()
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    # Streamed responses only include the stages done before their first chunk
+                    timings["total"] = time.perf_counter() - started
+                    value = ", ".join(f"{stage};dur={seconds * 1000:.3f}" for stage, seconds in timings.items())
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"server-timing", value.encode("latin-1"))
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            record(HTTP_SECONDS, elapsed, None, scope["method"], _route_template(scope), str(status))
+
+
+def _route_template(scope) -> str:
+    # Label by the route's path template so ids in paths do not create series
+    route = scope.get("route")
+    if route is None:
+        for candidate in scope["app"].router.routes:
+            match, _ = candidate.matches(scope)
+            if match == Match.FULL:
+                route = candidate
+                break
+    if route is None:
+        return "unmatched"
+
+    # Routes of routers included with a prefix may only know their own path
+    path = scope["path"]
+    if not route.path_regex.match(path):
+        for start in range(1, len(path)):
+            if path[start] == "/" and route.path_regex.match(path[start:]):
+                return path[:start] + route.path
+    return route.path
+
+
+def _cache_samples(stats: dict, cache: str) -> Iterable[Sample]:
+    labels = {"cache": cache}
+    yield ("rpn_cache_hits_total", "counter", "Cache lookups that found an entry", labels, stats.get("hits"))
+    yield ("rpn_cache_misses_total", "counter", "Cache lookups that found nothing", labels, stats.get("misses"))
+    yield ("rpn_cache_evictions_total", "counter", "Entries evicted from the cache", labels, stats.get("evictions"))
+    yield ("rpn_cache_entries", "gauge", "Entries held by the cache", labels, stats.get("size", stats.get("nodes")))
+    yield ("rpn_cache_bytes", "gauge", "Estimated bytes held by the cache", labels, stats.get("bytes"))
+
+
+def collect_application_stats() -> Iterable[Sample]:
+    """
+    Read the statistics kept by the caches, pools and queues at scrape time.
+    """
+    yield from _cache_samples(calculator.program_cache.stats(), "program")
+    yield from _cache_samples(calculator.result_cache.stats(), "result")
+
+    prefix = calculator.prefix_cache.stats()
+    yield from _cache_samples(prefix, "prefix")
+    yield (
+        "rpn_prefix_cache_reused_tokens_total", "counter",
+        "Tokens served from cached prefixes instead of being evaluated", {}, prefix["reused_tokens"]
+    )
+    yield ("rpn_prefix_cache_tokens_total", "counter", "Tokens looked up in the prefix cache", {}, prefix["tokens"])
+
+    for kind, count in error_log.counts().items():
+        yield ("rpn_calculation_errors_total", "counter", "Failed calculations by kind of error", {"kind": kind}, count)
+    yield (
+        "rpn_calculation_errors_suppressed_total", "counter",
+        "Failed calculations counted but not logged by the error sampler", {}, error_log.suppressed
+    )
+    yield ("log_records_dropped_total", "counter", "Log records dropped because the log queue was full", {}, dropped_records())
+
+    pools = get_pool_stats()
+    for engine in ("sync", "async"):
+        stats = pools[engine]
+        if stats is None:
+            continue
+        labels = {"engine": engine}
+        yield ("db_pool_checked_out", "gauge", "Connections checked out of the pool", labels, stats.get("checked_out"))
+        yield ("db_pool_overflow", "gauge", "Connections open beyond the pool size", labels, stats.get("overflow"))
+        yield ("db_pool_checkouts_total", "counter", "Connection checkouts", labels, stats.get("checkouts"))
+        yield (
+            "db_pool_checkout_wait_seconds_total", "counter", "Time spent waiting for a connection",
+            labels, stats.get("checkout_wait_total_seconds")
+        )
+
+    evaluator = parallel_evaluator.stats()
+    yield ("rpn_batches_total", "counter", "Batches evaluated", {}, evaluator.get("batches"))
+    yield ("rpn_failed_chunks_total", "counter", "Batch chunks that failed as a whole", {}, evaluator.get("failed_chunks"))
+    isolated = isolated_calculator.stats()
+    yield ("rpn_offloaded_total", "counter", "Calculations run in isolated workers", {}, isolated.get("calculations"))
+    yield ("rpn_offload_timeouts_total", "counter", "Isolated calculations that timed out", {}, isolated.get("timeouts"))
+
+    if history_writer is not None:
+        writer = history_writer.stats()
+        yield ("history_writer_queue_depth", "gauge", "Calculations waiting to be written", {}, writer["queue_depth"])
+        yield ("history_writer_written_total", "counter", "Calculations written", {}, writer["written"])
+        yield ("history_writer_failed_total", "counter", "Calculations that failed to write", {}, writer["failed"])
+
+    errors = error_counter.stats()
+    yield ("error_counts_pending", "gauge", "Failed calculations not yet added to user statistics", {}, errors["pending"])
+    yield ("error_counts_failed_total", "counter", "Failed calculations whose counts failed to write", {}, errors["failed"])
+
+
+registry.register_collector(collect_application_stats)
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    """
+    Metrics in the Prometheus text exposition format.
+    """
+    return Response(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,151 @@
+from fastapi import APIRouter, Header, HTTPException, Query
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, MutableMapping, Optional
+import datetime
+import json
+import logging
+import os
+import uuid
+
+from core.profiling import Profiler, ProfilerBusy, profiler_running
+from core.rpn.cache import LRUCache
+from backend.config import settings
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+PROFILE_HEADER = "X-Profile-Id"
+
+
+class ProfileStore:
+    """
+    Keeps the reports of the most recently profiled requests in memory and,
+    with a directory, also writes each one there as <id>.json.
+    """
+
+    def __init__(self, keep: int = 50, directory: Optional[str] = None):
+        self.directory = directory
+        self._reports = LRUCache(keep)
+
+    def save(self, profile_id: str, report: Dict[str, Any]) -> None:
+        self._reports.put(profile_id, report)
+        if self.directory:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                with open(os.path.join(self.directory, f"{profile_id}.json"), "w") as f:
+                    json.dump(report, f, indent=2)
+            except OSError as e:
+                logger.error("Failed to write profile %s: %s", profile_id, e)
+
+    def get(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        return self._reports.get(profile_id)
+
+
+profiles = ProfileStore(settings.PROFILE_KEEP, settings.PROFILE_DIR or None)
+
+
+def profile_requested(
+    profile: bool = Query(False, description="Profile this request (requires PROFILING_ENABLED)"),
+    x_profile: Optional[str] = Header(None)
+) -> bool:
+    """
+    Whether the client asked for the request to be profiled, with the
+    profile query parameter or an X-Profile header.
+    """
+    requested = profile or (x_profile is not None and x_profile.strip().lower() in ("1", "true", "yes"))
+    if requested and not settings.PROFILING_ENABLED:
+        raise HTTPException(status_code=403, detail="Profiling is disabled")
+    return requested
+
+
+def _new_profiler() -> Profiler:
+    return Profiler(top=settings.PROFILE_TOP_N, memory=settings.PROFILE_MEMORY, sort=settings.PROFILE_SORT)
+
+
+def _finish(profile_id: str, profiler: Profiler, endpoint: str) -> None:
+    profiler.stop()
+    profiles.save(profile_id, dict(
+        profiler.report(),
+        id=profile_id,
+        endpoint=endpoint,
+        created=datetime.datetime.utcnow().isoformat(timespec="seconds")
+    ))
+
+
+@contextmanager
+def profile_request(endpoint: str, headers: MutableMapping[str, str]) -> Iterator[str]:
+    """
+    Profile the enclosed block and store its report, adding the report's id
+    to the response headers (including those of an HTTPException raised by
+    the block). Work done for other requests while the block awaits appears
+    in the report too.
+
+    Raises:
+        HTTPException: 409 if another request is being profiled
+    """
+    profiler = _new_profiler()
+    try:
+        profiler.start()
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    profile_id = uuid.uuid4().hex
+    headers[PROFILE_HEADER] = profile_id
+    try:
+        yield profile_id
+    except HTTPException as e:
+        e.headers = dict(e.headers or {}, **{PROFILE_HEADER: profile_id})
+        raise
+    finally:
+        _finish(profile_id, profiler, endpoint)
+
+
+def reserve_stream_profile() -> str:
+    """
+    Return the id of a profile for a streamed response, whose body is only
+    produced after the headers are sent.
+
+    Raises:
+        HTTPException: 409 if another request is being profiled
+    """
+    if profiler_running():
+        raise HTTPException(status_code=409, detail="Another profile is already running")
+    return uuid.uuid4().hex
+
+
+async def profile_stream(chunks: AsyncIterator[str], profile_id: str, endpoint: str) -> AsyncIterator[str]:
+    """
+    Profile the production of a streamed body, storing the report when the
+    stream ends.
+
+    The profiler stays installed on the event loop's thread while the stream
+    waits, so work done for other requests meanwhile appears in the report.
+    """
+    profiler = _new_profiler()
+    try:
+        profiler.start()
+    except ProfilerBusy as e:
+        # Another request won the race after the headers were sent
+        profiles.save(profile_id, {"id": profile_id, "endpoint": endpoint, "error": str(e)})
+        async for chunk in chunks:
+            yield chunk
+        return
+
+    try:
+        async for chunk in chunks:
+            yield chunk
+    finally:
+        _finish(profile_id, profiler, endpoint)
+
+
+@router.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str):
+    """
+    The report of a profiled request: its top functions by PROFILE_SORT and,
+    with PROFILE_MEMORY, its top allocation sites and peak memory.
+    """
+    report = profiles.get(profile_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Profile not found (it may have expired or still be running)")
+    return report
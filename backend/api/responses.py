@@ -0,0 +1,20 @@
+from fastapi.responses import JSONResponse
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # orjson is optional
+    orjson = None
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response rendered with orjson when it is installed, falling back to
+    the standard library encoder otherwise. Content must already be plain
+    JSON-compatible data; no jsonable_encoder pass is made.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
@@ -1,29 +1,151 @@
-from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form
-from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form, Query, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 import csv
+import datetime
 import io
+import json
 
-from core.rpn import RPNCalculator
-from core.db import get_db, User, Calculation
+from core import metrics
+from core.rpn import RPNCalculator, Limits, TraceLevel
+from core.rpn.calculator import record_error
+from core.rpn.parallel import IsolatedCalculator, ParallelEvaluator
+from core.db import get_async_db, save_calculations_async
+from core.db.db import SessionLocal, AsyncSessionLocal, get_pool_stats
+from core.db.writer import ErrorCounter, WriteBehindWriter
+from core.db.archive import ArchiveCompactor, read_history_async
+from core.db.stats import get_user_stats_async
+from backend.config import settings
+from backend.api.csv_stream import iter_expression_batches
+from backend.api.responses import FastJSONResponse
+from backend.api.profiling import PROFILE_HEADER, profile_request, profile_requested, profile_stream, reserve_stream_profile
 from pydantic import BaseModel
-from typing import Optional, List
-
+from typing import Any, Optional, List, Dict
 
 router = APIRouter()
-calculator = RPNCalculator()
+limits = Limits(
+    max_operand=settings.CALC_MAX_OPERAND or None,
+    max_result_bits=settings.CALC_MAX_RESULT_BITS or None
+)
+calculator = RPNCalculator(
+    limits=limits,
+    prefix_cache_bytes=settings.CALC_PREFIX_CACHE_BYTES,
+    prefix_cache_min_cost=settings.CALC_PREFIX_CACHE_MIN_COST
+)
+
+# Evaluates uploaded batches off the event loop, sharding large ones across
+# worker processes; shut down by the application lifecycle in backend/main.py
+parallel_evaluator = ParallelEvaluator(
+    max_workers=settings.EVAL_WORKERS or None,
+    chunk_size=settings.EVAL_CHUNK_SIZE,
+    limits=limits
+)
+
+# Runs single calculations too expensive for the event loop, with a timeout
+isolated_calculator = IsolatedCalculator(
+    max_workers=settings.CALC_OFFLOAD_WORKERS,
+    timeout=settings.CALC_TIMEOUT_SECONDS,
+    limits=limits
+)
+
+# Started and flushed by the application lifecycle in backend/main.py
+history_writer = WriteBehindWriter(
+    SessionLocal,
+    max_queue_size=settings.WRITE_BEHIND_QUEUE_SIZE,
+    batch_size=settings.WRITE_BEHIND_BATCH_SIZE,
+    flush_interval=settings.WRITE_BEHIND_FLUSH_INTERVAL
+) if settings.WRITE_BEHIND_ENABLED else None
+
+# Adds failed calculations to the users' statistics in batches; started and
+# stopped by the application lifecycle in backend/main.py
+error_counter = ErrorCounter(SessionLocal, flush_interval=settings.ERROR_COUNT_FLUSH_INTERVAL)
+
+# Moves calculations past the retention window into compressed archive chunks
+archive_compactor = ArchiveCompactor(
+    SessionLocal,
+    retention_days=settings.ARCHIVE_RETENTION_DAYS,
+    interval=settings.ARCHIVE_INTERVAL_SECONDS,
+    batch_size=settings.ARCHIVE_BATCH_SIZE
+) if settings.ARCHIVE_ENABLED else None
+
+
+def float_result(value) -> float:
+    """
+    Convert a result to the float stored and returned by the API. Integer
+    results can exceed the float range, which is reported like any other
+    overflow.
+    """
+    try:
+        return float(value)
+    except OverflowError:
+        raise ValueError("Numerical result out of range")
+
+async def run_calculation(
+    expression: str,
+    variables: Optional[Dict[str, float]] = None,
+    trace: TraceLevel = TraceLevel.FULL,
+    offload: bool = True
+) -> dict:
+    """
+    Evaluate a single expression with its result converted to a float.
+    Compiling is cheap and estimates how expensive evaluation will be, so
+    costly programs run in a separate process instead of on the event loop,
+    unless offload is False.
+    """
+    try:
+        program = calculator.compile(expression)
+        offloaded = offload and program.cost > settings.CALC_OFFLOAD_COST
+        if offloaded:
+            calc_result = await isolated_calculator.calculate(expression, variables, trace)
+    except Exception as e:
+        # calculate records its own failures; these happen before it runs or
+        # in a worker process, whose metrics this process does not see
+        record_error(expression, e)
+        raise
+    
+    if not offloaded:
+        calc_result = calculator.calculate(expression, variables, trace)
+    elif metrics.registry.enabled:
+        metrics.CALCULATIONS.inc(1, "ok")
+    calc_result["result"] = float_result(calc_result["result"])
+    return calc_result
+
+def stored_operations(calc_result: dict, trace: TraceLevel):
+    """
+    Value persisted to Calculation.operations for the given trace level.
+    """
+    if trace == TraceLevel.FULL:
+        return calc_result.get("operations", [])
+    if trace == TraceLevel.SUMMARY:
+        return calc_result.get("summary")
+    return None
 
 class CalculateRequest(BaseModel):
     expression: str
     user_id: str = "anonymous"
     result: Optional[float] = None
+    variables: Optional[Dict[str, float]] = None
+    trace: TraceLevel = TraceLevel.FULL
 
 class CalculateResponse(BaseModel):
     result: float
     operations: List[dict] = []
+    summary: Optional[dict] = None
 
 @router.post("/calculate", response_model=CalculateResponse)
-async def calculate(request: CalculateRequest, db: Session = Depends(get_db)):
+async def calculate(
+    request: CalculateRequest,
+    response: Response,
+    profile: bool = Depends(profile_requested),
+    db: AsyncSession = Depends(get_async_db)
+):
+    if not profile:
+        return await calculate_and_save(request, db)
+    with profile_request("/api/calculate", response.headers):
+        # Evaluated in-process even when costly, so the profile includes it
+        return await calculate_and_save(request, db, offload=False)
+
+async def calculate_and_save(request: CalculateRequest, db: AsyncSession, offload: bool = True) -> dict:
     try:
         # Check if we've received a pre-calculated result
         if request.result is not None:
@@ -33,119 +155,282 @@ async def calculate(request: CalculateRequest, db: Session = Depends(get_db)):
                 'operations': []  # Client-side RPN calculator doesn't produce operations
             }
             
-            # Ensure user exists
-            user = db.query(User).filter(User.id == request.user_id).first()
-            if not user:
-                user = User(id=request.user_id)
-                db.add(user)
-                db.commit()
-            
             # Save calculation with provided result
-            calculation = Calculation(
-                user_id=request.user_id,
-                expression=request.expression,
-                result=request.result
-            )
-            db.add(calculation)
-            db.commit()
+            row = {
+                "expression": request.expression,
+                "result": request.result,
+                "timestamp": datetime.datetime.utcnow()
+            }
         else:
             # Traditional server-side calculation
-            calc_result = calculator.calculate(request.expression)
+            try:
+                calc_result = await run_calculation(request.expression, request.variables, request.trace, offload)
+            except Exception:
+                # Count the failure towards the user's error rate
+                error_counter.add(request.user_id)
+                raise
             result = calc_result
             
-            # Ensure user exists
-            user = db.query(User).filter(User.id == request.user_id).first()
-            if not user:
-                user = User(id=request.user_id)
-                db.add(user)
-                db.commit()
-            
             # Save the calculation
-            calculation = Calculation(
-                user_id=request.user_id,
-                expression=request.expression,
-                result=calc_result["result"],
-                operations=calc_result.get("operations", [])
-            )
-            db.add(calculation)
-            db.commit()
+            row = {
+                "expression": request.expression,
+                "result": calc_result["result"],
+                "operations": stored_operations(calc_result, request.trace),
+                "timestamp": datetime.datetime.utcnow()
+            }
+        
+        if history_writer is not None and history_writer.running:
+            # Write-behind: persisted in the background with other calculations
+            await history_writer.enqueue(request.user_id, row)
+        else:
+            # Upsert the user and insert the calculation in one transaction
+            await save_calculations_async(db, request.user_id, [row])
         
         return result
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@router.get("/history/{user_id}")
-async def get_history(user_id: str, limit: int = 50, db: Session = Depends(get_db)):
-    calculations = db.query(Calculation)\
-        .filter(Calculation.user_id == user_id)\
-        .order_by(Calculation.timestamp.desc())\
-        .limit(limit)\
-        .all()
+class HistoryItem(BaseModel):
+    id: int
+    user_id: Optional[str] = None
+    expression: str
+    result: float
+    timestamp: Optional[datetime.datetime] = None
+    operations: Optional[Any] = None
+
+async def history_page(
+    db: AsyncSession,
+    user_id: Optional[str],
+    limit: int,
+    cursor: Optional[str],
+    include_operations: bool
+) -> FastJSONResponse:
+    """
+    Fetch one keyset-paginated page of history, across hot and archived
+    calculations, as plain dictionaries without hydrating ORM objects. The
+    cursor for the next page is returned in the X-Next-Cursor header so the
+    body stays a plain list.
+    """
+    try:
+        page, next_cursor = await read_history_async(db, user_id, limit, cursor, include_operations)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    for item in page:
+        if item["timestamp"] is not None:
+            item["timestamp"] = item["timestamp"].isoformat()
+    
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor is not None else None
+    return FastJSONResponse(page, headers=headers)
+
+class BatchCalculateRequest(BaseModel):
+    expressions: List[str]
+    user_id: str = "anonymous"
+    trace: TraceLevel = TraceLevel.FULL
+
+class BatchItem(BaseModel):
+    expression: str
+    result: Optional[float] = None
+    operations: Optional[List[dict]] = None
+    summary: Optional[dict] = None
+    error: Optional[str] = None
+
+class BatchCalculateResponse(BaseModel):
+    results: List[BatchItem]
+
+@router.post("/calculate/batch", response_model=BatchCalculateResponse, response_model_exclude_none=True)
+async def calculate_batch(request: BatchCalculateRequest, db: AsyncSession = Depends(get_async_db)):
+    """
+    Evaluate many expressions in one request and persist the successful ones
+    with a single bulk insert. Results are returned in request order, each
+    with either its result or its error.
+    """
+    if len(request.expressions) > settings.BATCH_MAX_EXPRESSIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many expressions (limit is {settings.BATCH_MAX_EXPRESSIONS})"
+        )
     
-    return calculations
-
-@router.get("/history")
-async def get_all_history(limit: int = 50, db: Session = Depends(get_db)):
-    calculations = db.query(Calculation)\
-        .order_by(Calculation.timestamp.desc())\
-        .limit(limit)\
-        .all()
+    try:
+        # Shares the evaluator's compiled-program cache with uploads
+        items = await parallel_evaluator.evaluate_async(request.expressions, request.trace)
+        results = await persist_results(db, request.user_id, items, request.trace, detailed=True)
+        return {"results": results}
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/history/{user_id}", response_model=List[HistoryItem])
+async def get_history(
+    user_id: str,
+    limit: int = Query(50, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    include_operations: bool = False,
+    db: AsyncSession = Depends(get_async_db)
+):
+    return await history_page(db, user_id, limit, cursor, include_operations)
+
+@router.get("/history", response_model=List[HistoryItem])
+async def get_all_history(
+    limit: int = Query(50, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    include_operations: bool = False,
+    db: AsyncSession = Depends(get_async_db)
+):
+    return await history_page(db, None, limit, cursor, include_operations)
+
+@router.get("/stats/{user_id}")
+async def get_user_statistics(
+    user_id: str,
+    hours: int = Query(24 * 7, ge=1, le=24 * 366),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Summarize a user's calculations from pre-aggregated statistics: counts,
+    error rate, result min/max/mean, operator frequency and hourly activity
+    over the last `hours` hours.
+    """
+    since = datetime.datetime.utcnow() - datetime.timedelta(hours=hours)
+    return await get_user_stats_async(db, user_id, since)
+
+async def persist_results(
+    db: AsyncSession,
+    user_id: str,
+    items: List[dict],
+    trace: TraceLevel,
+    detailed: bool = False
+) -> List[dict]:
+    """
+    Save the successful rows of an evaluated batch with a single bulk insert
+    and return the rows to report back to the client. With detailed the
+    evaluated items are returned whole, including their trace.
+    """
+    results = []
+    rows = []
+    errors = 0
+    for item in items:
+        if "error" not in item:
+            try:
+                item["result"] = float_result(item["result"])
+            except ValueError as e:
+                item = {"expression": item["expression"], "error": str(e)}
+        
+        if "error" in item:
+            results.append(item)
+            errors += 1
+            continue
+        
+        rows.append({
+            "expression": item["expression"],
+            "result": item["result"],
+            "operations": stored_operations(item, trace)
+        })
+        
+        # Add to results
+        results.append(item if detailed else {
+            "expression": item["expression"],
+            "result": item["result"]
+        })
     
-    return calculations
+    await save_calculations_async(db, user_id, rows, errors=errors)
+    return results
+
+async def process_upload(
+    file: UploadFile,
+    user_id: str,
+    trace: TraceLevel,
+    db: AsyncSession,
+    in_process: bool = False
+):
+    """
+    Evaluate and persist an uploaded CSV file one batch at a time, yielding
+    the results of each batch as soon as it is committed.
+    """
+    async for expressions in iter_expression_batches(file):
+        items = await parallel_evaluator.evaluate_async(expressions, trace, in_process)
+        yield await persist_results(db, user_id, items, trace)
+
+async def stream_upload(
+    file: UploadFile,
+    user_id: str,
+    trace: TraceLevel,
+    output_format: str,
+    in_process: bool = False
+):
+    """
+    Stream upload results as NDJSON lines or CSV rows. The response outlives
+    the request dependencies, so this uses its own database session.
+    """
+    async with AsyncSessionLocal() as db:
+        if output_format == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(["expression", "result", "error"])
+            yield buffer.getvalue()
+        
+        async for results in process_upload(file, user_id, trace, db, in_process):
+            if output_format == "csv":
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                for item in results:
+                    writer.writerow([item["expression"], item.get("result", ""), item.get("error", "")])
+                yield buffer.getvalue()
+            else:
+                yield "".join(json.dumps(item) + "\n" for item in results)
 
 @router.post("/upload-csv")
 async def upload_csv(
+    response: Response,
     file: UploadFile = File(...), 
     user_id: str = Form("anonymous"),
-    db: Session = Depends(get_db)
+    trace: TraceLevel = Form(TraceLevel.FULL),
+    output_format: str = Form("json"),
+    profile: bool = Depends(profile_requested),
+    db: AsyncSession = Depends(get_async_db)
 ):
+    """
+    Evaluate every expression in the first column of a CSV file.
+    
+    The file is read and persisted in fixed-size batches. With output_format
+    "ndjson" or "csv" the results are streamed back as they are produced, so
+    memory use does not grow with the file size; "json" returns a single body.
+    
+    Profiled uploads are evaluated on the event loop's thread rather than in
+    worker processes, so the profile includes the evaluation.
+    """
+    if output_format not in ("json", "ndjson", "csv"):
+        raise HTTPException(status_code=400, detail=f"Unsupported output format: {output_format}")
+    
+    if output_format != "json":
+        body = stream_upload(file, user_id, trace, output_format, in_process=profile)
+        headers = {}
+        if output_format == "csv":
+            headers["Content-Disposition"] = 'attachment; filename="results.csv"'
+        if profile:
+            profile_id = reserve_stream_profile()
+            body = profile_stream(body, profile_id, "/api/upload-csv")
+            headers[PROFILE_HEADER] = profile_id
+        media_type = "text/csv" if output_format == "csv" else "application/x-ndjson"
+        return StreamingResponse(body, media_type=media_type, headers=headers)
+    
+    if not profile:
+        return await upload_json(file, user_id, trace, db)
+    with profile_request("/api/upload-csv", response.headers):
+        return await upload_json(file, user_id, trace, db, in_process=True)
+
+async def upload_json(
+    file: UploadFile,
+    user_id: str,
+    trace: TraceLevel,
+    db: AsyncSession,
+    in_process: bool = False
+) -> dict:
+    """
+    Evaluate and persist a whole upload, returning its results in one body.
+    """
     try:
-        # Ensure user exists
-        user = db.query(User).filter(User.id == user_id).first()
-        if not user:
-            user = User(id=user_id)
-            db.add(user)
-            db.commit()
-        
-        # Process the CSV file
-        contents = await file.read()
-        buffer = io.StringIO(contents.decode('utf-8'))
-        reader = csv.reader(buffer)
-        
         results = []
-        for row in reader:
-            if not row:
-                continue
-                
-            expression = row[0].strip()
-            if not expression:
-                continue
-                
-            try:
-                # Calculate the expression
-                calc_result = calculator.calculate(expression)
-                
-                # Save the calculation
-                calculation = Calculation(
-                    user_id=user_id,
-                    expression=expression,
-                    result=calc_result["result"],
-                    operations=calc_result.get("operations", [])
-                )
-                db.add(calculation)
-                
-                # Add to results
-                results.append({
-                    "expression": expression,
-                    "result": calc_result["result"]
-                })
-            except Exception as e:
-                results.append({
-                    "expression": expression,
-                    "error": str(e)
-                })
-        
-        db.commit()
+        async for batch_results in process_upload(file, user_id, trace, db, in_process):
+            results.extend(batch_results)
         
         return {
             "success": True,
@@ -154,6 +439,31 @@ async def upload_csv(
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.get("/history-writer/stats")
+async def get_history_writer_stats():
+    if history_writer is None:
+        return {"enabled": False, "errors": error_counter.stats()}
+    return dict(history_writer.stats(), enabled=True, errors=error_counter.stats())
+
+@router.get("/archive/stats")
+async def get_archive_stats():
+    if archive_compactor is None:
+        return {"enabled": False}
+    return dict(archive_compactor.stats(), enabled=True)
+
+@router.get("/evaluator/stats")
+async def get_evaluator_stats():
+    return {
+        "batch": parallel_evaluator.stats(),
+        "isolated": isolated_calculator.stats(),
+        "prefix_cache": calculator.prefix_cache.stats()
+    }
+
+@router.get("/pool-stats")
+async def get_database_pool_stats():
+    # Pools are per worker process, so each worker reports its own
+    return get_pool_stats()
+
 @router.get("/supported-operations")
 async def get_supported_operations():
     operations = {
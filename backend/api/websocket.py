@@ -0,0 +1,190 @@
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from typing import Any, Dict, List, Optional
+import asyncio
+import json
+import logging
+
+from core.rpn import TraceLevel
+from core.rpn.session import RPNSession
+from core.db import save_calculations_async
+from core.db.db import AsyncSessionLocal
+from backend.api.routes import calculator, history_writer, run_calculation, stored_operations
+from backend.config import settings
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+class SessionHistory:
+    """
+    Buffers the calculations of one WebSocket session and saves them with a
+    single bulk insert once batch_size rows are waiting, flush_interval
+    seconds after the first buffered row, or when the session ends.
+    """
+
+    def __init__(self, user_id: str, batch_size: int, flush_interval: float):
+        self.user_id = user_id
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rows: List[Dict[str, Any]] = []
+        self.errors = 0
+        self._timer: Optional[asyncio.Task] = None
+
+    async def add(self, row: Optional[Dict[str, Any]] = None, error: bool = False) -> None:
+        if history_writer is not None and history_writer.running and row is not None:
+            # The application-wide writer already batches
+            await history_writer.enqueue(self.user_id, row)
+            return
+
+        if row is not None:
+            self.rows.append(row)
+        if error:
+            self.errors += 1
+
+        if len(self.rows) >= self.batch_size:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        self._timer = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self.rows and not self.errors:
+            return
+
+        rows, errors = self.rows, self.errors
+        self.rows, self.errors = [], 0
+        try:
+            async with AsyncSessionLocal() as db:
+                await save_calculations_async(db, self.user_id, rows, errors=errors)
+        except Exception:
+            logger.exception("Failed to save %d calculations for WebSocket session", len(rows))
+
+
+async def handle_message(session: RPNSession, history: SessionHistory, message: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Apply one client message to the session and build its reply (without
+    the correlation id).
+
+    Raises:
+        ValueError: If the message is invalid or its operation fails
+    """
+    op = message.get("op")
+
+    if op == "evaluate":
+        trace = TraceLevel(message.get("trace", TraceLevel.FULL))
+        expression = message["expression"]
+        try:
+            calc_result = await run_calculation(expression, session.bindings(message.get("variables")), trace)
+        except Exception:
+            if message.get("save", True):
+                await history.add(error=True)
+            raise
+
+        if message.get("save", True):
+            await history.add({
+                "expression": expression,
+                "result": calc_result["result"],
+                "operations": stored_operations(calc_result, trace)
+            })
+        reply = {"result": calc_result["result"], "operations": calc_result["operations"]}
+        if "summary" in calc_result:
+            reply["summary"] = calc_result["summary"]
+        return reply
+
+    if op == "push":
+        session.push(message["value"])
+        return {"stack": session.stack}
+    if op == "pop":
+        return {"value": session.pop(), "stack": session.stack}
+    if op == "apply":
+        entry = session.apply(message["operator"])
+        return {"result": entry["result"], "operation": entry, "stack": session.stack}
+    if op == "feed":
+        operations = session.feed(message["tokens"])
+        return {"operations": operations, "stack": session.stack}
+    if op == "resume":
+        reused = session.resume(message["expression"])
+        return {"reused": reused, "stack": session.stack}
+    if op == "undo":
+        previous = session.state.parent
+        if previous is None:
+            raise ValueError("Nothing to undo")
+        session.rollback(previous)
+        return {"stack": session.stack}
+    if op == "clear":
+        session.clear()
+        return {"stack": session.stack}
+    if op == "stack":
+        return {"stack": session.stack}
+    if op == "bind":
+        variables = message["variables"]
+        if not isinstance(variables, dict):
+            raise ValueError("Variables must be a JSON object")
+        session.bind(**variables)
+        return {"variables": session.variables}
+
+    raise ValueError(f"Unsupported operation: {op}")
+
+
+@router.websocket("/ws")
+async def evaluation_channel(websocket: WebSocket, user_id: str = "anonymous"):
+    """
+    Persistent evaluation channel for interactive clients.
+
+    Each message is a JSON object with an "op" and an optional "id" that is
+    echoed back in its reply, so clients can pipeline requests without
+    waiting. Messages are processed in the order they are received:
+
+        {"id": 1, "op": "evaluate", "expression": "3 4 +", "trace": "none"}
+        {"id": 2, "op": "push", "value": 3}
+        {"id": 3, "op": "apply", "operator": "+"}
+        {"id": 4, "op": "pop"} / {"op": "clear"} / {"op": "stack"}
+        {"id": 5, "op": "bind", "variables": {"x": 2}}
+        {"id": 6, "op": "feed", "tokens": "2 *"}
+        {"id": 7, "op": "resume", "expression": "3 4 + 5 *"}
+        {"id": 8, "op": "undo"}
+
+    "resume" makes the stack the state after the given expression,
+    re-evaluating only the tokens after the prefix it shares with what was
+    fed before, so a client can send the whole expression on every edit.
+
+    Replies carry the operation's result and/or the current stack, or an
+    "error". Evaluated expressions are saved to the user's history in
+    batches rather than one insert per message.
+    """
+    await websocket.accept()
+    session = RPNSession(calculator)
+    history = SessionHistory(
+        user_id,
+        batch_size=settings.WS_HISTORY_BATCH_SIZE,
+        flush_interval=settings.WS_HISTORY_FLUSH_INTERVAL
+    )
+
+    try:
+        while True:
+            text = await websocket.receive_text()
+            reply: Dict[str, Any] = {}
+            try:
+                message = json.loads(text)
+                if not isinstance(message, dict):
+                    raise ValueError("Message must be a JSON object")
+                reply["id"] = message.get("id")
+                reply.update(await handle_message(session, history, message))
+            except KeyError as e:
+                reply["error"] = f"Missing field: {e.args[0]}"
+            except Exception as e:
+                reply["error"] = str(e)
+            await websocket.send_text(json.dumps(reply))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # Save what is buffered even if the handler is being cancelled
+        await asyncio.shield(history.flush())
@@ -1,5 +1,9 @@
 import os
-from pydantic import BaseSettings
+
+try:
+    from pydantic_settings import BaseSettings
+except ImportError:  # pydantic v1
+    from pydantic import BaseSettings
 
 class Settings(BaseSettings):
     """
@@ -17,14 +21,97 @@ class Settings(BaseSettings):
         "postgresql://postgres:postgres@db:5432/rpn_calculator"
     )
     
+    # Connection pool settings (per worker process)
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", 5))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", 10))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", 30))
+    DB_POOL_PRE_PING: bool = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", 1800))
+    DB_STATEMENT_TIMEOUT_MS: int = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 0))
+    
     # Frontend settings (for CORS)
     FRONTEND_URL: str = os.getenv("FRONTEND_URL", "http://localhost:3000")
     
-    # Logging settings
+    # Logging settings. Records are written by a background thread from a
+    # queue of LOG_QUEUE_SIZE records (dropped when full); LOG_FORMAT is
+    # "text" or "json". Failed calculations are counted by kind and at most
+    # CALC_ERROR_LOG_BURST of each kind are logged per CALC_ERROR_LOG_INTERVAL.
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "text")
+    LOG_QUEUE_SIZE: int = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+    CALC_ERROR_LOG_BURST: int = int(os.getenv("CALC_ERROR_LOG_BURST", 10))
+    CALC_ERROR_LOG_INTERVAL: float = float(os.getenv("CALC_ERROR_LOG_INTERVAL", 60))
+    
+    # Instrumentation exported at /metrics. When disabled the hot paths skip
+    # all timing. Server-Timing headers report each request's stage timings.
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+    SERVER_TIMING_ENABLED: bool = os.getenv("SERVER_TIMING_ENABLED", "false").lower() == "true"
+    
+    # On-demand profiling of single requests (?profile=true or X-Profile: 1).
+    # Reports are kept in memory for /api/profiles/{id} and, with PROFILE_DIR,
+    # written there as JSON. Functions are ranked by PROFILE_SORT: "tottime"
+    # (own time; cumulative time mostly ranks the middleware every awaited
+    # call passes through), "cumulative" or "calls". PROFILE_MEMORY adds
+    # allocation tracing.
+    PROFILING_ENABLED: bool = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+    PROFILE_TOP_N: int = int(os.getenv("PROFILE_TOP_N", 25))
+    PROFILE_SORT: str = os.getenv("PROFILE_SORT", "tottime")
+    PROFILE_MEMORY: bool = os.getenv("PROFILE_MEMORY", "true").lower() == "true"
+    PROFILE_KEEP: int = int(os.getenv("PROFILE_KEEP", 50))
+    PROFILE_DIR: str = os.getenv("PROFILE_DIR", "")
+    
+    # Evaluation limits (0 disables a limit). The default result size keeps
+    # integers within Python's 4300 digit int-to-str conversion limit.
+    CALC_MAX_OPERAND: float = float(os.getenv("CALC_MAX_OPERAND", 0))
+    CALC_MAX_RESULT_BITS: int = int(os.getenv("CALC_MAX_RESULT_BITS", 14000))
+    
+    # Programs whose estimated cost exceeds CALC_OFFLOAD_COST run in a
+    # separate process and are cancelled after CALC_TIMEOUT_SECONDS. At
+    # CALC_MAX_RESULT_BITS=14000 a single operation costs at most about 5000
+    # (roughly 0.1 ms), so the default offloads programs with about four
+    # operations near the limit. Raise both together.
+    CALC_OFFLOAD_COST: float = float(os.getenv("CALC_OFFLOAD_COST", 20000))
+    CALC_OFFLOAD_WORKERS: int = int(os.getenv("CALC_OFFLOAD_WORKERS", 2))
+    CALC_TIMEOUT_SECONDS: float = float(os.getenv("CALC_TIMEOUT_SECONDS", 5))
+    
+    # Memory budget for intermediate stacks cached by token prefix, so
+    # expressions sharing a prefix only evaluate their tails (0 disables).
+    # Only programs whose estimated cost exceeds CALC_PREFIX_CACHE_MIN_COST
+    # use it; cheaper ones run folded and compiled.
+    CALC_PREFIX_CACHE_BYTES: int = int(os.getenv("CALC_PREFIX_CACHE_BYTES", 8 * 1024 * 1024))
+    CALC_PREFIX_CACHE_MIN_COST: float = float(os.getenv("CALC_PREFIX_CACHE_MIN_COST", 1000))
+    
+    # Batch evaluation: worker processes (0 uses every core, 1 evaluates
+    # in-process on a thread) and expressions per worker chunk
+    EVAL_WORKERS: int = int(os.getenv("EVAL_WORKERS", 0))
+    EVAL_CHUNK_SIZE: int = int(os.getenv("EVAL_CHUNK_SIZE", 250))
+    
+    # Largest number of expressions accepted by /api/calculate/batch
+    BATCH_MAX_EXPRESSIONS: int = int(os.getenv("BATCH_MAX_EXPRESSIONS", 1000))
+    
+    # WebSocket sessions save their calculations in batches
+    WS_HISTORY_BATCH_SIZE: int = int(os.getenv("WS_HISTORY_BATCH_SIZE", 50))
+    WS_HISTORY_FLUSH_INTERVAL: float = float(os.getenv("WS_HISTORY_FLUSH_INTERVAL", 1.0))
+    
+    # Write-behind history persistence
+    WRITE_BEHIND_ENABLED: bool = os.getenv("WRITE_BEHIND_ENABLED", "false").lower() == "true"
+    WRITE_BEHIND_QUEUE_SIZE: int = int(os.getenv("WRITE_BEHIND_QUEUE_SIZE", 10000))
+    WRITE_BEHIND_BATCH_SIZE: int = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", 500))
+    WRITE_BEHIND_FLUSH_INTERVAL: float = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", 0.5))
+    
+    # Failed calculations are counted in memory and added to the users'
+    # statistics every ERROR_COUNT_FLUSH_INTERVAL seconds
+    ERROR_COUNT_FLUSH_INTERVAL: float = float(os.getenv("ERROR_COUNT_FLUSH_INTERVAL", 1.0))
+    
+    # Archiving of old calculations into compressed storage
+    ARCHIVE_ENABLED: bool = os.getenv("ARCHIVE_ENABLED", "false").lower() == "true"
+    ARCHIVE_RETENTION_DAYS: float = float(os.getenv("ARCHIVE_RETENTION_DAYS", 30))
+    ARCHIVE_INTERVAL_SECONDS: float = float(os.getenv("ARCHIVE_INTERVAL_SECONDS", 3600))
+    ARCHIVE_BATCH_SIZE: int = int(os.getenv("ARCHIVE_BATCH_SIZE", 5000))
     
     class Config:
         env_file = ".env"
+        extra = "ignore"
 
 # Create a settings instance
 settings = Settings()
@@ -2,8 +2,30 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import os
 
-from core.db import init_db
-from backend.api.routes import router
+from core.db import init_db, instrument_queries
+from core.db.db import configure_database, dispose_async_engine
+from core.logs import configure_logging, shutdown_logging
+from core.metrics import registry
+from core.rpn.calculator import error_log
+from backend.config import settings
+
+# Size the connection pools before any route opens a session
+configure_database(
+    settings.DATABASE_URL,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    statement_timeout_ms=settings.DB_STATEMENT_TIMEOUT_MS or None
+)
+
+from backend.api.routes import (
+    router, history_writer, error_counter, archive_compactor, parallel_evaluator, isolated_calculator
+)
+from backend.api.websocket import router as websocket_router
+from backend.api.metrics import MetricsMiddleware, router as metrics_router
+from backend.api.profiling import PROFILE_HEADER, router as profiling_router
 
 # Initialize the FastAPI app
 app = FastAPI(
@@ -19,15 +41,46 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Server-Timing", PROFILE_HEADER],
 )
 
+# Time requests, calculations and queries for /metrics
+if settings.METRICS_ENABLED:
+    registry.enabled = True
+    instrument_queries()
+    app.add_middleware(MetricsMiddleware, server_timing=settings.SERVER_TIMING_ENABLED)
+
 # Include the router
 app.include_router(router, prefix="/api")
+app.include_router(websocket_router, prefix="/api")
+app.include_router(profiling_router, prefix="/api")
+app.include_router(metrics_router)
 
-# Initialize the database on startup
+# Initialize logging and the database on startup
 @app.on_event("startup")
 async def startup_event():
+    configure_logging(settings.LOG_LEVEL, settings.LOG_FORMAT == "json", settings.LOG_QUEUE_SIZE)
+    error_log.burst = settings.CALC_ERROR_LOG_BURST
+    error_log.interval = settings.CALC_ERROR_LOG_INTERVAL
     init_db()
+    await error_counter.start()
+    if history_writer is not None:
+        await history_writer.start()
+    if archive_compactor is not None:
+        await archive_compactor.start()
+
+# Flush queued history writes before the process exits
+@app.on_event("shutdown")
+async def shutdown_event():
+    if archive_compactor is not None:
+        await archive_compactor.stop()
+    if history_writer is not None:
+        await history_writer.stop()
+    await error_counter.stop()
+    parallel_evaluator.shutdown()
+    isolated_calculator.shutdown()
+    await dispose_async_engine()
+    shutdown_logging()
 
 @app.get("/")
 async def root():
@@ -0,0 +1,6 @@
+import os
+
+# Settings are read at import time: run the API against a private in-memory
+# database and evaluate batches on a thread rather than in worker processes
+os.environ["DATABASE_URL"] = "sqlite://"
+os.environ.setdefault("EVAL_WORKERS", "1")
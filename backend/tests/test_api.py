@@ -0,0 +1,161 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from backend.api.routes import calculator, isolated_calculator
+from backend.config import settings
+from backend.main import app
+from core import metrics
+from core.rpn.calculator import error_log
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(app) as client:
+        yield client
+
+def test_calculate(client):
+    response = client.post("/api/calculate", json={"expression": "3 4 +", "user_id": "calc", "trace": "none"})
+    assert response.status_code == 200
+    assert response.json()["result"] == 7
+
+def test_compile_errors_are_recorded(client):
+    errors = metrics.CALCULATIONS.value("error")
+    before = sum(error_log.counts().values())
+    response = client.post("/api/calculate", json={"expression": "1 +", "user_id": "calc"})
+    assert response.status_code == 400
+    assert metrics.CALCULATIONS.value("error") == errors + 1
+    assert sum(error_log.counts().values()) == before + 1
+
+def test_costly_calculations_are_offloaded(client):
+    offloaded = isolated_calculator.stats()["calculations"]
+    # Six powers near the default result size limit
+    expression = " ".join(["2 13000 ^ 2 13000 ^ -"] * 3) + " + +"
+    assert calculator.compile(expression).cost > settings.CALC_OFFLOAD_COST
+    
+    response = client.post("/api/calculate", json={"expression": expression, "user_id": "calc", "trace": "none"})
+    assert response.status_code == 200
+    assert response.json()["result"] == 0
+    assert isolated_calculator.stats()["calculations"] == offloaded + 1
+
+def history(client, user_id):
+    response = client.get(f"/api/history/{user_id}")
+    assert response.status_code == 200
+    return response.json()
+
+# Test batch calculation
+def test_batch_keeps_request_order_with_item_errors(client):
+    expressions = ["3 4 +", "1 0 /", "2 3 ^", "1 &", "10 2 /"]
+    response = client.post("/api/calculate/batch", json={
+        "expressions": expressions, "user_id": "batch_order", "trace": "none"
+    })
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [item["expression"] for item in results] == expressions
+    assert [item.get("result") for item in results] == [7, None, 8, None, 5]
+    assert results[1]["error"] == "Division by zero is not allowed"
+    assert results[3]["error"].startswith("Invalid token: &")
+
+def test_batch_traces(client):
+    response = client.post("/api/calculate/batch", json={"expressions": ["3 4 + 2 *"], "trace": "summary"})
+    [item] = response.json()["results"]
+    assert item["summary"]["steps"] == 2
+    assert "error" not in item
+
+def test_batch_persists_successes_in_bulk(client):
+    expressions = [f"{i} 1 +" for i in range(20)] + ["1 0 /"]
+    response = client.post("/api/calculate/batch", json={
+        "expressions": expressions, "user_id": "batch_bulk", "trace": "none"
+    })
+    assert response.status_code == 200
+    
+    saved = history(client, "batch_bulk")
+    assert sorted(item["result"] for item in saved) == [i + 1 for i in range(20)]
+    stats = client.get("/api/stats/batch_bulk").json()
+    assert stats["calculations"] == 20
+    assert stats["errors"] == 1
+
+def test_batch_size_limit(client, monkeypatch):
+    monkeypatch.setattr(settings, "BATCH_MAX_EXPRESSIONS", 3)
+    response = client.post("/api/calculate/batch", json={"expressions": ["1 1 +"] * 4, "user_id": "batch_limit"})
+    assert response.status_code == 400
+    assert "limit is 3" in response.json()["detail"]
+    assert history(client, "batch_limit") == []
+    
+    response = client.post("/api/calculate/batch", json={"expressions": ["1 1 +"] * 3, "user_id": "batch_limit"})
+    assert response.status_code == 200
+
+# Test the WebSocket channel
+def test_websocket_replies_in_order_with_ids(client):
+    with client.websocket_connect("/api/ws?user_id=ws_order") as websocket:
+        messages = [
+            {"id": 1, "op": "evaluate", "expression": "3 4 +", "trace": "none"},
+            {"id": 2, "op": "push", "value": 3},
+            {"id": 3, "op": "push", "value": 4},
+            {"id": 4, "op": "apply", "operator": "*"},
+            {"id": 5, "op": "pop"}
+        ]
+        # Pipelined: every message is sent before reading any reply
+        for message in messages:
+            websocket.send_json(message)
+        replies = [websocket.receive_json() for _ in messages]
+    
+    assert [reply["id"] for reply in replies] == [1, 2, 3, 4, 5]
+    assert replies[0]["result"] == 7
+    assert replies[2]["stack"] == [3, 4]
+    assert replies[3]["result"] == 12
+    assert replies[4] == {"id": 5, "value": 12, "stack": []}
+
+def test_websocket_errors_keep_the_channel_open(client):
+    with client.websocket_connect("/api/ws") as websocket:
+        websocket.send_text("not json")
+        assert "error" in websocket.receive_json()
+        websocket.send_json({"id": 1, "op": "evaluate", "expression": "1 0 /"})
+        assert websocket.receive_json() == {"id": 1, "error": "Division by zero is not allowed"}
+        websocket.send_json({"id": 2, "op": "push"})
+        assert websocket.receive_json() == {"id": 2, "error": "Missing field: value"}
+        websocket.send_json({"id": 3, "op": "nope"})
+        assert websocket.receive_json()["error"] == "Unsupported operation: nope"
+        websocket.send_json({"id": 4, "op": "stack"})
+        assert websocket.receive_json() == {"id": 4, "stack": []}
+
+def test_websocket_rejects_non_numeric_values(client):
+    with client.websocket_connect("/api/ws") as websocket:
+        for value in [[1, 2], None, True]:
+            websocket.send_json({"op": "push", "value": value})
+            assert "must be a number" in websocket.receive_json()["error"]
+        websocket.send_json({"op": "push", "value": "abc"})
+        assert websocket.receive_json()["error"] == "Invalid token: abc"
+        for value in [[1, 2], "5", None, True]:
+            websocket.send_json({"op": "bind", "variables": {"x": value}})
+            assert websocket.receive_json()["error"] == "Variable x must be a number, got " + type(value).__name__
+        websocket.send_json({"op": "bind", "variables": [1, 2]})
+        assert websocket.receive_json()["error"] == "Variables must be a JSON object"
+        websocket.send_json({"op": "evaluate", "expression": "x 1 +", "variables": {"x": "5"}, "save": False})
+        assert "must be a number" in websocket.receive_json()["error"]
+        websocket.send_json({"op": "stack"})
+        assert websocket.receive_json()["stack"] == []
+
+def test_websocket_variables_and_resume(client):
+    with client.websocket_connect("/api/ws") as websocket:
+        websocket.send_json({"op": "bind", "variables": {"x": 2}})
+        websocket.receive_json()
+        websocket.send_json({"op": "evaluate", "expression": "x 3 *", "trace": "none", "save": False})
+        assert websocket.receive_json()["result"] == 6
+        websocket.send_json({"op": "resume", "expression": "3 4 +"})
+        assert websocket.receive_json()["stack"] == [7]
+        websocket.send_json({"op": "resume", "expression": "3 4 + 5 *"})
+        reply = websocket.receive_json()
+        assert reply["stack"] == [35]
+        assert reply["reused"] == 3
+
+def test_websocket_saves_history_in_batches(client, monkeypatch):
+    monkeypatch.setattr(settings, "WS_HISTORY_BATCH_SIZE", 2)
+    with client.websocket_connect("/api/ws?user_id=ws_history") as websocket:
+        # The second saved row fills the batch, which is written (with the
+        # error count) before its reply is sent
+        for expression in ["1 0 /", "9 9 +", "1 2 +", "2 2 *"]:
+            save = expression != "9 9 +"
+            websocket.send_json({"op": "evaluate", "expression": expression, "trace": "none", "save": save})
+            websocket.receive_json()
+        
+        assert sorted(item["result"] for item in history(client, "ws_history")) == [3, 4]
+        assert client.get("/api/stats/ws_history").json()["errors"] == 1
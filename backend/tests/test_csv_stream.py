@@ -0,0 +1,47 @@
+import asyncio
+import io
+
+import pytest
+from fastapi import UploadFile
+
+from backend.api.csv_stream import iter_csv_records, iter_expression_batches, iter_lines
+
+def records(text, chunk_size):
+    return list(iter_csv_records(io.BytesIO(text.encode("utf-8")), chunk_size))
+
+def batches(text, batch_size=2, chunk_size=4):
+    async def collect():
+        upload = UploadFile(io.BytesIO(text.encode("utf-8")))
+        return [batch async for batch in iter_expression_batches(upload, batch_size, chunk_size)]
+    return asyncio.run(collect())
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64])
+def test_records_across_chunk_boundaries(chunk_size):
+    text = 'expression,note\n3 4 +,"a, b"\r\n5 1 -,x\n\n2 3 ^'
+    assert records(text, chunk_size) == [
+        ["expression", "note"], ["3 4 +", "a, b"], ["5 1 -", "x"], [], ["2 3 ^"]
+    ]
+
+def test_multibyte_characters_split_across_chunks():
+    assert records("π,é\n1 2 +,ü\n", 1) == [["π", "é"], ["1 2 +", "ü"]]
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 64])
+def test_quoted_newlines(chunk_size):
+    text = '"3 4\n+",note\n"1\r\n2 +"\n5 !\n'
+    assert records(text, chunk_size) == [["3 4\n+", "note"], ["1\r\n2 +"], ["5 !"]]
+
+@pytest.mark.parametrize("chunk_size", [1, 4, 64])
+def test_malformed_quotes_are_lenient(chunk_size):
+    # A stray quote in an unquoted field is kept, as when parsing the whole file
+    assert records('3 4 +"\n5 6 +\n', chunk_size) == [['3 4 +"'], ["5 6 +"]]
+    # An unterminated quoted field runs to the end of the file
+    assert records('1 1 +\n"3 4 +\n5 6 +\n', chunk_size) == [["1 1 +"], ["3 4 +\n5 6 +\n"]]
+
+def test_iter_lines_keeps_line_endings():
+    lines = list(iter_lines(io.BytesIO(b"a\r\nb\n\nc"), 2))
+    assert lines == ["a\r\n", "b\n", "\n", "c"]
+
+def test_expression_batches():
+    text = "expression\n 3 4 + \n,\n\n5 !\n1 2 -\n"
+    assert batches(text) == [["expression", "3 4 +"], ["5 !", "1 2 -"]]
+    assert batches("") == []
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Load benchmark for the API comparing the async database routes with the
+previous blocking pattern (a synchronous Session used inside async routes).
+
+By default the application runs in-process against a SQLite file; pass --url
+to load an already running server instead (only the async routes are measured).
+
+Usage:
+    DATABASE_URL=sqlite:///bench.db python -m benchmarks.api_latency [--requests N] [--concurrency N]
+    python -m benchmarks.api_latency --url http://localhost:8000
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///./bench_api.db")
+
+import httpx
+from fastapi import Depends
+from sqlalchemy.orm import Session
+
+from core.db import get_db, init_db, Calculation, save_calculations
+
+
+def add_blocking_routes(app):
+    """Mount the pre-async implementation of the routes under /blocking."""
+
+    @app.post("/blocking/calculate")
+    async def blocking_calculate(request: dict, db: Session = Depends(get_db)):
+        from backend.api.routes import calculator
+        calc_result = calculator.calculate(request["expression"])
+        save_calculations(db, request.get("user_id", "anonymous"), [{
+            "expression": request["expression"],
+            "result": calc_result["result"],
+            "operations": calc_result["operations"]
+        }])
+        return calc_result
+
+    @app.get("/blocking/history")
+    async def blocking_history(limit: int = 50, db: Session = Depends(get_db)):
+        return db.query(Calculation).order_by(Calculation.timestamp.desc()).limit(limit).all()
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run_load(client: httpx.AsyncClient, prefix: str, requests: int, concurrency: int):
+    """Issue a mix of calculate and history requests and return latencies."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i):
+        async with semaphore:
+            started = time.perf_counter()
+            if i % 2:
+                response = await client.get(f"{prefix}/history", params={"limit": 50})
+            else:
+                response = await client.post(
+                    f"{prefix}/calculate",
+                    json={"expression": f"{i} 3 + 2 * sqrt", "user_id": f"bench{i % 10}"}
+                )
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[one(i) for i in range(requests)])
+    elapsed = time.perf_counter() - started
+    return latencies, elapsed
+
+
+def report(name, latencies, elapsed):
+    print(
+        f"{name:<10}{len(latencies) / elapsed:>10.0f}"
+        f"{statistics.median(latencies) * 1000:>10.2f}"
+        f"{percentile(latencies, 0.99) * 1000:>10.2f}"
+    )
+
+
+async def main_async(args):
+    print(f"{args.requests} requests, concurrency {args.concurrency}")
+    print(f"{'routes':<10}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url) as client:
+            report("async", *await run_load(client, "/api", args.requests, args.concurrency))
+        return
+
+    from backend.main import app
+    init_db()
+    add_blocking_routes(app)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        report("blocking", *await run_load(client, "/blocking", args.requests, args.concurrency))
+        report("async", *await run_load(client, "/api", args.requests, args.concurrency))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--url", help="Base URL of a running server")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
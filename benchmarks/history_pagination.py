@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark history page latency on a large calculations table, comparing
+keyset (cursor) pagination with OFFSET pagination at increasing depths.
+
+Seeds a SQLite file once (reused on later runs) with the given number of rows.
+
+Usage:
+    python -m benchmarks.history_pagination [--rows N] [--page-size N] [--db PATH]
+"""
+
+import argparse
+import datetime
+import os
+import statistics
+import time
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import Session
+
+from core.db.bulk import insert_calculations
+from core.db.models import Base, Calculation, User
+from core.db.queries import history_statement, split_page
+
+USERS = 100
+
+
+def seed(session: Session, rows: int) -> None:
+    """Insert rows spread over USERS users and one year of timestamps."""
+    existing = session.scalar(select(func.count()).select_from(Calculation))
+    if existing >= rows:
+        return
+
+    session.add_all([User(id=f"user{i}") for i in range(USERS) if session.get(User, f"user{i}") is None])
+    start = datetime.datetime(2024, 1, 1)
+    step = datetime.timedelta(seconds=31536000 / rows)
+    batch = []
+    for i in range(existing, rows):
+        batch.append({
+            "user_id": f"user{i % USERS}",
+            "expression": f"{i} 2 *",
+            "result": i * 2,
+            "operations": None,
+            # Runs of ten rows share a timestamp to exercise the id tie-breaker
+            "timestamp": start + step * (i - i % 10)
+        })
+        if len(batch) == 50000:
+            insert_calculations(session, batch)
+            session.commit()
+            batch = []
+            print(f"  seeded {i + 1} rows", flush=True)
+    insert_calculations(session, batch)
+    session.commit()
+
+
+def time_query(session: Session, statement, repeat: int = 5) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        session.execute(statement).all()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--db", default="bench_history.db")
+    args = parser.parse_args()
+
+    engine = create_engine(f"sqlite:///{os.path.abspath(args.db)}")
+    Base.metadata.create_all(engine)
+    limit = args.page_size
+
+    with Session(engine) as session:
+        print(f"Seeding {args.rows} rows into {args.db}...")
+        seed(session, args.rows)
+
+        print(f"{'scope':<8}{'page':>8}{'keyset ms':>12}{'offset ms':>12}")
+        for user_id in (None, "user7"):
+            cursor = None
+            page_number = 0
+            for target in (1, 10, 100, 1000):
+                # Walk the cursor chain to the target page
+                while page_number < target - 1:
+                    rows = session.scalars(history_statement(user_id, limit, cursor)).all()
+                    _, cursor = split_page(rows, limit)
+                    page_number += 1
+                    if cursor is None:
+                        break
+                if page_number < target - 1:
+                    break
+
+                keyset = time_query(session, history_statement(user_id, limit, cursor))
+                offset_statement = select(Calculation)
+                if user_id is not None:
+                    offset_statement = offset_statement.where(Calculation.user_id == user_id)
+                offset_statement = offset_statement.order_by(
+                    Calculation.timestamp.desc(), Calculation.id.desc()
+                ).offset((target - 1) * limit).limit(limit)
+                offset = time_query(session, offset_statement)
+
+                scope = "all" if user_id is None else "user"
+                print(f"{scope:<8}{target:>8}{keyset * 1000:>12.2f}{offset * 1000:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Benchmark batch evaluation throughput of ParallelEvaluator from 1 to N
+worker processes.
+
+Usage:
+    python -m benchmarks.parallel_scaling [--rows N] [--chunk-size N] [--max-workers N] [--repeat N]
+"""
+
+import argparse
+import os
+import random
+import time
+
+from core.rpn import TraceLevel
+from core.rpn.parallel import ParallelEvaluator, evaluate_chunk
+
+
+def build_expressions(rows: int, seed: int = 42):
+    """Build rows of mixed-shape expressions that are not constant folded away."""
+    rng = random.Random(seed)
+    shapes = [
+        "{a} {b} + {c} *",
+        "{a} {b} / {c} -",
+        "{a} sqrt {b} {c} ^ +",
+        "{a} {b} {c} * + 2 % sin",
+        "{a} ln {b} log + {c} !"
+    ]
+    return [
+        rng.choice(shapes).format(a=rng.randint(1, 99), b=rng.randint(1, 99), c=rng.randint(1, 9))
+        for _ in range(rows)
+    ]
+
+
+def measure(evaluator: ParallelEvaluator, expressions, trace: TraceLevel, repeat: int) -> float:
+    """Return the best wall-clock seconds over repeat runs."""
+    evaluator.evaluate(expressions[:evaluator.chunk_size * evaluator.max_workers + 1], trace)  # Start the workers
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        evaluator.evaluate(expressions, trace)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--trace", choices=[level.value for level in TraceLevel], default=TraceLevel.NONE.value)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    expressions = build_expressions(args.rows)
+    trace = TraceLevel(args.trace)
+
+    start = time.perf_counter()
+    evaluate_chunk(expressions, trace)
+    baseline = time.perf_counter() - start
+
+    print(f"{args.rows} rows, chunk size {args.chunk_size}, trace {trace.value}, {os.cpu_count()} CPUs")
+    print(f"{'workers':<10}{'seconds':>10}{'rows/s':>14}{'speedup':>10}")
+    # A single worker evaluates in-process, so it is the baseline
+    print(f"{1:<10}{baseline:>10.3f}{args.rows / baseline:>14.0f}{1.0:>10.2f}")
+    for workers in range(2, args.max_workers + 1):
+        evaluator = ParallelEvaluator(max_workers=workers, chunk_size=args.chunk_size)
+        try:
+            seconds = measure(evaluator, expressions, trace, args.repeat)
+        finally:
+            evaluator.shutdown()
+        print(f"{workers:<10}{seconds:>10.3f}{args.rows / seconds:>14.0f}{baseline / seconds:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+Performance regression suite for the evaluator, the upload API and the
+history queries.
+
+Each benchmark times a generated workload and reports its throughput,
+latency percentiles and peak Python memory (traced in a separate pass, so
+tracing does not slow the timed runs; worker processes are not traced).
+Results can be saved as a baseline and later runs compared against it,
+exiting with status 1 when any benchmark regresses by more than the
+threshold.
+
+The upload benchmark posts a generated CSV to /api/upload-csv in-process,
+persisting to a temporary SQLite file unless DATABASE_URL is set. The
+history benchmarks seed a SQLite file once (reused on later runs).
+
+Usage:
+    python -m benchmarks.suite [--quick] [--only PATTERN] [--save baseline.json]
+    python -m benchmarks.suite --compare baseline.json [--threshold 0.2]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import datetime
+import fnmatch
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+_TEMP_DB = os.path.join(tempfile.gettempdir(), f"rpn_bench_suite_{os.getpid()}.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_TEMP_DB}")
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from core.db.archive import read_history
+from core.db.models import Base
+from core.db.queries import history_statement, split_page
+from core.rpn import RPNCalculator, TraceLevel
+from benchmarks.history_pagination import seed
+
+# Relative change that counts as a regression when comparing to a baseline
+DEFAULT_THRESHOLD = 0.2
+
+# Peak memory below this many bytes is too small to compare meaningfully
+MIN_COMPARED_MEMORY = 64 * 1024
+
+
+class Benchmark:
+    """
+    A named workload. setup is a context manager factory yielding the
+    callable timed on each iteration, which processes items units of work.
+    """
+
+    def __init__(self, name: str, setup, items: int = 1, repeat: int = 20):
+        self.name = name
+        self.setup = setup
+        self.items = items
+        self.repeat = repeat
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_benchmark(benchmark: Benchmark, measure_memory: bool = True):
+    """Time a benchmark and return its result dictionary."""
+    with benchmark.setup() as run:
+        run()  # Warm caches, pools and connections
+
+        latencies = []
+        for _ in range(benchmark.repeat):
+            started = time.perf_counter()
+            run()
+            latencies.append(time.perf_counter() - started)
+
+        peak = None
+        if measure_memory:
+            tracemalloc.start()
+            try:
+                run()
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+
+    # Throughput from the median rather than the mean, so one slow iteration
+    # (a GC pause, a noisy neighbour) does not read as a regression
+    median = statistics.median(latencies)
+    return {
+        "items": benchmark.items,
+        "iterations": len(latencies),
+        "throughput": benchmark.items / median,
+        "p50_ms": median * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "peak_memory_bytes": peak
+    }
+
+
+# Evaluator workloads
+
+def short_expressions(count: int):
+    return [f"{i} {i % 7 + 1} + {i % 5 + 2} * {i % 3 + 1} /" for i in range(count)]
+
+
+# Long and deep expressions read the variable x so they cannot be constant
+# folded away at compile time
+VARIABLES = {"x": 1.0001}
+
+
+def long_expression(operators: int, offset: int = 0) -> str:
+    tokens = ["x", str(offset + 1), "+"]
+    for i in range(operators):
+        tokens.extend(["x", "+-*"[i % 3]])
+    return " ".join(tokens)
+
+
+def deep_expression(depth: int) -> str:
+    # Every operand is pushed before the first operator runs
+    return " ".join(["x"] * depth + ["+"] * (depth - 1))
+
+
+def calculator_workload(expressions, trace: TraceLevel = TraceLevel.NONE, variables=None, **options):
+    @contextlib.contextmanager
+    def setup():
+        calculator = RPNCalculator(**options)
+
+        def run():
+            for expression in expressions:
+                calculator.calculate(expression, variables, trace=trace)
+        yield run
+    return setup
+
+
+def uncached_calculator_workload(expressions, trace: TraceLevel = TraceLevel.NONE, variables=None):
+    # A fresh calculator per run, so compiling is part of every iteration
+    @contextlib.contextmanager
+    def setup():
+        def run():
+            calculator = RPNCalculator()
+            for expression in expressions:
+                calculator.calculate(expression, variables, trace=trace)
+        yield run
+    return setup
+
+
+# Upload workload
+
+def build_csv(rows: int) -> bytes:
+    expressions = short_expressions(rows)
+    return ("expression\n" + "\n".join(expressions) + "\n").encode()
+
+
+def upload_workload(rows: int):
+    @contextlib.contextmanager
+    def setup():
+        import httpx
+        from backend.main import app
+        from backend.api.routes import parallel_evaluator
+        from core.db import init_db
+
+        init_db()
+        body = build_csv(rows)
+        loop = asyncio.new_event_loop()
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None
+        )
+
+        async def upload():
+            response = await client.post(
+                "/api/upload-csv",
+                files={"file": ("bench.csv", body, "text/csv")},
+                data={"user_id": "bench", "trace": "none", "output_format": "ndjson"}
+            )
+            response.raise_for_status()
+
+        try:
+            yield lambda: loop.run_until_complete(upload())
+        finally:
+            loop.run_until_complete(client.aclose())
+            loop.close()
+            parallel_evaluator.shutdown()
+    return setup
+
+
+# History workloads
+
+def history_workload(db_path: str, rows: int, page: int, user_id=None, page_size: int = 50):
+    @contextlib.contextmanager
+    def setup():
+        engine = create_engine(f"sqlite:///{os.path.abspath(db_path)}")
+        Base.metadata.create_all(engine)
+        with Session(engine) as session:
+            seed(session, rows)
+
+            # Walk the cursor chain to the requested page
+            cursor = None
+            for _ in range(page - 1):
+                results = session.scalars(history_statement(user_id, page_size, cursor)).all()
+                _, cursor = split_page(results, page_size)
+                if cursor is None:
+                    break
+
+            def run():
+                read_history(session, user_id, page_size, cursor)
+            yield run
+        engine.dispose()
+    return setup
+
+
+def build_suite(args):
+    scale = 0.1 if args.quick else 1.0
+    repeat = 5 if args.quick else 20
+    csv_rows = int(args.csv_rows * scale)
+    history_rows = int(args.history_rows * scale)
+    short = short_expressions(1000)
+    long = [long_expression(500, offset) for offset in range(20)]
+    deep = [deep_expression(1000)]
+    factorials = [f"{n} ! {n + 1} %" for n in range(2000, 2020)]
+
+    return [
+        Benchmark("calc.short", calculator_workload(short), len(short), repeat),
+        Benchmark("calc.short.full_trace", calculator_workload(short, TraceLevel.FULL), len(short), repeat),
+        Benchmark("calc.short.compile", uncached_calculator_workload(short), len(short), repeat),
+        Benchmark("calc.long", calculator_workload(long, variables=VARIABLES), len(long), repeat),
+        Benchmark("calc.long.compile", uncached_calculator_workload(long, variables=VARIABLES), len(long), repeat),
+        Benchmark("calc.deep_stack", calculator_workload(deep, variables=VARIABLES), len(deep), repeat),
+        Benchmark("calc.factorial", uncached_calculator_workload(factorials), len(factorials), repeat),
+        Benchmark(
+            "calc.factorial.prefix_cache",
+            calculator_workload([f"2000 ! {n} %" for n in range(3, 23)], prefix_cache_bytes=8 * 1024 * 1024),
+            20, repeat
+        ),
+        Benchmark("api.upload_csv", upload_workload(csv_rows), csv_rows, max(1, repeat // 5)),
+        Benchmark("db.history.first_page", history_workload(args.history_db, history_rows, 1), 1, repeat),
+        Benchmark("db.history.page_1000", history_workload(args.history_db, history_rows, 1000), 1, repeat),
+        Benchmark(
+            "db.history.user_first_page",
+            history_workload(args.history_db, history_rows, 1, user_id="user7"), 1, repeat
+        )
+    ]
+
+
+def compare(results, baseline, threshold: float):
+    """Print the change against a baseline and return the regressed benchmarks."""
+    regressions = []
+    print(f"\n{'benchmark':<30}{'throughput':>12}{'p95':>10}{'memory':>10}")
+    for name, current in results.items():
+        previous = baseline["results"].get(name)
+        if previous is None:
+            print(f"{name:<30}{'new':>12}")
+            continue
+
+        throughput = current["throughput"] / previous["throughput"] - 1
+        p95 = current["p95_ms"] / previous["p95_ms"] - 1
+        memory = None
+        if current["peak_memory_bytes"] and (previous["peak_memory_bytes"] or 0) >= MIN_COMPARED_MEMORY:
+            memory = current["peak_memory_bytes"] / previous["peak_memory_bytes"] - 1
+
+        regressed = throughput < -threshold or p95 > threshold or (memory is not None and memory > threshold)
+        if regressed:
+            regressions.append(name)
+        memory_text = f"{memory:+.1%}" if memory is not None else "-"
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:<30}{throughput:>+12.1%}{p95:>+10.1%}{memory_text:>10}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="Run at a tenth of the data sizes with fewer repeats")
+    parser.add_argument("--only", action="append", help="Run benchmarks matching a glob (repeatable)")
+    parser.add_argument("--csv-rows", type=int, default=100000)
+    parser.add_argument("--history-rows", type=int, default=2000000)
+    parser.add_argument("--history-db", default="bench_suite_history.db")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the peak memory pass")
+    parser.add_argument("--save", metavar="PATH", help="Save the results as a baseline")
+    parser.add_argument("--compare", metavar="PATH", help="Compare against a saved baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+
+    benchmarks = build_suite(args)
+    if args.only:
+        benchmarks = [b for b in benchmarks if any(fnmatch.fnmatch(b.name, pattern) for pattern in args.only)]
+
+    results = {}
+    print(f"{'benchmark':<30}{'items/s':>12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'peak KiB':>10}")
+    try:
+        for benchmark in benchmarks:
+            result = run_benchmark(benchmark, measure_memory=not args.no_memory)
+            results[benchmark.name] = result
+            peak = result["peak_memory_bytes"]
+            print(
+                f"{benchmark.name:<30}{result['throughput']:>12.0f}{result['p50_ms']:>10.2f}"
+                f"{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}"
+                f"{peak / 1024 if peak is not None else float('nan'):>10.0f}",
+                flush=True
+            )
+    finally:
+        if os.path.exists(_TEMP_DB):
+            os.remove(_TEMP_DB)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({
+                "created": datetime.datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "quick": args.quick,
+                "results": results
+            }, f, indent=2)
+        print(f"\nSaved baseline to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("quick") != args.quick:
+            print("\nWarning: baseline was recorded at a different scale (--quick)")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}")
+            sys.exit(1)
+        print("\nNo regressions")
+
+
+if __name__ == "__main__":
+    main()
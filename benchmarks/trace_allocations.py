@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Benchmark memory allocations of RPNCalculator.calculate per trace level.
+
+Usage:
+    python -m benchmarks.trace_allocations [--iterations N] [--length N]
+"""
+
+import argparse
+import time
+import tracemalloc
+
+from core.rpn import RPNCalculator, TraceLevel
+
+
+def build_expression(length: int) -> str:
+    """Build a long expression that cannot be constant folded."""
+    tokens = ["x"]
+    for i in range(length):
+        tokens.extend(["x", "+" if i % 2 else "*"])
+    return " ".join(tokens)
+
+
+def measure(calculator: RPNCalculator, expression: str, trace: TraceLevel, iterations: int):
+    """Return (allocated blocks, allocated bytes, seconds) per call."""
+    variables = {"x": 1.0001}
+    calculator.calculate(expression, variables, trace)  # Warm the program cache
+
+    # Keep every result alive so the snapshot counts all of their allocations
+    results = []
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for _ in range(iterations):
+        results.append(calculator.calculate(expression, variables, trace))
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    stats = after.compare_to(before, "filename")
+    blocks = sum(stat.count_diff for stat in stats)
+    size = sum(stat.size_diff for stat in stats)
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        calculator.calculate(expression, variables, trace)
+    elapsed = time.perf_counter() - start
+
+    return blocks / iterations, size / iterations, elapsed / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--length", type=int, default=100, help="Number of operators in the expression")
+    args = parser.parse_args()
+
+    calculator = RPNCalculator()
+    expression = build_expression(args.length)
+
+    print(f"Expression with {args.length} operators, {args.iterations} iterations")
+    print(f"{'trace':<10}{'blocks/call':>14}{'bytes/call':>14}{'us/call':>12}")
+    for trace in TraceLevel:
+        blocks, size, seconds = measure(calculator, expression, trace, args.iterations)
+        print(f"{trace.value:<10}{blocks:>14.1f}{size:>14.0f}{seconds * 1e6:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,23 @@
 """Database module for RPN Calculator."""
 
-from core.db.db import get_db, init_db
-from core.db.models import User, Calculation
+from core.db.db import get_db, get_async_db, init_db
+from core.db.models import User, Calculation, CalculationArchive, UserStats, UserOperatorCount, UserActivity
+from core.db.bulk import (
+    ensure_user, insert_calculations, save_calculations,
+    ensure_user_async, insert_calculations_async, save_calculations_async
+)
+from core.db.writer import ErrorCounter, WriteBehindWriter
+from core.db.archive import ArchiveCompactor, compact_calculations, read_history, read_history_async
+from core.db.stats import get_user_stats, get_user_stats_async, rebuild_user_stats
+from core.db.timing import instrument_queries
 
-__all__ = ["get_db", "init_db", "User", "Calculation"] 
\ No newline at end of file
+__all__ = [
+    "get_db", "get_async_db", "init_db", "User", "Calculation", "CalculationArchive",
+    "UserStats", "UserOperatorCount", "UserActivity",
+    "ensure_user", "insert_calculations", "save_calculations",
+    "ensure_user_async", "insert_calculations_async", "save_calculations_async",
+    "WriteBehindWriter", "ErrorCounter",
+    "ArchiveCompactor", "compact_calculations", "read_history", "read_history_async",
+    "get_user_stats", "get_user_stats_async", "rebuild_user_stats",
+    "instrument_queries"
+] 
\ No newline at end of file
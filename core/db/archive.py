@@ -0,0 +1,349 @@
+"""
+Archived calculation storage.
+
+Calculations older than the retention window are moved out of the hot
+calculations table into compressed chunks, one per user and day, in
+calculation_archives. History reads merge both tiers into a single
+newest-first sequence, so cursors keep working across the boundary.
+"""
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import asyncio
+import datetime
+import json
+import logging
+import time
+import zlib
+
+from core.db.models import Calculation, CalculationArchive
+from core.db.queries import decode_cursor, encode_cursor, history_columns, history_statement
+
+logger = logging.getLogger(__name__)
+
+# Hot rows moved per compaction transaction
+ARCHIVE_BATCH_SIZE = 5000
+
+# Archive chunks fetched per round trip while merging history
+ARCHIVE_FETCH_SIZE = 8
+
+ARCHIVE_COMPRESSION_LEVEL = 6
+
+
+def compress_rows(rows: Sequence[Dict[str, Any]]) -> bytes:
+    """
+    Pack calculation rows into a compressed archive payload.
+    """
+    payload = [
+        [
+            row["id"],
+            row["user_id"],
+            row["expression"],
+            row["result"],
+            row["timestamp"].isoformat(),
+            row.get("operations")
+        ]
+        for row in rows
+    ]
+    return zlib.compress(json.dumps(payload, separators=(",", ":")).encode(), ARCHIVE_COMPRESSION_LEVEL)
+
+
+def decompress_rows(data: bytes) -> List[Dict[str, Any]]:
+    """
+    Unpack a payload produced by compress_rows.
+    """
+    return [
+        {
+            "id": calculation_id,
+            "user_id": user_id,
+            "expression": expression,
+            "result": result,
+            "timestamp": datetime.datetime.fromisoformat(timestamp),
+            "operations": operations
+        }
+        for calculation_id, user_id, expression, result, timestamp, operations
+        in json.loads(zlib.decompress(data))
+    ]
+
+
+def _archive_chunks(rows: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    groups: Dict[Tuple[Optional[str], datetime.date], List[Dict[str, Any]]] = {}
+    for row in rows:
+        groups.setdefault((row["user_id"], row["timestamp"].date()), []).append(row)
+
+    return [
+        {
+            "user_id": user_id,
+            "min_timestamp": min(row["timestamp"] for row in chunk),
+            "max_timestamp": max(row["timestamp"] for row in chunk),
+            "row_count": len(chunk),
+            "data": compress_rows(chunk)
+        }
+        for (user_id, _), chunk in groups.items()
+    ]
+
+
+def compact_calculations(
+    db: Session,
+    cutoff: datetime.datetime,
+    batch_size: int = ARCHIVE_BATCH_SIZE
+) -> int:
+    """
+    Move calculations older than cutoff into compressed archive chunks.
+
+    Each batch is archived and deleted from the hot table in its own
+    transaction, oldest first, so an interrupted run loses no rows.
+
+    Args:
+        db: The database session
+        cutoff: Calculations with an earlier timestamp are archived
+        batch_size: Hot rows moved per transaction
+
+    Returns:
+        The number of calculations archived
+    """
+    statement = (
+        select(*history_columns(include_operations=True))
+        .where(Calculation.timestamp < cutoff)
+        .order_by(Calculation.timestamp, Calculation.id)
+        .limit(batch_size)
+    )
+
+    moved = 0
+    while True:
+        rows = [row._asdict() for row in db.execute(statement)]
+        if not rows:
+            break
+
+        db.execute(insert(CalculationArchive), _archive_chunks(rows))
+        db.execute(delete(Calculation).where(Calculation.id.in_([row["id"] for row in rows])))
+        db.commit()
+        moved += len(rows)
+
+        if len(rows) < batch_size:
+            break
+    return moved
+
+
+class _HistoryMerge:
+    """
+    Merges archived rows into a page of hot history rows.
+
+    Chunks are visited newest first and merging stops at the first chunk
+    whose newest row is older than everything the page still needs.
+    """
+
+    def __init__(
+        self,
+        hot_rows: Iterable[Any],
+        user_id: Optional[str],
+        limit: int,
+        cursor: Optional[str],
+        include_operations: bool
+    ):
+        self.rows = [row._asdict() for row in hot_rows]
+        self.user_id = user_id
+        self.limit = limit
+        self.cursor_key = decode_cursor(cursor) if cursor is not None else None
+        self.include_operations = include_operations
+
+    def statement(self) -> Select:
+        statement = select(CalculationArchive)
+        if self.user_id is not None:
+            statement = statement.where(CalculationArchive.user_id == self.user_id)
+        if self.cursor_key is not None:
+            statement = statement.where(CalculationArchive.min_timestamp <= self.cursor_key[0])
+        if len(self.rows) > self.limit:
+            # A full hot page only needs chunks that reach into it
+            statement = statement.where(CalculationArchive.max_timestamp >= self.rows[self.limit]["timestamp"])
+        return (
+            statement
+            .order_by(CalculationArchive.max_timestamp.desc(), CalculationArchive.id.desc())
+            .execution_options(yield_per=ARCHIVE_FETCH_SIZE)
+        )
+
+    def done(self, chunk: CalculationArchive) -> bool:
+        return len(self.rows) > self.limit and chunk.max_timestamp < self.rows[self.limit]["timestamp"]
+
+    def add(self, chunk: CalculationArchive) -> None:
+        for row in decompress_rows(chunk.data):
+            if self.cursor_key is not None and (row["timestamp"], row["id"]) >= self.cursor_key:
+                continue
+            if not self.include_operations:
+                del row["operations"]
+            self.rows.append(row)
+        self.rows.sort(key=lambda row: (row["timestamp"], row["id"]), reverse=True)
+        del self.rows[self.limit + 1:]
+
+    def page(self) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        if len(self.rows) <= self.limit:
+            return self.rows, None
+        page = self.rows[:self.limit]
+        last = page[-1]
+        return page, encode_cursor(last["timestamp"], last["id"])
+
+
+def read_history(
+    db: Session,
+    user_id: Optional[str] = None,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    include_operations: bool = False
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Read one keyset-paginated page of history across hot and archived rows.
+
+    Args:
+        db: The database session
+        user_id: Only include this user's calculations
+        limit: Page size
+        cursor: Cursor returned with the previous page
+        include_operations: Include each calculation's operations log
+
+    Returns:
+        The page as dictionaries, newest first, and the cursor for the next
+        page (None on the last page)
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    statement = history_statement(user_id, limit, cursor, columns=history_columns(include_operations))
+    merge = _HistoryMerge(db.execute(statement), user_id, limit, cursor, include_operations)
+    chunks = db.scalars(merge.statement())
+    try:
+        for chunk in chunks:
+            if merge.done(chunk):
+                break
+            merge.add(chunk)
+    finally:
+        chunks.close()
+    return merge.page()
+
+
+async def read_history_async(
+    db,
+    user_id: Optional[str] = None,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    include_operations: bool = False
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Async variant of read_history for an AsyncSession.
+    """
+    statement = history_statement(user_id, limit, cursor, columns=history_columns(include_operations))
+    merge = _HistoryMerge(await db.execute(statement), user_id, limit, cursor, include_operations)
+    chunks = await db.stream_scalars(merge.statement())
+    try:
+        async for chunk in chunks:
+            if merge.done(chunk):
+                break
+            merge.add(chunk)
+    finally:
+        await chunks.close()
+    return merge.page()
+
+
+class ArchiveCompactor:
+    """
+    Periodically archives calculations older than the retention window from
+    a background task, keeping the hot calculations table small.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        retention_days: float = 30,
+        interval: float = 3600,
+        batch_size: int = ARCHIVE_BATCH_SIZE
+    ):
+        self.session_factory = session_factory
+        self.retention_days = retention_days
+        self.interval = interval
+        self.batch_size = batch_size
+
+        self._task: Optional[asyncio.Task] = None
+        self._stopping: Optional[asyncio.Event] = None
+
+        # Metrics
+        self.runs = 0
+        self.archived = 0
+        self.failed_runs = 0
+        self.last_run_seconds = 0.0
+        self.last_run_at: Optional[datetime.datetime] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        """
+        Start the background compaction task on the running event loop.
+        """
+        if self.running:
+            return
+        self._stopping = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Stop the background task, letting a compaction in progress finish.
+        """
+        if not self.running:
+            return
+        self._stopping.set()
+        await self._task
+        self._task = None
+
+    def compact(self) -> int:
+        """
+        Archive everything older than the retention window now.
+
+        Returns:
+            The number of calculations archived
+        """
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=self.retention_days)
+        db = self.session_factory()
+        try:
+            return compact_calculations(db, cutoff, self.batch_size)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while not self._stopping.is_set():
+            started = time.perf_counter()
+            try:
+                # Compaction uses a synchronous session, so keep it off the event loop
+                self.archived += await loop.run_in_executor(None, self.compact)
+            except Exception:
+                self.failed_runs += 1
+                logger.exception("Failed to archive old calculations")
+            finally:
+                self.runs += 1
+                self.last_run_seconds = time.perf_counter() - started
+                self.last_run_at = datetime.datetime.utcnow()
+
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return a snapshot of the compaction metrics.
+        """
+        return {
+            "running": self.running,
+            "retention_days": self.retention_days,
+            "interval_seconds": self.interval,
+            "runs": self.runs,
+            "archived": self.archived,
+            "failed_runs": self.failed_runs,
+            "last_run_seconds": self.last_run_seconds,
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None
+        }
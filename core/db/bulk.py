@@ -0,0 +1,211 @@
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from typing import Any, Dict, List, Optional, Sequence
+import csv
+import datetime
+import io
+import json
+
+from core.db.models import User, Calculation
+from core.db.queries import dialect_insert
+from core.db.stats import update_user_stats, update_user_stats_async
+from core.db.timing import PERSIST_SECONDS
+from core.metrics import timed
+
+# Batches at least this large use COPY when the driver supports it
+# (psycopg2 for sync sessions, asyncpg for async ones)
+COPY_THRESHOLD = 5000
+
+COPY_COLUMNS = ("user_id", "expression", "result", "timestamp", "operations")
+
+
+def _upsert_user_statement(db: Session, user_id: str):
+    insert_construct = dialect_insert(db)
+    if insert_construct is None:
+        return None
+    return (
+        insert_construct(User)
+        .values(id=user_id)
+        .on_conflict_do_nothing(index_elements=[User.id])
+    )
+
+
+def _calculation_rows(rows: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # executemany needs every parameter set to have the same keys
+    timestamp = datetime.datetime.utcnow()
+    return [
+        {
+            "user_id": row["user_id"],
+            "expression": row["expression"],
+            "result": row["result"],
+            "operations": row.get("operations"),
+            "timestamp": row.get("timestamp") or timestamp
+        }
+        for row in rows
+    ]
+
+
+def ensure_user(db: Session, user_id: str) -> None:
+    """
+    Create the user if it does not exist, without committing.
+
+    Uses INSERT ... ON CONFLICT DO NOTHING so it costs a single statement
+    instead of a query followed by an insert.
+    """
+    statement = _upsert_user_statement(db, user_id)
+    if statement is None:
+        if db.get(User, user_id) is None:
+            db.add(User(id=user_id))
+            db.flush()
+        return
+
+    db.execute(statement)
+
+
+def _copy_records(rows: Sequence[Dict[str, Any]]) -> List[tuple]:
+    # Values in COPY_COLUMNS order, with operations as JSON text
+    records = []
+    for row in rows:
+        operations = row.get("operations")
+        records.append((
+            row["user_id"],
+            row["expression"],
+            float(row["result"]),
+            row["timestamp"],
+            None if operations is None else json.dumps(operations)
+        ))
+    return records
+
+
+def _uses_copy(bind, rows: Sequence[Dict[str, Any]], driver: str) -> bool:
+    return len(rows) >= COPY_THRESHOLD and bind.dialect.name == "postgresql" and bind.dialect.driver == driver
+
+
+def _copy_calculations(db: Session, rows: Sequence[Dict[str, Any]]) -> None:
+    """
+    Load rows with PostgreSQL COPY over the session's own connection, so the
+    rows are part of the current transaction.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for user_id, expression, result, timestamp, operations in _copy_records(rows):
+        writer.writerow([user_id, expression, repr(result), timestamp.isoformat(), operations or ""])
+    buffer.seek(0)
+
+    dbapi_connection = db.connection().connection.dbapi_connection
+    with dbapi_connection.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {Calculation.__tablename__} ({', '.join(COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+
+
+async def _copy_calculations_async(db, rows: Sequence[Dict[str, Any]]) -> bool:
+    """
+    Load rows with asyncpg's binary COPY over the session's own connection.
+
+    asyncpg only begins the session's transaction when a statement runs, so
+    this returns False without loading anything if none has run yet (the
+    rows would otherwise commit on their own).
+    """
+    connection = await db.connection()
+    raw_connection = await connection.get_raw_connection()
+    driver_connection = raw_connection.driver_connection
+    if not driver_connection.is_in_transaction():
+        return False
+
+    await driver_connection.copy_records_to_table(
+        Calculation.__tablename__,
+        records=_copy_records(rows),
+        columns=list(COPY_COLUMNS)
+    )
+    return True
+
+
+def insert_calculations(
+    db: Session,
+    rows: Sequence[Dict[str, Any]],
+    errors: Optional[Dict[str, int]] = None
+) -> None:
+    """
+    Insert many calculations in one executemany batch and update the
+    per-user statistics, without committing.
+
+    Args:
+        db: The database session
+        rows: Dictionaries with user_id, expression, result and optionally
+              operations and timestamp keys
+        errors: Number of failed calculations per user to record
+    """
+    if not rows and not errors:
+        return
+
+    rows = _calculation_rows(rows)
+    if _uses_copy(db.get_bind(), rows, "psycopg2"):
+        _copy_calculations(db, rows)
+    elif rows:
+        db.execute(insert(Calculation), rows)
+
+    update_user_stats(db, rows, errors)
+
+
+def save_calculations(db: Session, user_id: str, rows: Sequence[Dict[str, Any]], errors: int = 0) -> None:
+    """
+    Ensure the user exists and insert its calculations in a single transaction.
+
+    Args:
+        db: The database session
+        user_id: Owner of the calculations
+        rows: Dictionaries with expression, result and optionally operations
+        errors: Number of failed calculations to record in the user's statistics
+    """
+    with timed(PERSIST_SECONDS, "persist"):
+        ensure_user(db, user_id)
+        insert_calculations(db, [dict(row, user_id=user_id) for row in rows], {user_id: errors} if errors else None)
+        db.commit()
+
+
+async def ensure_user_async(db, user_id: str) -> None:
+    """
+    Async variant of ensure_user for an AsyncSession.
+    """
+    statement = _upsert_user_statement(db, user_id)
+    if statement is None:
+        if await db.get(User, user_id) is None:
+            db.add(User(id=user_id))
+            await db.flush()
+        return
+
+    await db.execute(statement)
+
+
+async def insert_calculations_async(
+    db,
+    rows: Sequence[Dict[str, Any]],
+    errors: Optional[Dict[str, int]] = None
+) -> None:
+    """
+    Async variant of insert_calculations for an AsyncSession, using COPY on
+    asyncpg once the session's transaction has begun (as it has after
+    ensure_user_async).
+    """
+    if not rows and not errors:
+        return
+
+    rows = _calculation_rows(rows)
+    copied = _uses_copy(db.get_bind(), rows, "asyncpg") and await _copy_calculations_async(db, rows)
+    if rows and not copied:
+        await db.execute(insert(Calculation), rows)
+    await update_user_stats_async(db, rows, errors)
+
+
+async def save_calculations_async(db, user_id: str, rows: Sequence[Dict[str, Any]], errors: int = 0) -> None:
+    """
+    Async variant of save_calculations for an AsyncSession.
+    """
+    with timed(PERSIST_SECONDS, "persist"):
+        await ensure_user_async(db, user_id)
+        await insert_calculations_async(
+            db, [dict(row, user_id=user_id) for row in rows], {user_id: errors} if errors else None
+        )
+        await db.commit()
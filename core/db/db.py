@@ -1,8 +1,11 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.ext.declarative import declarative_base
 import os
-from typing import Generator
+from typing import Any, AsyncGenerator, Dict, Generator, Optional
+
+from core.db.pool import engine_options, pool_stats, shared_memory_url
 
 # Get the database URL from environment variables with a default fallback
 DATABASE_URL = os.getenv(
@@ -10,10 +13,43 @@ DATABASE_URL = os.getenv(
     "postgresql://postgres:postgres@db:5432/rpn_calculator"
 )
 
-engine = create_engine(DATABASE_URL)
+# Pool and timeout options shared by the sync and async engines
+_pool_options: Dict[str, Any] = {}
+
+# The URL both engines connect to: DATABASE_URL, with in-memory SQLite named
+# so that the two engines share one database
+_engine_url = shared_memory_url(DATABASE_URL)
+
+engine = create_engine(_engine_url, **engine_options(_engine_url))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+def configure_database(url: Optional[str] = None, **options) -> None:
+    """
+    Recreate the database engine with a new URL and/or pool options.
+    Call this at application start-up, before any session is opened.
+    
+    Args:
+        url: Database URL (defaults to the current DATABASE_URL)
+        **options: Pool options accepted by core.db.pool.engine_options,
+                   e.g. pool_size, max_overflow, pool_timeout, pool_pre_ping,
+                   pool_recycle and statement_timeout_ms
+    """
+    global DATABASE_URL, _engine_url, engine, _async_engine, _async_session_factory
+    if url is not None:
+        DATABASE_URL = url
+    _engine_url = shared_memory_url(DATABASE_URL)
+    _pool_options.clear()
+    _pool_options.update(options)
+    
+    engine.dispose()
+    engine = create_engine(_engine_url, **engine_options(_engine_url, **_pool_options))
+    SessionLocal.configure(bind=engine)
+    
+    # Rebuilt lazily with the new options on next use
+    _async_engine = None
+    _async_session_factory = None
+
 # This works with FastAPI's dependency injection
 def get_db() -> Generator[Session, None, None]:
     """
@@ -26,9 +62,83 @@ def get_db() -> Generator[Session, None, None]:
     finally:
         db.close()
 
+# Async drivers used in place of the synchronous ones
+ASYNC_DRIVERS = {
+    "postgresql": "asyncpg",
+    "sqlite": "aiosqlite"
+}
+
+_async_engine = None
+_async_session_factory = None
+
+def to_async_url(url: str) -> str:
+    """
+    Convert a synchronous database URL to its asyncio driver equivalent,
+    e.g. postgresql://... to postgresql+asyncpg://...
+    """
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    driver = ASYNC_DRIVERS.get(backend)
+    if driver is None:
+        raise ValueError(f"No async driver configured for database '{backend}'")
+    return parsed.set(drivername=f"{backend}+{driver}").render_as_string(hide_password=False)
+
+def get_async_engine():
+    """
+    Return the shared async engine, creating it on first use so the async
+    drivers are only required by applications that use them.
+    """
+    global _async_engine, _async_session_factory
+    if _async_engine is None:
+        from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+        url = to_async_url(_engine_url)
+        _async_engine = create_async_engine(url, **engine_options(url, is_async=True, **_pool_options))
+        _async_session_factory = async_sessionmaker(_async_engine, autoflush=False, expire_on_commit=False)
+    return _async_engine
+
+def AsyncSessionLocal():
+    """
+    Create a new AsyncSession bound to the shared async engine.
+    """
+    get_async_engine()
+    return _async_session_factory()
+
+async def get_async_db() -> AsyncGenerator:
+    """
+    Create a new async database session and close it when done.
+    This is the non-blocking alternative to get_db for FastAPI dependencies.
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def dispose_async_engine() -> None:
+    """
+    Close every pooled connection of the async engine, if it was created.
+    """
+    global _async_engine, _async_session_factory
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+        _async_session_factory = None
+
+def get_pool_stats() -> Dict[str, Any]:
+    """
+    Return connection pool usage for this process's sync and async engines.
+    """
+    return {
+        "pid": os.getpid(),
+        "sync": pool_stats(engine.pool),
+        "async": pool_stats(_async_engine.pool) if _async_engine is not None else None
+    }
+
 def init_db() -> None:
     """
     Initialize the database, creating all tables if they don't exist.
     """
     from core.db.models import Base
-    Base.metadata.create_all(bind=engine) 
\ No newline at end of file
+    Base.metadata.create_all(bind=engine)
+    
+    # create_all skips indexes on tables that already exist
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True) 
\ No newline at end of file
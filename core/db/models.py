@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, JSON, Index, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 import datetime
@@ -26,5 +26,77 @@ class Calculation(Base):
     
     user = relationship("User", back_populates="calculations")
     
+    # Match the history ordering (newest first, id as tie-breaker) so keyset
+    # pagination reads each page straight from the index
+    __table_args__ = (
+        Index("ix_calculations_user_timestamp_id", user_id, timestamp.desc(), id.desc()),
+        Index("ix_calculations_timestamp_id", timestamp.desc(), id.desc()),
+        # Never reuse ids of rows moved to the archive
+        {"sqlite_autoincrement": True},
+    )
+    
+    def __repr__(self):
+        return f"<Calculation(id={self.id}, expression='{self.expression}', result={self.result})>"
+
+class CalculationArchive(Base):
+    """
+    A compressed chunk of archived calculations for one user and day.
+    
+    The rows keep their original ids and timestamps so history cursors stay
+    valid after compaction; min/max_timestamp bound the rows in the chunk.
+    """
+    __tablename__ = "calculation_archives"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(String, ForeignKey("users.id"))
+    min_timestamp = Column(DateTime, nullable=False)
+    max_timestamp = Column(DateTime, nullable=False)
+    row_count = Column(Integer, nullable=False)
+    data = Column(LargeBinary, nullable=False)
+    
+    __table_args__ = (
+        Index("ix_calculation_archives_user_max_timestamp", user_id, max_timestamp.desc()),
+        Index("ix_calculation_archives_max_timestamp", max_timestamp.desc()),
+    )
+    
     def __repr__(self):
-        return f"<Calculation(id={self.id}, expression='{self.expression}', result={self.result})>" 
\ No newline at end of file
+        return f"<CalculationArchive(id={self.id}, user_id={self.user_id}, rows={self.row_count})>"
+
+class UserStats(Base):
+    """
+    Running totals of a user's calculations, maintained on every insert so
+    statistics never need a history scan.
+    """
+    __tablename__ = "user_stats"
+    
+    user_id = Column(String, ForeignKey("users.id"), primary_key=True)
+    calculation_count = Column(Integer, nullable=False, default=0)
+    error_count = Column(Integer, nullable=False, default=0)
+    result_sum = Column(Float, nullable=False, default=0.0)
+    result_min = Column(Float, nullable=True)
+    result_max = Column(Float, nullable=True)
+    first_at = Column(DateTime, nullable=True)
+    last_at = Column(DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f"<UserStats(user_id={self.user_id}, calculations={self.calculation_count})>"
+
+class UserOperatorCount(Base):
+    """
+    How many times a user's calculations applied each operator.
+    """
+    __tablename__ = "user_operator_counts"
+    
+    user_id = Column(String, ForeignKey("users.id"), primary_key=True)
+    operator = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+class UserActivity(Base):
+    """
+    Number of calculations a user made in each hourly bucket.
+    """
+    __tablename__ = "user_activity"
+    
+    user_id = Column(String, ForeignKey("users.id"), primary_key=True)
+    bucket = Column(DateTime, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
\ No newline at end of file
@@ -0,0 +1,149 @@
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool, StaticPool
+from typing import Any, Dict, Optional
+import time
+import uuid
+
+
+class _CheckoutTimingMixin:
+    """
+    Records how long callers wait to check a connection out of the pool,
+    including time spent opening a new connection.
+    """
+
+    checkout_count = 0
+    checkout_wait_total = 0.0
+    checkout_wait_max = 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - started
+            self.checkout_count += 1
+            self.checkout_wait_total += waited
+            if waited > self.checkout_wait_max:
+                self.checkout_wait_max = waited
+
+
+class TimedQueuePool(_CheckoutTimingMixin, QueuePool):
+    """QueuePool that records checkout wait times."""
+
+    # Log under the sqlalchemy logger (WARN by default) like the built-in
+    # pools, not under this module's name
+    _sqla_logger_namespace = "sqlalchemy.pool.impl.TimedQueuePool"
+
+
+class TimedAsyncQueuePool(_CheckoutTimingMixin, AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool that records checkout wait times."""
+
+    _sqla_logger_namespace = "sqlalchemy.pool.impl.TimedAsyncQueuePool"
+
+
+def is_sqlite_memory(url: str) -> bool:
+    """
+    Whether a database URL names an in-memory SQLite database.
+    """
+    parsed = make_url(url)
+    return parsed.get_backend_name() == "sqlite" and (
+        parsed.database in (None, "", ":memory:") or parsed.query.get("mode") == "memory"
+    )
+
+
+def shared_memory_url(url: str) -> str:
+    """
+    Give an unnamed in-memory SQLite URL a unique shared-cache name, so the
+    sync and async engines (whose drivers each open their own connection)
+    see the same database. Other URLs are returned unchanged.
+
+    The database lives as long as either engine keeps its connection open.
+    """
+    parsed = make_url(url)
+    if parsed.get_backend_name() != "sqlite" or parsed.database not in (None, "", ":memory:"):
+        return url
+    return parsed.set(
+        database=f"file:rpn-{uuid.uuid4().hex}",
+        query=dict(parsed.query, mode="memory", cache="shared", uri="true")
+    ).render_as_string(hide_password=False)
+
+
+def engine_options(
+    url: str,
+    pool_size: int = 5,
+    max_overflow: int = 10,
+    pool_timeout: float = 30,
+    pool_pre_ping: bool = False,
+    pool_recycle: int = -1,
+    statement_timeout_ms: Optional[int] = None,
+    is_async: bool = False
+) -> Dict[str, Any]:
+    """
+    Build create_engine keyword arguments for the given database URL.
+
+    In-memory SQLite shares a single connection (StaticPool) so every session
+    sees the same database; file SQLite and PostgreSQL use a sized queue pool.
+
+    Args:
+        url: Database URL
+        pool_size: Connections kept open in the pool
+        max_overflow: Extra connections allowed beyond pool_size under load
+        pool_timeout: Seconds to wait for a connection before failing
+        pool_pre_ping: Test connections for liveness on checkout
+        pool_recycle: Replace connections older than this many seconds (-1 never)
+        statement_timeout_ms: Server-side statement timeout (PostgreSQL only)
+        is_async: Build options for create_async_engine
+
+    Returns:
+        Keyword arguments for create_engine / create_async_engine
+    """
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+
+    if backend == "sqlite":
+        connect_args = {"check_same_thread": False}
+        if is_sqlite_memory(url):
+            return {"poolclass": StaticPool, "connect_args": connect_args}
+    else:
+        connect_args = {}
+        if statement_timeout_ms:
+            if is_async:
+                connect_args["server_settings"] = {"statement_timeout": str(statement_timeout_ms)}
+            else:
+                connect_args["options"] = f"-c statement_timeout={statement_timeout_ms}"
+
+    return {
+        "poolclass": TimedAsyncQueuePool if is_async else TimedQueuePool,
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": pool_timeout,
+        "pool_pre_ping": pool_pre_ping,
+        "pool_recycle": pool_recycle,
+        "connect_args": connect_args
+    }
+
+
+def pool_stats(pool) -> Dict[str, Any]:
+    """
+    Return a snapshot of a connection pool's usage.
+    """
+    stats: Dict[str, Any] = {"pool_class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update({
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+            "max_overflow": pool._max_overflow,
+            "timeout": pool.timeout()
+        })
+    if isinstance(pool, _CheckoutTimingMixin):
+        stats.update({
+            "checkouts": pool.checkout_count,
+            "checkout_wait_total_seconds": pool.checkout_wait_total,
+            "checkout_wait_max_seconds": pool.checkout_wait_max,
+            "checkout_wait_avg_seconds": (
+                pool.checkout_wait_total / pool.checkout_count if pool.checkout_count else 0.0
+            )
+        })
+    return stats
@@ -0,0 +1,109 @@
+from sqlalchemy import select, tuple_
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+from typing import Any, List, Optional, Sequence, Tuple
+import base64
+import binascii
+import datetime
+
+from core.db.models import Calculation
+
+
+def dialect_insert(db: Session):
+    """
+    Return the dialect-specific insert construct supporting ON CONFLICT,
+    or None if the database does not support it. Works with both Session
+    and AsyncSession.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        return pg_insert
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        return sqlite_insert
+    return None
+
+
+def encode_cursor(timestamp: datetime.datetime, calculation_id: int) -> str:
+    """
+    Encode the position after a history row as an opaque cursor.
+    """
+    raw = f"{timestamp.isoformat()}|{calculation_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime.datetime, int]:
+    """
+    Decode a cursor produced by encode_cursor.
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, calculation_id = base64.urlsafe_b64decode(padded).decode().split("|")
+        return datetime.datetime.fromisoformat(timestamp), int(calculation_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("Invalid cursor")
+
+
+def history_columns(include_operations: bool = False) -> List[Any]:
+    """
+    Return the columns read for a history page. The operations log is the
+    bulkiest column, so it is only selected when requested.
+    """
+    columns = [
+        Calculation.id,
+        Calculation.user_id,
+        Calculation.expression,
+        Calculation.result,
+        Calculation.timestamp
+    ]
+    if include_operations:
+        columns.append(Calculation.operations)
+    return columns
+
+
+def history_statement(
+    user_id: Optional[str] = None,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    columns: Optional[Sequence[Any]] = None
+) -> Select:
+    """
+    Build a keyset-paginated history query, newest first.
+
+    One extra row beyond limit is selected so callers can tell whether
+    another page exists; pass the rows to split_page.
+
+    Args:
+        user_id: Only include this user's calculations
+        limit: Page size
+        cursor: Cursor returned with the previous page
+        columns: Columns to select instead of full Calculation entities
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    statement = select(*columns) if columns else select(Calculation)
+    if user_id is not None:
+        statement = statement.where(Calculation.user_id == user_id)
+    if cursor is not None:
+        timestamp, calculation_id = decode_cursor(cursor)
+        statement = statement.where(
+            tuple_(Calculation.timestamp, Calculation.id) < tuple_(timestamp, calculation_id)
+        )
+    return statement.order_by(Calculation.timestamp.desc(), Calculation.id.desc()).limit(limit + 1)
+
+
+def split_page(rows: List[Any], limit: int) -> Tuple[List[Any], Optional[str]]:
+    """
+    Trim the extra row fetched by history_statement and return the page
+    with the cursor for the next page (None on the last page).
+    """
+    if len(rows) <= limit:
+        return rows, None
+    page = rows[:limit]
+    last = page[-1]
+    return page, encode_cursor(last.timestamp, last.id)
@@ -0,0 +1,264 @@
+"""
+Incrementally maintained per-user statistics.
+
+Every insert into calculations also folds the new rows into three aggregate
+tables: running totals (user_stats), operator frequencies
+(user_operator_counts) and hourly activity (user_activity). Each is updated
+with INSERT ... ON CONFLICT DO UPDATE increments in the same transaction as
+the insert, so reading a user's statistics costs a few primary-key lookups
+regardless of how much history they have.
+"""
+
+from sqlalchemy import case, delete, select
+from sqlalchemy.orm import Session
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import datetime
+
+from core.db.archive import decompress_rows
+from core.db.models import Calculation, CalculationArchive, UserActivity, UserOperatorCount, UserStats
+from core.db.queries import dialect_insert
+from core.rpn.calculator import RPNCalculator
+
+OPERATORS = frozenset(RPNCalculator().arity)
+
+# Rows read per batch when rebuilding statistics from history
+REBUILD_BATCH_SIZE = 5000
+
+
+def activity_bucket(timestamp: datetime.datetime) -> datetime.datetime:
+    """
+    Truncate a timestamp to the start of its hourly activity bucket.
+    """
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def _aggregate(
+    rows: Sequence[Dict[str, Any]],
+    errors: Optional[Dict[str, int]]
+) -> Tuple[Dict[str, Dict[str, Any]], Dict[Tuple[str, str], int], Dict[Tuple[str, datetime.datetime], int]]:
+    totals: Dict[str, Dict[str, Any]] = {}
+    operators: Dict[Tuple[str, str], int] = {}
+    activity: Dict[Tuple[str, datetime.datetime], int] = {}
+
+    def user_totals(user_id: str) -> Dict[str, Any]:
+        if user_id not in totals:
+            totals[user_id] = {
+                "user_id": user_id,
+                "calculation_count": 0,
+                "error_count": 0,
+                "result_sum": 0.0,
+                "result_min": None,
+                "result_max": None,
+                "first_at": None,
+                "last_at": None
+            }
+        return totals[user_id]
+
+    for row in rows:
+        user_id = row["user_id"]
+        result = float(row["result"])
+        timestamp = row["timestamp"] or datetime.datetime.utcnow()
+
+        total = user_totals(user_id)
+        total["calculation_count"] += 1
+        total["result_sum"] += result
+        if total["result_min"] is None or result < total["result_min"]:
+            total["result_min"] = result
+        if total["result_max"] is None or result > total["result_max"]:
+            total["result_max"] = result
+        if total["first_at"] is None or timestamp < total["first_at"]:
+            total["first_at"] = timestamp
+        if total["last_at"] is None or timestamp > total["last_at"]:
+            total["last_at"] = timestamp
+
+        for token in row["expression"].split():
+            if token in OPERATORS:
+                operators[(user_id, token)] = operators.get((user_id, token), 0) + 1
+
+        bucket = (user_id, activity_bucket(timestamp))
+        activity[bucket] = activity.get(bucket, 0) + 1
+
+    for user_id, count in (errors or {}).items():
+        if count:
+            user_totals(user_id)["error_count"] += count
+
+    return totals, operators, activity
+
+
+def _keep(current, candidate, better):
+    # Keep the current value unless the candidate is set and better
+    return case(
+        (current.is_(None), candidate),
+        (better, candidate),
+        else_=current
+    )
+
+
+def _stats_statements(db, rows: Sequence[Dict[str, Any]], errors: Optional[Dict[str, int]]) -> List[Any]:
+    totals, operators, activity = _aggregate(rows, errors)
+    insert_construct = dialect_insert(db)
+    statements = []
+
+    if totals:
+        stats = UserStats.__table__
+        statement = insert_construct(stats)
+        excluded = statement.excluded
+        statements.append((
+            statement.on_conflict_do_update(
+                index_elements=[stats.c.user_id],
+                set_={
+                    "calculation_count": stats.c.calculation_count + excluded.calculation_count,
+                    "error_count": stats.c.error_count + excluded.error_count,
+                    "result_sum": stats.c.result_sum + excluded.result_sum,
+                    "result_min": _keep(stats.c.result_min, excluded.result_min, excluded.result_min < stats.c.result_min),
+                    "result_max": _keep(stats.c.result_max, excluded.result_max, excluded.result_max > stats.c.result_max),
+                    "first_at": _keep(stats.c.first_at, excluded.first_at, excluded.first_at < stats.c.first_at),
+                    "last_at": _keep(stats.c.last_at, excluded.last_at, excluded.last_at > stats.c.last_at)
+                }
+            ),
+            list(totals.values())
+        ))
+
+    for model, key, counts in (
+        (UserOperatorCount, "operator", operators),
+        (UserActivity, "bucket", activity)
+    ):
+        if not counts:
+            continue
+        table = model.__table__
+        statement = insert_construct(table)
+        statements.append((
+            statement.on_conflict_do_update(
+                index_elements=[table.c.user_id, table.c[key]],
+                set_={"count": table.c["count"] + statement.excluded["count"]}
+            ),
+            [{"user_id": user_id, key: value, "count": count} for (user_id, value), count in counts.items()]
+        ))
+
+    return statements
+
+
+def update_user_stats(db: Session, rows: Sequence[Dict[str, Any]], errors: Optional[Dict[str, int]] = None) -> None:
+    """
+    Fold newly inserted calculations into the per-user aggregates, without
+    committing.
+
+    Args:
+        db: The database session
+        rows: Inserted rows with user_id, expression, result and timestamp
+        errors: Number of failed calculations per user to record
+
+    Databases without ON CONFLICT support keep no aggregates.
+    """
+    if dialect_insert(db) is None:
+        return
+    for statement, parameters in _stats_statements(db, rows, errors):
+        db.execute(statement, parameters)
+
+
+async def update_user_stats_async(db, rows: Sequence[Dict[str, Any]], errors: Optional[Dict[str, int]] = None) -> None:
+    """
+    Async variant of update_user_stats for an AsyncSession.
+    """
+    if dialect_insert(db) is None:
+        return
+    for statement, parameters in _stats_statements(db, rows, errors):
+        await db.execute(statement, parameters)
+
+
+def _stats_queries(user_id: str, since: Optional[datetime.datetime]):
+    activity = select(UserActivity.bucket, UserActivity.count).where(UserActivity.user_id == user_id)
+    if since is not None:
+        activity = activity.where(UserActivity.bucket >= activity_bucket(since))
+    return (
+        select(UserStats).where(UserStats.user_id == user_id),
+        select(UserOperatorCount.operator, UserOperatorCount.count)
+        .where(UserOperatorCount.user_id == user_id)
+        .order_by(UserOperatorCount.count.desc(), UserOperatorCount.operator),
+        activity.order_by(UserActivity.bucket)
+    )
+
+
+def _format_stats(user_id: str, stats: Optional[UserStats], operators, activity) -> Dict[str, Any]:
+    calculations = stats.calculation_count if stats else 0
+    errors = stats.error_count if stats else 0
+    attempts = calculations + errors
+    return {
+        "user_id": user_id,
+        "calculations": calculations,
+        "errors": errors,
+        "error_rate": errors / attempts if attempts else 0.0,
+        "result": {
+            "min": stats.result_min if stats else None,
+            "max": stats.result_max if stats else None,
+            "mean": stats.result_sum / calculations if calculations else None
+        },
+        "first_at": stats.first_at if stats else None,
+        "last_at": stats.last_at if stats else None,
+        "operators": {operator: count for operator, count in operators},
+        "activity": [{"bucket": bucket, "count": count} for bucket, count in activity]
+    }
+
+
+def get_user_stats(db: Session, user_id: str, since: Optional[datetime.datetime] = None) -> Dict[str, Any]:
+    """
+    Read a user's aggregated statistics.
+
+    Args:
+        db: The database session
+        user_id: The user to summarize
+        since: Only include activity buckets from this time onwards
+
+    Returns:
+        Counts, error rate, result min/max/mean, first and last calculation
+        times, operator frequencies and hourly activity
+    """
+    stats_query, operators_query, activity_query = _stats_queries(user_id, since)
+    return _format_stats(
+        user_id,
+        db.scalars(stats_query).first(),
+        db.execute(operators_query).all(),
+        db.execute(activity_query).all()
+    )
+
+
+async def get_user_stats_async(db, user_id: str, since: Optional[datetime.datetime] = None) -> Dict[str, Any]:
+    """
+    Async variant of get_user_stats for an AsyncSession.
+    """
+    stats_query, operators_query, activity_query = _stats_queries(user_id, since)
+    return _format_stats(
+        user_id,
+        (await db.scalars(stats_query)).first(),
+        (await db.execute(operators_query)).all(),
+        (await db.execute(activity_query)).all()
+    )
+
+
+def rebuild_user_stats(db: Session) -> None:
+    """
+    Recompute every aggregate from hot and archived history and commit.
+
+    Use this to backfill statistics for calculations stored before the
+    aggregates existed. Error counts are not part of history, so they are
+    preserved as they are.
+    """
+    errors = dict(db.execute(select(UserStats.user_id, UserStats.error_count)).all())
+    db.execute(delete(UserStats))
+    db.execute(delete(UserOperatorCount))
+    db.execute(delete(UserActivity))
+    update_user_stats(db, [], errors)
+
+    columns = [Calculation.user_id, Calculation.expression, Calculation.result, Calculation.timestamp]
+    batch = []
+    for row in db.execute(select(*columns).execution_options(yield_per=REBUILD_BATCH_SIZE)):
+        batch.append(row._asdict())
+        if len(batch) >= REBUILD_BATCH_SIZE:
+            update_user_stats(db, batch)
+            batch = []
+    update_user_stats(db, batch)
+
+    for chunk in db.scalars(select(CalculationArchive).execution_options(yield_per=8)):
+        update_user_stats(db, decompress_rows(chunk.data))
+
+    db.commit()
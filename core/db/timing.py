@@ -0,0 +1,48 @@
+"""
+Database timing metrics: per-statement query time from SQLAlchemy cursor
+events and the time spent persisting calculations.
+"""
+
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from core.metrics import record, registry
+
+QUERY_SECONDS = registry.histogram("db_query_seconds", "Time spent executing database statements", ["statement"])
+PERSIST_SECONDS = registry.histogram("db_persist_seconds", "Time spent saving calculations and their statistics")
+
+STATEMENT_KINDS = frozenset(["SELECT", "INSERT", "UPDATE", "DELETE", "COPY"])
+
+_installed = False
+
+
+def _statement_kind(statement: str) -> str:
+    words = statement.split(None, 1)
+    kind = words[0].upper() if words else ""
+    return kind if kind in STATEMENT_KINDS else "OTHER"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if registry.enabled and context is not None:
+        context._query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_query_started", None)
+    if started is not None:
+        record(QUERY_SECONDS, time.perf_counter() - started, "db", _statement_kind(statement))
+
+
+def instrument_queries() -> None:
+    """
+    Time every statement executed by any engine, including the engines
+    behind async sessions. Safe to call more than once.
+    """
+    global _installed
+    if _installed:
+        return
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    _installed = True
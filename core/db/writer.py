@@ -0,0 +1,303 @@
+import asyncio
+import datetime
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from core.db.bulk import ensure_user, insert_calculations
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindWriter:
+    """
+    Buffers calculation rows in a bounded in-process queue and writes them to
+    the database in batches from a background task.
+
+    A batch is flushed when it reaches batch_size rows or when flush_interval
+    seconds have passed since its first row, whichever comes first. When the
+    queue is full, enqueue waits for room, applying backpressure to callers.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        max_queue_size: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 0.5
+    ):
+        self.session_factory = session_factory
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.enqueued = 0
+        self.written = 0
+        self.failed = 0
+        self.flushes = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.total_flush_seconds = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        """
+        Start the background flush task on the running event loop.
+        """
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Flush every queued row and stop the background task.
+        """
+        if not self.running:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def enqueue(self, user_id: str, row: Dict[str, Any]) -> None:
+        """
+        Queue a calculation row for writing, waiting while the queue is full.
+
+        Args:
+            user_id: Owner of the calculation
+            row: Dictionary with expression, result and optionally operations
+                 and timestamp, which defaults to the time it is queued
+                 rather than the time it is written
+
+        Raises:
+            RuntimeError: If the writer has not been started
+        """
+        if not self.running:
+            raise RuntimeError("Write-behind writer is not running")
+        if row.get("timestamp") is None:
+            row = dict(row, timestamp=datetime.datetime.utcnow())
+        await self._queue.put((user_id, row))
+        self.enqueued += 1
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            await self._flush(batch)
+
+        # Drain anything queued after the stop marker
+        remaining = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not None:
+                remaining.append(item)
+        for start in range(0, len(remaining), self.batch_size):
+            await self._flush(remaining[start:start + self.batch_size])
+
+    async def _flush(self, batch: List[Tuple[str, Dict[str, Any]]]) -> None:
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            # The session is synchronous, so keep it off the event loop
+            await loop.run_in_executor(None, self._write, batch)
+            self.written += len(batch)
+        except Exception:
+            self.failed += len(batch)
+            logger.exception("Failed to write %d queued calculations", len(batch))
+        finally:
+            elapsed = time.perf_counter() - started
+            self.flushes += 1
+            self.last_flush_seconds = elapsed
+            self.total_flush_seconds += elapsed
+            self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+
+    def _write(self, batch: List[Tuple[str, Dict[str, Any]]]) -> None:
+        db = self.session_factory()
+        try:
+            for user_id in {user_id for user_id, _ in batch}:
+                ensure_user(db, user_id)
+            insert_calculations(db, [dict(row, user_id=user_id) for user_id, row in batch])
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return a snapshot of the queue and flush metrics.
+        """
+        return {
+            "running": self.running,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue_size": self.max_queue_size,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "failed": self.failed,
+            "flushes": self.flushes,
+            "last_flush_seconds": self.last_flush_seconds,
+            "max_flush_seconds": self.max_flush_seconds,
+            "avg_flush_seconds": self.total_flush_seconds / self.flushes if self.flushes else 0.0
+        }
+
+
+class ErrorCounter:
+    """
+    Counts failed calculations per user in memory and adds them to the users'
+    statistics from a background task, so a failed request costs no database
+    transaction of its own.
+
+    Counts are written every flush_interval seconds, or sooner once
+    max_users users have pending counts. Until the counter is started, at
+    most max_users users are counted and further ones are dropped.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        flush_interval: float = 1.0,
+        max_users: int = 10000
+    ):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval
+        self.max_users = max_users
+
+        self._counts: Dict[str, int] = {}
+        self._wake: Optional[asyncio.Event] = None
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.recorded = 0
+        self.written = 0
+        self.failed = 0
+        self.dropped = 0
+        self.flushes = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        """
+        Start the background flush task on the running event loop.
+        """
+        if self.running:
+            return
+        self._wake = asyncio.Event()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Write the pending counts and stop the background task.
+        """
+        if not self.running:
+            return
+        self._stopping = True
+        self._wake.set()
+        await self._task
+        self._task = None
+
+    def add(self, user_id: str, count: int = 1) -> None:
+        """
+        Count failed calculations of a user.
+        """
+        if user_id not in self._counts and len(self._counts) >= self.max_users:
+            if not self.running:
+                self.dropped += count
+                return
+            self._wake.set()
+        self._counts[user_id] = self._counts.get(user_id, 0) + count
+        self.recorded += count
+
+    def pending(self) -> int:
+        """
+        Return the number of failed calculations not written yet.
+        """
+        return sum(self._counts.values())
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self._flush()
+
+        # Write what was counted after the last flush
+        await self._flush()
+
+    async def _flush(self) -> None:
+        if not self._counts:
+            return
+        counts, self._counts = self._counts, {}
+        loop = asyncio.get_running_loop()
+        try:
+            # The session is synchronous, so keep it off the event loop
+            await loop.run_in_executor(None, self._write, counts)
+            self.written += sum(counts.values())
+        except Exception:
+            self.failed += sum(counts.values())
+            logger.exception("Failed to write error counts for %d users", len(counts))
+        finally:
+            self.flushes += 1
+
+    def _write(self, counts: Dict[str, int]) -> None:
+        db = self.session_factory()
+        try:
+            for user_id in counts:
+                ensure_user(db, user_id)
+            insert_calculations(db, [], counts)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return a snapshot of the pending counts and flush metrics.
+        """
+        return {
+            "running": self.running,
+            "pending": self.pending(),
+            "pending_users": len(self._counts),
+            "recorded": self.recorded,
+            "written": self.written,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "flushes": self.flushes
+        }
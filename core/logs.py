@@ -0,0 +1,211 @@
+"""
+Logging that stays cheap under bursts of bad input.
+
+Calculation errors are logged through a SampledErrorLog, which counts every
+error by kind but only logs the first few of each kind per interval, noting
+how many were suppressed when it logs again. configure_logging moves the
+actual writing of records onto a background thread, so the request path only
+pays for putting a record on a bounded queue (records are dropped and counted
+when it is full, rather than blocking).
+"""
+
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, List, Optional
+import datetime
+import json
+import logging
+import queue
+import threading
+import time
+
+# Error kinds tracked separately; further kinds are counted as "other"
+MAX_ERROR_KINDS = 64
+
+# Longest expression text included in a log record
+MAX_LOGGED_EXPRESSION = 200
+
+# Attributes every LogRecord has, so JsonFormatter can tell extra fields apart
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+def error_kind(error: BaseException) -> str:
+    """
+    A low-cardinality label for an error: its kind when it has one (as
+    ExpressionError does), otherwise its message up to the first colon,
+    which leaves out the token or value that caused it.
+    """
+    kind = getattr(error, "kind", None)
+    if isinstance(kind, str):
+        return kind[:80]
+    message = str(error)
+    kind = message.split(":", 1)[0] if message else type(error).__name__
+    return kind[:80]
+
+
+class SampledErrorLog:
+    """
+    Counts errors by kind and logs at most burst of each kind per interval.
+
+    Attributes:
+        burst: Errors of one kind logged per interval (0 logs none)
+        interval: Length of the sampling window in seconds
+        suppressed: Errors counted but not logged
+    """
+
+    def __init__(self, logger: logging.Logger, burst: int = 10, interval: float = 60.0):
+        self.logger = logger
+        self.burst = burst
+        self.interval = interval
+        self.suppressed = 0
+        self._counts: Dict[str, int] = {}
+        # Per kind: [window start, logged in window, suppressed since last logged]
+        self._windows: Dict[str, List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, expression: str, error: BaseException) -> None:
+        """
+        Count a failed calculation and log it unless its kind is over budget.
+        """
+        kind = error_kind(error)
+        with self._lock:
+            if kind not in self._counts and len(self._counts) >= MAX_ERROR_KINDS:
+                kind = "other"
+            self._counts[kind] = self._counts.get(kind, 0) + 1
+
+            if not self.logger.isEnabledFor(logging.ERROR):
+                return
+            now = time.monotonic()
+            window = self._windows.get(kind)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window is not None else 0
+                window = self._windows[kind] = [now, 0, suppressed]
+            if window[1] >= self.burst:
+                window[2] += 1
+                self.suppressed += 1
+                return
+            window[1] += 1
+            suppressed, window[2] = window[2], 0
+
+        if len(expression) > MAX_LOGGED_EXPRESSION:
+            expression = expression[:MAX_LOGGED_EXPRESSION] + "..."
+        self.logger.error(
+            "Error calculating expression %r: %s%s", expression, error,
+            f" ({suppressed} similar errors suppressed)" if suppressed else "",
+            extra={"error_kind": kind, "expression": expression, "suppressed": suppressed}
+        )
+
+    def counts(self) -> Dict[str, int]:
+        """
+        Return the number of errors recorded by kind.
+        """
+        with self._lock:
+            return dict(self._counts)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    A QueueHandler for a bounded queue that drops records when the queue is
+    full instead of blocking or reporting a handler error.
+
+    Attributes:
+        dropped: Records dropped because the queue was full
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats records as one JSON object per line, including the fields passed
+    with extra.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+_handler: Optional[DroppingQueueHandler] = None
+_listener: Optional[QueueListener] = None
+_handlers: List[logging.Handler] = []
+
+
+def configure_logging(level: str = "INFO", json_format: bool = False, queue_size: int = 10000) -> QueueListener:
+    """
+    Route the root logger through a bounded queue to a background thread.
+
+    The root logger's existing handlers (or a stderr handler when it has
+    none) are moved behind the queue until shutdown_logging. Calling this
+    again only updates the level.
+
+    Args:
+        level: Root logger level name, e.g. "INFO"
+        json_format: Write records as JSON lines instead of text
+        queue_size: Records held before new ones are dropped
+
+    Returns:
+        The started listener
+    """
+    global _handler, _listener, _handlers
+    root = logging.getLogger()
+    root.setLevel(level.upper())
+    if _listener is not None:
+        return _listener
+
+    handlers = list(root.handlers)
+    if not handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(JsonFormatter() if json_format else logging.Formatter(TEXT_FORMAT))
+        handlers = [handler]
+    for handler in handlers:
+        root.removeHandler(handler)
+    _handlers = handlers
+
+    _handler = DroppingQueueHandler(queue.Queue(queue_size))
+    root.addHandler(_handler)
+    _listener = QueueListener(_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def shutdown_logging() -> None:
+    """
+    Write the queued records, stop the listener thread and attach the
+    handlers to the root logger directly again.
+    """
+    global _handler, _listener, _handlers
+    if _listener is None:
+        return
+    root = logging.getLogger()
+    root.removeHandler(_handler)
+    _listener.stop()
+    for handler in _handlers:
+        root.addHandler(handler)
+    _handler, _listener, _handlers = None, None, []
+
+
+def dropped_records() -> int:
+    """
+    Return the number of records dropped because the log queue was full.
+    """
+    return _handler.dropped if _handler is not None else 0
@@ -0,0 +1,253 @@
+"""
+Low-overhead metrics exported in the Prometheus text format.
+
+Instrumented code checks registry.enabled before reading a clock, so when
+metrics are disabled the hot paths pay for one attribute lookup. Values that
+other components already track (cache and pool statistics) are read by
+collectors when the metrics are rendered instead of being counted twice.
+
+Durations are also added to the current request's stage timings, if the
+caller started them with start_timings (e.g. for Server-Timing headers).
+"""
+
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import threading
+import time
+
+# Upper bounds in seconds, from sub-millisecond evaluations to slow uploads
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+
+# (name, type, help, labels, value) as produced by collectors
+Sample = Tuple[str, str, str, Dict[str, str], float]
+
+_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("stage_timings", default=None)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Counter:
+    """
+    A monotonically increasing count, optionally split by label values.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *label_values: str) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def update(self, amounts: Dict[str, float]) -> None:
+        """
+        Add several amounts at once, keyed by the value of the only label.
+        """
+        with self._lock:
+            values = self._values
+            for label_value, amount in amounts.items():
+                key = (label_value,)
+                values[key] = values.get(key, 0) + amount
+
+    def value(self, *label_values: str) -> float:
+        return self._values.get(label_values, 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in values]
+
+
+class Histogram:
+    """
+    A distribution of observed values in cumulative buckets, optionally
+    split by label values.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label values: [count per bucket (last is +Inf), sum]
+        self._values: Dict[Tuple[str, ...], List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(label_values)
+            if state is None:
+                state = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def count(self, *label_values: str) -> int:
+        state = self._values.get(label_values)
+        return sum(state[0]) if state is not None else 0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+
+        lines = []
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = _format_labels(self.labels, key, f'le="{_format_value(float(bound))}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Holds metrics and collectors and renders them for a scrape.
+
+    Attributes:
+        enabled: Whether instrumented code records anything
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._metrics: Dict[str, Any] = {}
+        self._collectors: List[Callable[[], Iterable[Sample]]] = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        """
+        Return the counter with this name, creating it on first use.
+        """
+        return self._register(Counter(name, help, labels))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        """
+        Return the histogram with this name, creating it on first use.
+        """
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def register_collector(self, collector: Callable[[], Iterable[Sample]]) -> None:
+        """
+        Add a callable run on every render that returns samples read from
+        elsewhere, as (name, type, help, labels, value) tuples.
+        """
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        """
+        Render every metric in the Prometheus text exposition format.
+        """
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+
+        grouped: Dict[str, Tuple[str, str, List[str]]] = {}
+        for collector in list(self._collectors):
+            for name, kind, help, labels, value in collector():
+                if value is None:
+                    continue
+                _, _, samples = grouped.setdefault(name, (kind, help, []))
+                samples.append(f"{name}{_format_labels(list(labels), list(labels.values()))} {_format_value(float(value))}")
+        for name, (kind, help, samples) in grouped.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+
+        return "\n".join(lines) + "\n"
+
+
+# Shared by the calculator, the database layer and the API
+registry = MetricsRegistry()
+
+PARSE_SECONDS = registry.histogram("rpn_parse_seconds", "Time spent tokenizing and compiling expressions")
+EVALUATE_SECONDS = registry.histogram("rpn_evaluate_seconds", "Time spent evaluating compiled expressions")
+CALCULATIONS = registry.counter("rpn_calculations_total", "Expressions calculated", ["outcome"])
+OPERATORS = registry.counter("rpn_operators_total", "Operators evaluated", ["operator"])
+
+
+def record(histogram: Histogram, seconds: float, stage: Optional[str] = None, *label_values: str) -> None:
+    """
+    Observe a duration and add it to the current request's stage timings.
+    """
+    histogram.observe(seconds, *label_values)
+    if stage is not None:
+        timings = _timings.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timed(histogram: Histogram, stage: Optional[str] = None, *label_values: str) -> Iterator[None]:
+    """
+    Time the enclosed block when metrics are enabled.
+    """
+    if not registry.enabled:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(histogram, time.perf_counter() - started, stage, *label_values)
+
+
+def start_timings() -> Dict[str, float]:
+    """
+    Start collecting stage timings for the current context (a request) and
+    return the dictionary they are added to, in seconds per stage.
+    """
+    timings: Dict[str, float] = {}
+    _timings.set(timings)
+    return timings
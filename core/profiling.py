@@ -0,0 +1,331 @@
+"""
+On-demand profiling of calculations.
+
+A Profiler runs cProfile and, optionally, tracemalloc around a block of code
+and reports the functions that took the most time and the lines whose
+allocations were still held when it stopped, along with the peak traced
+memory. Reports are plain dictionaries, so the API can return them as JSON
+and the command line can print them.
+
+Profiling slows the profiled code down considerably (tracemalloc alone can
+make allocation-heavy code several times slower), so it only ever runs when
+explicitly asked for.
+
+Usage:
+    python -m core.profiling corpus.jsonl [--top 25] [--sort tottime] [--no-memory] [--json]
+
+The corpus is one expression per line, a CSV file whose first column holds
+expressions, or JSON lines holding either a string or an object with an
+"expression" (and optional "variables"); other lines are skipped.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+import argparse
+import cProfile
+import csv
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+
+# pstats columns a report can be ordered by
+SORT_KEYS = {"cumulative": 3, "tottime": 2, "calls": 1}
+SORT_LABELS = {"cumulative": "cumulative time", "tottime": "own time", "calls": "calls"}
+
+# Only one profiler may run per process: cProfile replaces whichever profiler
+# is installed and tracemalloc is process-wide
+_active = threading.Lock()
+
+
+class ProfilerBusy(RuntimeError):
+    """
+    Raised when a profiler is started while another one is running.
+    """
+
+
+def profiler_running() -> bool:
+    """
+    Whether a profiler is running in this process.
+    """
+    return _active.locked()
+
+
+def _short_path(path: str) -> str:
+    # Report files relative to the import root they were loaded from
+    best = path
+    for root in sys.path:
+        if root and path.startswith(root + os.sep) and len(path) - len(root) - 1 < len(best):
+            best = path[len(root) + 1:]
+    return best
+
+
+class Profiler:
+    """
+    Profiles the code run on the current thread between start and stop, or
+    inside a with block.
+
+    Attributes:
+        top: Number of functions and allocation sites reported
+        memory: Whether allocations are traced with tracemalloc
+        sort: Order of the reported functions: "cumulative" (time including
+              callees), "tottime" (time in the function itself) or "calls"
+        wall_seconds: Time between start and stop
+    """
+
+    def __init__(self, top: int = 25, memory: bool = True, sort: str = "cumulative"):
+        if sort not in SORT_KEYS:
+            raise ValueError(f"Unknown sort order: {sort}")
+        self.top = top
+        self.memory = memory
+        self.sort = sort
+        self.wall_seconds: Optional[float] = None
+        self._profile: Optional[cProfile.Profile] = None
+        self._snapshot: Optional[tracemalloc.Snapshot] = None
+        self._peak: Optional[int] = None
+        self._started: Optional[float] = None
+        self._owns_tracing = False
+
+    def __enter__(self) -> "Profiler":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        """
+        Start profiling.
+
+        Raises:
+            ProfilerBusy: If another profiler is running in this process
+        """
+        if not _active.acquire(blocking=False):
+            raise ProfilerBusy("Another profile is already running")
+
+        if self.memory:
+            # Leave tracing alone if it was already on (e.g. python -X tracemalloc)
+            self._owns_tracing = not tracemalloc.is_tracing()
+            if self._owns_tracing:
+                tracemalloc.start()
+            elif hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+
+        self._profile = cProfile.Profile()
+        self._started = time.perf_counter()
+        self._profile.enable()
+
+    def stop(self) -> None:
+        """
+        Stop profiling and keep the measurements for report.
+        """
+        if self._started is None or self.wall_seconds is not None:
+            return
+        self._profile.disable()
+        self.wall_seconds = time.perf_counter() - self._started
+
+        try:
+            if self.memory:
+                self._snapshot = tracemalloc.take_snapshot().filter_traces([
+                    tracemalloc.Filter(False, tracemalloc.__file__),
+                    tracemalloc.Filter(False, __file__)
+                ])
+                _, self._peak = tracemalloc.get_traced_memory()
+                if self._owns_tracing:
+                    tracemalloc.stop()
+        finally:
+            _active.release()
+
+    def functions(self) -> List[Dict[str, Any]]:
+        """
+        The top functions by the profiler's sort order.
+        """
+        if self._profile is None:
+            return []
+        column = SORT_KEYS[self.sort]
+        entries = [
+            (key, value) for key, value in pstats.Stats(self._profile).stats.items()
+            if "_lsprof.Profiler" not in key[2]
+        ]
+        entries.sort(key=lambda entry: entry[1][column], reverse=True)
+
+        functions = []
+        for (filename, line, name), (primitive_calls, calls, total, cumulative, _) in entries[:self.top]:
+            functions.append({
+                "function": name,
+                "file": _short_path(filename),
+                "line": line,
+                "calls": calls,
+                "primitive_calls": primitive_calls,
+                "total_seconds": total,
+                "cumulative_seconds": cumulative
+            })
+        return functions
+
+    def allocations(self) -> List[Dict[str, Any]]:
+        """
+        The lines holding the most traced memory when profiling stopped.
+        """
+        if self._snapshot is None:
+            return []
+        return [
+            {
+                "file": _short_path(stat.traceback[0].filename),
+                "line": stat.traceback[0].lineno,
+                "size_bytes": stat.size,
+                "count": stat.count
+            }
+            for stat in self._snapshot.statistics("lineno")[:self.top]
+        ]
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Return the measurements as a JSON-compatible dictionary.
+        """
+        report = {
+            "wall_seconds": self.wall_seconds,
+            "sort": self.sort,
+            "functions": self.functions()
+        }
+        if self.memory:
+            report["peak_memory_bytes"] = self._peak
+            report["allocations"] = self.allocations()
+        return report
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    """
+    Render a profiler report as text tables.
+    """
+    lines = [f"Wall time: {report['wall_seconds']:.3f}s"]
+    if report.get("peak_memory_bytes") is not None:
+        lines.append(f"Peak traced memory: {report['peak_memory_bytes'] / 1024:.1f} KiB")
+
+    lines.append("")
+    lines.append(f"Top functions by {SORT_LABELS[report['sort']]}")
+    lines.append(f"{'calls':>10}{'tottime':>10}{'cumtime':>10}  function")
+    for entry in report["functions"]:
+        calls = str(entry["calls"])
+        if entry["primitive_calls"] != entry["calls"]:
+            calls = f"{entry['calls']}/{entry['primitive_calls']}"
+        location = f"{entry['file']}:{entry['line']}({entry['function']})" if entry["line"] else entry["function"]
+        lines.append(f"{calls:>10}{entry['total_seconds']:>10.4f}{entry['cumulative_seconds']:>10.4f}  {location}")
+
+    if "allocations" in report:
+        lines.append("")
+        lines.append("Top allocation sites still held")
+        lines.append(f"{'KiB':>10}{'blocks':>10}  line")
+        for entry in report["allocations"]:
+            lines.append(f"{entry['size_bytes'] / 1024:>10.1f}{entry['count']:>10}  {entry['file']}:{entry['line']}")
+    return "\n".join(lines)
+
+
+def read_corpus(path: str) -> Tuple[List[Tuple[str, Optional[Dict[str, Any]]]], int]:
+    """
+    Read the expressions of a corpus file.
+
+    Returns:
+        The (expression, variables) pairs and the number of lines skipped
+    """
+    entries: List[Tuple[str, Optional[Dict[str, Any]]]] = []
+    skipped = 0
+    extension = os.path.splitext(path)[1].lower()
+
+    with open(path, newline="") as f:
+        if extension == ".csv":
+            for row in csv.reader(f):
+                if not row or not row[0].strip() or (not entries and row[0].strip().lower() == "expression"):
+                    continue
+                entries.append((row[0].strip(), None))
+        elif extension in (".jsonl", ".ndjson"):
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    skipped += 1
+                    continue
+                if isinstance(item, str):
+                    entries.append((item, None))
+                elif isinstance(item, dict) and isinstance(item.get("expression"), str):
+                    entries.append((item["expression"], item.get("variables")))
+                else:
+                    skipped += 1
+        else:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    entries.append((line, None))
+    return entries, skipped
+
+
+def profile_corpus(
+    entries: List[Tuple[str, Optional[Dict[str, Any]]]],
+    profiler: Profiler,
+    **options
+) -> Dict[str, Any]:
+    """
+    Profile RPNCalculator.calculate over every entry of a corpus with a
+    fresh calculator, so compiling is part of the profile.
+
+    Args:
+        entries: (expression, variables) pairs, as read by read_corpus
+        profiler: The profiler to run
+        **options: trace, and keyword arguments for RPNCalculator
+
+    Returns:
+        The profiler's report with the number of expressions and errors
+    """
+    from core.rpn import RPNCalculator, TraceLevel
+
+    trace = TraceLevel(options.pop("trace", TraceLevel.NONE))
+    calculator = RPNCalculator(**options)
+    errors = 0
+    with profiler:
+        for expression, variables in entries:
+            try:
+                calculator.calculate(expression, variables, trace=trace)
+            except Exception:
+                errors += 1
+    return dict(profiler.report(), expressions=len(entries), errors=errors)
+
+
+def main():
+    from core.rpn import Limits, TraceLevel
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", help="File of expressions to calculate")
+    parser.add_argument("--top", type=int, default=25, help="Functions and allocation sites to report")
+    parser.add_argument("--sort", choices=list(SORT_KEYS), default="cumulative")
+    parser.add_argument("--no-memory", action="store_true", help="Skip tracing allocations")
+    parser.add_argument("--trace", choices=[level.value for level in TraceLevel], default=TraceLevel.NONE.value)
+    parser.add_argument("--max-result-bits", type=int, default=14000, help="Result size limit (0 disables)")
+    parser.add_argument("--prefix-cache-bytes", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    entries, skipped = read_corpus(args.corpus)
+    if not entries:
+        parser.exit(1, f"No expressions found in {args.corpus}\n")
+
+    report = profile_corpus(
+        entries,
+        Profiler(top=args.top, memory=not args.no_memory, sort=args.sort),
+        trace=args.trace,
+        limits=Limits(max_result_bits=args.max_result_bits or None),
+        prefix_cache_bytes=args.prefix_cache_bytes
+    )
+    report["skipped"] = skipped
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{report['expressions']} expressions, {report['errors']} errors, {skipped} lines skipped")
+    print(format_report(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,11 @@
 """RPN Calculator module for mathematical operations."""
 
 from core.rpn.calculator import RPNCalculator
+from core.rpn.compiler import CompiledProgram, ExpressionError, Limits, TraceLevel, compile_expression, validate_tokens
+from core.rpn.cache import LRUCache
+from core.rpn.prefix_cache import PrefixCache
 
-__all__ = ["RPNCalculator"]
\ No newline at end of file
+__all__ = [
+    "RPNCalculator", "CompiledProgram", "ExpressionError", "Limits", "TraceLevel", "compile_expression",
+    "validate_tokens", "LRUCache", "PrefixCache"
+]
\ No newline at end of file
@@ -0,0 +1,107 @@
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+import threading
+
+
+class LRUCache:
+    """
+    A bounded least-recently-used cache with hit/miss/eviction counters.
+    A maxsize of 0 disables caching entirely.
+
+    When max_bytes is given the cache is also bounded by the total estimated
+    size of its values, as measured by the sizeof callable.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        max_bytes: Optional[int] = None,
+        sizeof: Optional[Callable[[Any], int]] = None
+    ):
+        if maxsize < 0:
+            raise ValueError("Cache size cannot be negative")
+        if max_bytes is not None and sizeof is None:
+            raise ValueError("A sizeof function is required when max_bytes is set")
+
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Return the cached value for key, or None on a miss.
+        """
+        with self._lock:
+            try:
+                value, _ = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """
+        Store value under key, evicting the least recently used entry when full.
+        """
+        if self.maxsize == 0:
+            return
+
+        size = 0
+        if self.max_bytes is not None:
+            size = self.sizeof(value)
+            if size > self.max_bytes:
+                return
+
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.current_bytes -= self._data[key][1]
+            self._data[key] = (value, size)
+            self.current_bytes += size
+            while len(self._data) > self.maxsize or (
+                self.max_bytes is not None and self.current_bytes > self.max_bytes
+            ):
+                _, (_, evicted_size) = self._data.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """
+        Drop every entry and reset the counters.
+        """
+        with self._lock:
+            self._data.clear()
+            self.current_bytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return a snapshot of the cache counters.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0
+        }
@@ -1,13 +1,73 @@
-from typing import List, Union, Dict, Any
+from typing import List, Union, Dict, Any, Optional
 import operator
 from enum import Enum
 import logging
 import math
+import sys
+import time
+
+from core import metrics
+from core.logs import SampledErrorLog
+from core.rpn.cache import LRUCache
+from core.rpn.compiler import CompiledProgram, Limits, TraceLevel, compile_expression
+from core.rpn.prefix_cache import PrefixCache
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Estimated cost (in machine-word operations) above which a program is
+# evaluated through the prefix cache. Cheaper programs run faster folded and
+# compiled than resumed token by token from the trie.
+PREFIX_CACHE_MIN_COST = 1000
+
+# Failed calculations are client input errors that can arrive in bursts, so
+# they are counted by kind and only a sample of them is logged
+error_log = SampledErrorLog(logger)
+
+
+def record_error(expression: str, error: BaseException) -> None:
+    """
+    Count a failed calculation in the metrics and the error log. Callers
+    that fail a calculation outside RPNCalculator.calculate, e.g. while
+    compiling it first, use this so the failure is still accounted for.
+    """
+    if metrics.registry.enabled:
+        metrics.CALCULATIONS.inc(1, "error")
+    error_log.record(expression, error)
+
+
+def _estimate_result_size(result: Dict[str, Any]) -> int:
+    """
+    Roughly estimate the memory held by a calculation result in bytes.
+    """
+    size = sys.getsizeof(result) + sys.getsizeof(result["expression"]) + sys.getsizeof(result["result"])
+    for entry in result["operations"]:
+        size += sys.getsizeof(entry) + sys.getsizeof(entry["operands"]) + sys.getsizeof(entry["result"])
+        size += sum(sys.getsizeof(operand) for operand in entry["operands"])
+    return size
+
+
+def _copy_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Copy a memoized result so callers cannot mutate the cached entry.
+    """
+    copy = {
+        "expression": result["expression"],
+        "result": result["result"],
+        "operations": [
+            {
+                "operator": entry["operator"],
+                "operands": list(entry["operands"]),
+                "result": entry["result"]
+            }
+            for entry in result["operations"]
+        ]
+    }
+    if "summary" in result:
+        summary = result["summary"]
+        copy["summary"] = dict(summary, operators=dict(summary["operators"]))
+    return copy
+
+
 class OperationType(Enum):
     ADDITION = "+"
     SUBTRACTION = "-"
@@ -30,7 +90,28 @@ class RPNCalculator:
     Evaluates expressions where operators follow their operands.
     """
     
-    def __init__(self):
+    def __init__(
+        self,
+        cache_size: int = 1024,
+        fold_constants: bool = True,
+        result_cache_size: int = 0,
+        result_cache_bytes: int = 16 * 1024 * 1024,
+        limits: Optional[Limits] = None,
+        prefix_cache_bytes: int = 0,
+        prefix_cache_min_cost: float = PREFIX_CACHE_MIN_COST
+    ):
+        """
+        Args:
+            cache_size: Maximum number of compiled programs to keep (0 disables caching)
+            fold_constants: Collapse literal-only subtrees at compile time
+            result_cache_size: Maximum number of memoized results (0 disables memoization)
+            result_cache_bytes: Approximate memory budget for memoized results
+            limits: Operand and result size limits (None means unlimited)
+            prefix_cache_bytes: Memory budget for stacks cached by token prefix
+                                (0 disables the prefix cache)
+            prefix_cache_min_cost: Estimated cost a program without variables
+                                   must exceed to use the prefix cache
+        """
         # Define the supported operations
         self.operations = {
             # Basic arithmetic
@@ -67,6 +148,25 @@ class RPNCalculator:
             "ln": 1,
             "!": 1
         }
+        
+        # Compiled programs keyed by expression text. Clear this cache after
+        # changing operations or arity so stale programs are not reused.
+        self.program_cache = LRUCache(cache_size)
+        self.fold_constants = fold_constants
+        self.limits = limits
+        
+        # Memoized results keyed by expression text. Expressions only contain
+        # literals, constants and pure operators, so results are deterministic.
+        self.result_cache = LRUCache(
+            result_cache_size,
+            max_bytes=result_cache_bytes,
+            sizeof=_estimate_result_size
+        )
+        
+        # Intermediate stacks keyed by token prefix, so expressions sharing a
+        # prefix resume after it instead of recomputing it
+        self.prefix_cache = PrefixCache(prefix_cache_bytes)
+        self.prefix_cache_min_cost = prefix_cache_min_cost
     
     def factorial(self, n):
         """
@@ -88,13 +188,60 @@ class RPNCalculator:
             
         return math.factorial(n)
     
-    def calculate(self, expression: str) -> Dict[str, Any]:
+    def compile(self, expression: str) -> CompiledProgram:
+        """
+        Compiles an RPN expression, reusing a cached program when available.
+        
+        Args:
+            expression: A string containing numbers and operators in RPN format
+        
+        Returns:
+            The compiled program for the expression
+        
+        Raises:
+            ValueError: If the expression is invalid
+        """
+        program = self.program_cache.get(expression)
+        if program is None:
+            # Folding would compute literal subtrees that the prefix cache
+            # already holds, so only fold programs that bypass it. Whether a
+            # program uses it depends on its unfolded cost.
+            use_prefix_cache = self.prefix_cache.max_bytes > 0
+            program = compile_expression(
+                expression, self.operations, self.arity,
+                fold_constants=self.fold_constants and not use_prefix_cache, limits=self.limits
+            )
+            if use_prefix_cache and self.fold_constants and not self._uses_prefix_cache(program):
+                program = compile_expression(
+                    expression, self.operations, self.arity, fold_constants=True, limits=self.limits
+                )
+            self.program_cache.put(expression, program)
+        return program
+    
+    def _uses_prefix_cache(self, program: CompiledProgram) -> bool:
+        return (
+            self.prefix_cache.max_bytes > 0
+            and not program.variables
+            and program.cost > self.prefix_cache_min_cost
+        )
+    
+    def calculate(
+        self,
+        expression: str,
+        variables: Optional[Dict[str, Any]] = None,
+        trace: TraceLevel = TraceLevel.FULL
+    ) -> Dict[str, Any]:
         """
         Evaluates an RPN expression and returns the result.
         
         Args:
             expression: A string containing numbers and operators in RPN format
                         (e.g., "3 4 + 2 *")
+            variables: Values for named placeholders in the expression
+                       (e.g., {"x": 3} for "x 2 ^")
+            trace: How much execution detail to return: "full" for the
+                   per-step operations log, "summary" for operator counts
+                   or "none" for the result only
         
         Returns:
             A dictionary containing the result and execution details
@@ -102,97 +249,39 @@ class RPNCalculator:
         Raises:
             ValueError: If the expression is invalid or operations cannot be performed
         """
-        # Split the expression into tokens
-        tokens = expression.strip().split()
-        
-        if not tokens:
-            raise ValueError("Expression cannot be empty")
-        
-        stack = []
-        operations_log = []
+        # Results only depend on the expression text when nothing is bound
+        memoize = self.result_cache.maxsize > 0 and not variables
+        trace = TraceLevel(trace)
+        instrumented = metrics.registry.enabled
+        if memoize:
+            cached = self.result_cache.get((expression, trace))
+            if cached is not None:
+                if instrumented:
+                    metrics.CALCULATIONS.inc(1, "cached")
+                return _copy_result(cached)
         
         try:
-            for token in tokens:
-                if token in self.operations:
-                    # Get the required number of operands for this operation
-                    required_operands = self.arity[token]
-                    
-                    # Check if we have enough operands
-                    if len(stack) < required_operands:
-                        raise ValueError(f"Insufficient operands for operator '{token}'")
-                    
-                    # For unary operations
-                    if required_operands == 1:
-                        a = stack.pop()
-                        
-                        # Special case validations
-                        if token == "sqrt" and a < 0:
-                            raise ValueError("Cannot calculate square root of a negative number")
-                        if (token == "log" or token == "ln") and a <= 0:
-                            raise ValueError("Cannot calculate logarithm of zero or negative number")
-                        
-                        # Perform the operation
-                        result = self.operations[token](a)
-                        stack.append(result)
-                        
-                        # Log the operation
-                        operations_log.append({
-                            "operator": token,
-                            "operands": [a],
-                            "result": result
-                        })
-                        
-                    # For binary operations    
-                    else:
-                        b = stack.pop()
-                        a = stack.pop()
-                        
-                        # Special case for division by zero
-                        if token == "/" and b == 0:
-                            raise ValueError("Division by zero is not allowed")
-                        if token == "%" and b == 0:
-                            raise ValueError("Modulo by zero is not allowed")
-                        
-                        # Perform the operation
-                        result = self.operations[token](a, b)
-                        stack.append(result)
-                        
-                        # Log the operation
-                        operations_log.append({
-                            "operator": token,
-                            "operands": [a, b],
-                            "result": result
-                        })
-                
-                # Special constants
-                elif token.lower() == "pi":
-                    stack.append(math.pi)
-                elif token.lower() == "e":
-                    stack.append(math.e)
-                    
-                else:
-                    # Try to convert token to number
-                    try:
-                        value = float(token)
-                        # Convert to int if it's a whole number
-                        if value.is_integer():
-                            value = int(value)
-                        stack.append(value)
-                    except ValueError:
-                        raise ValueError(f"Invalid token: {token}")
+            if instrumented:
+                started = time.perf_counter()
+            program = self.compile(expression)
+            if instrumented:
+                compiled = time.perf_counter()
+                metrics.record(metrics.PARSE_SECONDS, compiled - started, "parse")
             
-            # After processing all tokens, stack should contain exactly one value
-            if len(stack) != 1:
-                raise ValueError("Invalid expression: too many operands")
-            
-            final_result = stack[0]
-            
-            return {
-                "expression": expression,
-                "result": final_result,
-                "operations": operations_log
-            }
+            if self._uses_prefix_cache(program):
+                result = self.prefix_cache.run(program, self.operations, self.arity, trace)
+            else:
+                result = program.run(variables, trace)
             
+            if instrumented:
+                metrics.record(metrics.EVALUATE_SECONDS, time.perf_counter() - compiled, "evaluate")
+                metrics.CALCULATIONS.inc(1, "ok")
+                # Known statically, so counting does not touch the evaluation loop
+                metrics.OPERATORS.update(program.operator_counts)
         except Exception as e:
-            logger.error(f"Error calculating expression '{expression}': {str(e)}")
-            raise
\ No newline at end of file
+            record_error(expression, e)
+            raise
+        
+        if memoize:
+            self.result_cache.put((expression, trace), _copy_result(result))
+        return result
@@ -0,0 +1,656 @@
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from enum import Enum
+import math
+import re
+
+class TraceLevel(str, Enum):
+    """
+    How much of the evaluation to record alongside the result.
+
+    NONE records nothing, SUMMARY records operator counts and stack depth
+    (known statically, so no per-step objects are built) and FULL records
+    every operation with its operands.
+    """
+    NONE = "none"
+    SUMMARY = "summary"
+    FULL = "full"
+
+
+# Instruction kinds
+PUSH = 0
+UNARY = 1
+BINARY = 2
+CONST = 3
+VAR = 4
+
+# An instruction is (kind, token, argument, guard). For PUSH the argument is the
+# literal value; for operators it is the resolved callable and guard is an
+# optional domain check run on the operands before the call. CONST is a folded
+# literal-only subtree whose argument is (value, operations log of the subtree).
+# VAR pushes the value bound to the variable named by its token.
+Instruction = Tuple[int, str, Any, Optional[Callable]]
+
+
+def _check_sqrt(a):
+    if a < 0:
+        raise ValueError("Cannot calculate square root of a negative number")
+
+
+def _check_log(a):
+    if a <= 0:
+        raise ValueError("Cannot calculate logarithm of zero or negative number")
+
+
+def _check_division(a, b):
+    if b == 0:
+        raise ValueError("Division by zero is not allowed")
+
+
+def _check_modulo(a, b):
+    if b == 0:
+        raise ValueError("Modulo by zero is not allowed")
+
+
+GUARDS = {
+    "sqrt": _check_sqrt,
+    "log": _check_log,
+    "ln": _check_log,
+    "/": _check_division,
+    "%": _check_modulo
+}
+
+CONSTANTS = {
+    "pi": math.pi,
+    "e": math.e
+}
+
+# Operators the vectorized engine knows how to evaluate
+VECTORIZABLE = frozenset(["+", "-", "*", "/", "^", "%", "sqrt", "sin", "cos", "tan", "log", "ln", "!"])
+
+VARIABLE_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*\Z")
+
+# Operators whose integer results can grow without bound
+SIZED_OPERATORS = frozenset(["*", "^", "!"])
+
+# Literal-only operations are folded until their estimated costs add up to
+# this; the rest are left for run time, so compiling stays cheap and the
+# program's cost still reflects them
+MAX_FOLD_COST = 10000
+
+
+class Limits:
+    """
+    Hard bounds on evaluation, configurable per deployment.
+
+    Operands are checked when literals are compiled and when variables are
+    bound. The result size is checked before each multiplication, power or
+    factorial runs, so oversized integer arithmetic is rejected instead of
+    computed.
+
+    Attributes:
+        max_operand: Largest absolute value of a literal or bound variable
+        max_result_bits: Largest integer result of a single operation, in bits
+    """
+
+    __slots__ = ("max_operand", "max_result_bits")
+
+    def __init__(self, max_operand: Optional[float] = None, max_result_bits: Optional[int] = None):
+        self.max_operand = max_operand
+        self.max_result_bits = max_result_bits
+
+    def __repr__(self):
+        return f"<Limits(max_operand={self.max_operand}, max_result_bits={self.max_result_bits})>"
+
+    def check_operand(self, value: Any) -> None:
+        """
+        Raises:
+            ValueError: If the value exceeds max_operand in magnitude
+        """
+        if self.max_operand is not None and abs(value) > self.max_operand:
+            raise ValueError(f"Operand exceeds the maximum magnitude of {self.max_operand:g}")
+
+    def check_operands(self, values: Sequence[Any]) -> None:
+        """
+        check_operand for a whole column of values, compared in one NumPy
+        operation when it is installed.
+
+        Raises:
+            ValueError: If any value exceeds max_operand in magnitude
+        """
+        if self.max_operand is None:
+            return
+        try:
+            import numpy as np
+            magnitudes = np.abs(np.asarray(values, dtype=float))
+        except (ImportError, TypeError, ValueError, OverflowError):
+            # No NumPy, or values a float array cannot hold
+            for value in values:
+                self.check_operand(value)
+            return
+        if (magnitudes > self.max_operand).any():
+            raise ValueError(f"Operand exceeds the maximum magnitude of {self.max_operand:g}")
+
+    def check_result(self, token: str, operands: Sequence[Any]) -> None:
+        """
+        Raises:
+            ValueError: If applying token to operands would produce an integer
+                        larger than max_result_bits
+        """
+        if self.max_result_bits is None:
+            return
+        bits = estimate_result_bits(token, operands)
+        if bits is not None and bits > self.max_result_bits:
+            raise ValueError(f"Result is too large (limit is {self.max_result_bits} bits)")
+
+
+def estimate_result_bits(token: str, operands: Sequence[Any]) -> Optional[float]:
+    """
+    Estimate the size in bits of an integer result before computing it.
+
+    Returns None for operations that do not produce a growing integer, such
+    as float arithmetic (which overflows instead) or invalid factorials.
+    """
+    if token == "!":
+        n = operands[0]
+        if isinstance(n, float) and n.is_integer():
+            n = int(n)
+        if not isinstance(n, int) or n < 0:
+            return None
+        return math.lgamma(n + 1) / math.log(2) if n > 1 else 1.0
+
+    if token == "^":
+        a, b = operands
+        if type(a) is not int or type(b) is not int or b < 0:
+            return None
+        return b * math.log2(abs(a)) if abs(a) > 1 else 1.0
+
+    if token == "*":
+        a, b = operands
+        if type(a) is not int or type(b) is not int:
+            return None
+        return float(a.bit_length() + b.bit_length())
+
+    return None
+
+
+def estimate_cost(token: str, operands: Sequence[Any]) -> float:
+    """
+    Estimate the cost of one operation in machine-word operations, using
+    Karatsuba-style scaling for integer results wider than a word.
+    """
+    bits = estimate_result_bits(token, operands)
+    if bits is None or bits <= 64:
+        return 1.0
+    return (bits / 64) ** 1.585
+
+
+def operator_guard(token: str, limits: Optional[Limits] = None) -> Optional[Callable]:
+    """
+    Return the check to run on an operator's operands before applying it:
+    its domain check combined with the result size limit, if any.
+    """
+    guard = GUARDS.get(token)
+    if limits is None or token not in SIZED_OPERATORS:
+        return guard
+
+    def check(*operands):
+        if guard is not None:
+            guard(*operands)
+        limits.check_result(token, operands)
+    return check
+
+
+def is_variable(token: str) -> bool:
+    """
+    Check whether a token is a valid variable name.
+    """
+    return VARIABLE_PATTERN.match(token) is not None
+
+
+class ExpressionError(ValueError):
+    """
+    Raised for a malformed expression, before any of it is evaluated.
+
+    Attributes:
+        position: 1-based index of the offending token, when there is one
+        kind: The error without the token or position that caused it
+    """
+
+    def __init__(self, message: str, position: Optional[int] = None):
+        super().__init__(f"{message} (at token {position})" if position is not None else message)
+        self.position = position
+        self.kind = message.split(":", 1)[0]
+
+
+def unbound_variable_error(name: str, tokens: Sequence[str], bound: bool) -> ValueError:
+    """
+    Return the error for a variable evaluated without a value. When nothing
+    is bound at all, the identifier is more likely a mistyped operator or
+    constant than a variable, so it is reported as an invalid token.
+
+    Args:
+        name: The unbound variable
+        tokens: The expression's tokens, to locate the variable
+        bound: Whether any variables were bound
+    """
+    if not bound:
+        return ExpressionError(f"Invalid token: {name}", list(tokens).index(name) + 1)
+    return ValueError(f"Unbound variable: {name}")
+
+
+def unused_value_position(tokens: Sequence[str], arity: Dict[str, int]) -> int:
+    """
+    For tokens that leave more than one value on the stack, return the
+    position of the first token of the second value's subexpression, the
+    first value the result does not consume. Only used once validation has
+    failed, so the valid path does not track where values start.
+    """
+    starts: List[int] = []
+    for position, token in enumerate(tokens, 1):
+        required = arity.get(token)
+        if required is None:
+            starts.append(position)
+        else:
+            start = starts[-required]
+            del starts[-required:]
+            starts.append(start)
+    return starts[1]
+
+
+def validate_tokens(tokens: Sequence[str], arity: Dict[str, int]) -> List[Any]:
+    """
+    Check that tokens form a well-formed RPN expression without evaluating
+    anything: every token is an operator, a literal or a variable name, no
+    operator is short of operands and exactly one value is left at the end.
+    Runs in a single linear pass over the tokens, so malformed expressions
+    are rejected before any arithmetic (or constant folding) runs.
+
+    Args:
+        tokens: The expression's tokens
+        arity: Mapping of operator token to number of operands
+
+    Returns:
+        Each token's literal value, or None for operators and variables
+
+    Raises:
+        ExpressionError: For the first offending token, with its position
+    """
+    if not tokens:
+        raise ExpressionError("Expression cannot be empty")
+
+    # The position of the current token is len(literals) + 1
+    literals: List[Any] = []
+    append = literals.append
+    depth = 0
+    for token in tokens:
+        required_operands = arity.get(token)
+        if required_operands is not None:
+            if depth < required_operands:
+                raise ExpressionError(f"Insufficient operands for operator '{token}'", len(literals) + 1)
+            depth -= required_operands - 1
+            append(None)
+            continue
+
+        value = parse_literal(token)
+        if value is None and not is_variable(token):
+            raise ExpressionError(f"Invalid token: {token}", len(literals) + 1)
+        append(value)
+        depth += 1
+
+    if depth != 1:
+        raise ExpressionError(
+            f"Invalid expression: too many operands, {depth} values left",
+            unused_value_position(tokens, arity)
+        )
+    return literals
+
+
+def parse_literal(token: str):
+    """
+    Parse a numeric or constant token, returning None if it is neither.
+    """
+    constant = CONSTANTS.get(token.lower())
+    if constant is not None:
+        return constant
+
+    try:
+        value = float(token)
+    except ValueError:
+        return None
+
+    # Convert to int if it's a whole number
+    if value.is_integer():
+        value = int(value)
+    return value
+
+
+class CompiledProgram:
+    """
+    A pre-validated RPN expression: tokens resolved to callables, literals
+    parsed and the maximum stack depth known ahead of evaluation.
+
+    Programs may reference named variables (e.g. "x y + 2 *") which are bound
+    at evaluation time, so one program can be evaluated with many inputs.
+    """
+
+    __slots__ = (
+        "expression", "tokens", "instructions", "max_depth", "variables", "operator_counts", "cost", "limits"
+    )
+
+    def __init__(
+        self,
+        expression: str,
+        tokens: Tuple[str, ...],
+        instructions: List[Instruction],
+        max_depth: int,
+        variables: Tuple[str, ...] = (),
+        operator_counts: Optional[Dict[str, int]] = None,
+        cost: float = 0.0,
+        limits: Optional[Limits] = None
+    ):
+        self.expression = expression
+        self.tokens = tokens
+        self.instructions = instructions
+        self.max_depth = max_depth
+        self.variables = variables
+        self.operator_counts = operator_counts or {}
+        # Estimated evaluation cost in machine-word operations. Operations on
+        # variables are assumed to fit in a word; limits bound the rest.
+        self.cost = cost
+        self.limits = limits
+
+    def __repr__(self):
+        return f"<CompiledProgram(expression='{self.expression}', steps={len(self.instructions)})>"
+
+    def _check_bindings(self, variables: Optional[Dict[str, Any]]) -> None:
+        for name in self.variables:
+            if not variables or name not in variables:
+                raise unbound_variable_error(name, self.tokens, bool(variables))
+            if self.limits is not None:
+                self.limits.check_operand(variables[name])
+
+    def _execute(self, variables: Optional[Dict[str, Any]], operations_log: Optional[List[Dict[str, Any]]]):
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        log = operations_log is not None
+
+        for kind, token, arg, guard in self.instructions:
+            if kind == PUSH:
+                push(arg)
+            elif kind == VAR:
+                push(variables[token])
+            elif kind == CONST:
+                value, entries = arg
+                push(value)
+                if log:
+                    # Replay the folded operations log without recomputing it
+                    for entry in entries:
+                        operations_log.append({
+                            "operator": entry["operator"],
+                            "operands": list(entry["operands"]),
+                            "result": entry["result"]
+                        })
+            elif kind == UNARY:
+                a = pop()
+                if guard is not None:
+                    guard(a)
+                result = arg(a)
+                push(result)
+                if log:
+                    operations_log.append({
+                        "operator": token,
+                        "operands": [a],
+                        "result": result
+                    })
+            else:
+                b = pop()
+                a = pop()
+                if guard is not None:
+                    guard(a, b)
+                result = arg(a, b)
+                push(result)
+                if log:
+                    operations_log.append({
+                        "operator": token,
+                        "operands": [a, b],
+                        "result": result
+                    })
+
+        return stack[0]
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Return the statically known shape of the evaluation.
+        """
+        return {
+            "steps": sum(self.operator_counts.values()),
+            "operators": dict(self.operator_counts),
+            "max_depth": self.max_depth
+        }
+
+    def run(
+        self,
+        variables: Optional[Dict[str, Any]] = None,
+        trace: TraceLevel = TraceLevel.FULL
+    ) -> Dict[str, Any]:
+        """
+        Evaluate the program and return the result with its execution details.
+
+        Args:
+            variables: Values for the variables referenced by the program
+            trace: How much of the evaluation to record. FULL returns the
+                   operations log, SUMMARY adds a "summary" entry and NONE
+                   returns only the result
+
+        Raises:
+            ValueError: If a variable is unbound or an operation is outside
+                        its domain (e.g. division by zero)
+        """
+        if self.variables:
+            self._check_bindings(variables)
+
+        if trace == TraceLevel.FULL:
+            operations_log = []
+            result = self._execute(variables, operations_log)
+            return {
+                "expression": self.expression,
+                "result": result,
+                "operations": operations_log
+            }
+
+        output = {
+            "expression": self.expression,
+            "result": self._execute(variables, None),
+            "operations": []
+        }
+        if trace == TraceLevel.SUMMARY:
+            output["summary"] = self.summary()
+        return output
+
+    def evaluate(self, **variables) -> Any:
+        """
+        Evaluate the program with the given variable bindings and return only
+        the result, without building an operations log.
+
+        Example:
+            program.evaluate(x=3, y=4)
+        """
+        if self.variables:
+            self._check_bindings(variables)
+        return self._execute(variables, None)
+
+    def evaluate_many(self, **columns: Sequence[Any]) -> List[Any]:
+        """
+        Evaluate the program once per row of the given binding columns.
+
+        Uses the vectorized NumPy engine when it is installed and falls back
+        to evaluating row by row otherwise.
+
+        Example:
+            program.evaluate_many(x=[1, 2, 3], y=[4, 5, 6])
+
+        Raises:
+            ValueError: If a variable is unbound, the columns differ in length
+                        or any row fails, naming the first failing row
+        """
+        for name in self.variables:
+            if name not in columns:
+                raise unbound_variable_error(name, self.tokens, bool(columns))
+        if self.limits is not None:
+            for column in columns.values():
+                self.limits.check_operands(column)
+        lengths = {len(column) for column in columns.values()}
+        if len(lengths) > 1:
+            raise ValueError("All variable columns must have the same length")
+        rows = lengths.pop() if lengths else 1
+
+        try:
+            from core.rpn.vectorized import evaluate_columns
+        except ImportError:
+            evaluate_columns = None
+
+        if evaluate_columns is not None and all(
+            token in VECTORIZABLE or kind in (PUSH, VAR)
+            for kind, token, _, _ in self.instructions
+        ):
+            return evaluate_columns(self, columns, rows)
+
+        results = []
+        names = list(columns)
+        for row, values in enumerate(zip(*columns.values()) if names else [()] * rows):
+            try:
+                results.append(self._execute(dict(zip(names, values)), None))
+            except Exception as e:
+                raise ValueError(f"Row {row}: {e}") from e
+        return results
+
+
+def _fold(token: str, func: Callable, guard: Optional[Callable], operands: List[Instruction]) -> Optional[Instruction]:
+    """
+    Evaluate an operator over constant operand instructions at compile time.
+    Returns None when the operation fails so the error surfaces at run time.
+    """
+    values = []
+    entries = []
+    for kind, _, arg, _ in operands:
+        if kind == CONST:
+            values.append(arg[0])
+            entries.extend(arg[1])
+        else:
+            values.append(arg)
+
+    try:
+        if guard is not None:
+            guard(*values)
+        result = func(*values)
+    except Exception:
+        return None
+
+    entries.append({"operator": token, "operands": values, "result": result})
+    return (CONST, token, (result, tuple(entries)), None)
+
+
+def compile_expression(
+    expression: str,
+    operations: Dict[str, Callable],
+    arity: Dict[str, int],
+    fold_constants: bool = True,
+    limits: Optional[Limits] = None
+) -> CompiledProgram:
+    """
+    Compile an RPN expression into a CompiledProgram.
+
+    Args:
+        expression: A string containing numbers and operators in RPN format
+        operations: Mapping of operator token to callable
+        arity: Mapping of operator token to number of operands
+        fold_constants: Collapse literal-only subtrees into single constants
+        limits: Operand and result size limits enforced by the program
+
+    Returns:
+        The compiled program
+
+    Raises:
+        ExpressionError: If the expression is empty, contains an invalid
+                         token or does not leave exactly one value on the
+                         stack; found before anything is folded
+        ValueError: If a literal is outside the limits
+
+    Tokens that are neither operators, numbers nor constants but are valid
+    identifiers become variables bound at evaluation time. Evaluating with
+    no bindings at all reports them as invalid tokens.
+    """
+    tokens = expression.strip().split()
+    literals = validate_tokens(tokens, arity)
+
+    instructions: List[Instruction] = []
+    # Whether each stack slot holds a compile-time constant. A constant slot is
+    # always produced by exactly one instruction, so the top N constant slots
+    # map onto the last N instructions.
+    constant_slots: List[bool] = []
+    variables: List[str] = []
+    operator_counts: Dict[str, int] = {}
+    depth = 0
+    max_depth = 0
+    cost = 0.0
+    folded_cost = 0.0
+
+    for token, value in zip(tokens, literals):
+        if token in operations:
+            required_operands = arity[token]
+            func = operations[token]
+            guard = operator_guard(token, limits)
+            depth -= required_operands - 1
+            operator_counts[token] = operator_counts.get(token, 0) + 1
+
+            step_cost = 1.0
+            folded = None
+            if all(constant_slots[-required_operands:]):
+                operands = instructions[-required_operands:]
+                values = [arg[0] if kind == CONST else arg for kind, _, arg, _ in operands]
+                step_cost = estimate_cost(token, values)
+                if limits is not None and step_cost > 1:
+                    try:
+                        limits.check_result(token, values)
+                    except ValueError:
+                        # Rejected before any work is done
+                        step_cost = 1.0
+                if fold_constants and folded_cost + step_cost <= MAX_FOLD_COST:
+                    folded = _fold(token, func, guard, operands)
+                    if folded is not None:
+                        folded_cost += step_cost
+
+            del constant_slots[-required_operands:]
+            if folded is not None:
+                del instructions[-required_operands:]
+                instructions.append(folded)
+                constant_slots.append(True)
+            else:
+                kind = UNARY if required_operands == 1 else BINARY
+                instructions.append((kind, token, func, guard))
+                constant_slots.append(False)
+                cost += step_cost
+        else:
+            if value is not None:
+                if limits is not None:
+                    limits.check_operand(value)
+                instructions.append((PUSH, token, value, None))
+                constant_slots.append(True)
+            else:
+                instructions.append((VAR, token, None, None))
+                constant_slots.append(False)
+                if token not in variables:
+                    variables.append(token)
+
+            depth += 1
+            if depth > max_depth:
+                max_depth = depth
+
+    # Every remaining instruction costs at least one step
+    cost += sum(1 for kind, _, _, _ in instructions if kind in (PUSH, VAR, CONST))
+
+    return CompiledProgram(
+        expression, tuple(tokens), instructions, max_depth, tuple(variables), operator_counts,
+        cost, limits
+    )
@@ -0,0 +1,334 @@
+"""
+Multi-core batch evaluation of RPN expressions.
+
+Rows are split into fixed-size chunks and each chunk is evaluated in a worker
+process, so a large batch uses every core instead of pinning the caller's.
+Results come back in input order, and a chunk that fails as a whole (for
+example because its worker died) only fails its own rows.
+"""
+
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional, Sequence
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+
+from core import metrics
+from core.rpn.calculator import RPNCalculator
+from core.rpn.compiler import Limits, TraceLevel
+
+logger = logging.getLogger(__name__)
+
+BATCH_EVALUATE_SECONDS = metrics.registry.histogram(
+    "rpn_batch_evaluate_seconds", "Time spent evaluating batches of expressions"
+)
+
+# Per-process evaluator and its limits, set up on first use in each worker
+_evaluator = None
+_limits: Optional[Limits] = None
+
+
+class EvaluationTimeout(ValueError):
+    """
+    Raised when an offloaded calculation does not finish within its timeout.
+    """
+
+
+def _init_worker(limits: Optional[Limits]) -> None:
+    global _evaluator, _limits
+    _evaluator = None
+    _limits = limits
+
+
+def _build_evaluator(limits: Optional[Limits]):
+    calculator = RPNCalculator(limits=limits)
+    try:
+        from core.rpn.vectorized import BatchEvaluator
+    except ImportError:  # NumPy is optional
+        return calculator
+    return BatchEvaluator(calculator)
+
+
+def _get_evaluator():
+    global _evaluator
+    if _evaluator is None:
+        _evaluator = _build_evaluator(_limits)
+    return _evaluator
+
+
+def _evaluate(evaluator, expressions: Sequence[str], trace: TraceLevel) -> List[Dict[str, Any]]:
+    if not isinstance(evaluator, RPNCalculator):
+        return evaluator.evaluate(expressions, trace=trace)
+
+    results = []
+    for expression in expressions:
+        try:
+            calc_result = evaluator.calculate(expression, trace=trace)
+        except Exception as e:
+            results.append({"expression": expression, "error": str(e)})
+            continue
+        item = {"expression": expression, "result": calc_result["result"]}
+        if trace == TraceLevel.FULL:
+            item["operations"] = calc_result["operations"]
+        elif trace == TraceLevel.SUMMARY:
+            item["summary"] = calc_result["summary"]
+        results.append(item)
+    return results
+
+
+def evaluate_chunk(expressions: Sequence[str], trace: TraceLevel = TraceLevel.NONE) -> List[Dict[str, Any]]:
+    """
+    Evaluate a chunk of expressions with this process's evaluator.
+
+    Uses the vectorized evaluator when NumPy is installed and the scalar
+    calculator otherwise. Each expression yields a dictionary with either
+    "result" (plus "operations" or "summary" depending on trace) or "error".
+    """
+    return _evaluate(_get_evaluator(), expressions, TraceLevel(trace))
+
+
+def calculate_one(
+    expression: str,
+    variables: Optional[Dict[str, Any]] = None,
+    trace: TraceLevel = TraceLevel.FULL
+) -> Dict[str, Any]:
+    """
+    Run RPNCalculator.calculate with this process's calculator.
+    """
+    evaluator = _get_evaluator()
+    calculator = evaluator if isinstance(evaluator, RPNCalculator) else evaluator.calculator
+    return calculator.calculate(expression, variables, trace)
+
+
+def _failed_chunk(expressions: Sequence[str], error: BaseException) -> List[Dict[str, Any]]:
+    message = str(error) or type(error).__name__
+    return [{"expression": expression, "error": message} for expression in expressions]
+
+
+class _WorkerPool:
+    """
+    Lazily started pool of spawn-started worker processes that evaluate with
+    the given limits. Spawning means workers never inherit the parent's
+    threads, event loop or database connections.
+    """
+
+    def __init__(self, max_workers: int, limits: Optional[Limits] = None):
+        self.max_workers = max_workers
+        self.limits = limits
+
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.limits,)
+                )
+            return self._executor
+
+    def _reset_executor(self, broken: Executor, terminate: bool = False) -> None:
+        # A dead worker breaks the whole pool, so replace it for later calls
+        with self._lock:
+            if self._executor is broken:
+                self._executor = None
+        if terminate:
+            terminate_workers = getattr(broken, "terminate_workers", None)
+            if terminate_workers is not None:
+                terminate_workers()
+            else:
+                for process in list((broken._processes or {}).values()):
+                    process.terminate()
+        broken.shutdown(wait=False)
+
+    def shutdown(self) -> None:
+        """
+        Stop the worker processes, if they were started.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+
+class ParallelEvaluator(_WorkerPool):
+    """
+    Evaluates batches of expressions across a pool of worker processes.
+
+    Batches no larger than one chunk are evaluated in the calling process,
+    since shipping them to a worker costs more than it saves.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, chunk_size: int = 1000, limits: Optional[Limits] = None):
+        super().__init__(max_workers or os.cpu_count() or 1, limits)
+        self.chunk_size = chunk_size
+        self._local = _build_evaluator(limits)
+
+        # Metrics
+        self.batches = 0
+        self.chunks = 0
+        self.failed_chunks = 0
+
+    def _chunks(self, expressions: Sequence[str]) -> List[Sequence[str]]:
+        return [
+            expressions[start:start + self.chunk_size]
+            for start in range(0, len(expressions), self.chunk_size)
+        ]
+
+    def evaluate(self, expressions: Sequence[str], trace: TraceLevel = TraceLevel.NONE) -> List[Dict[str, Any]]:
+        """
+        Evaluate a batch of expressions, preserving input order.
+
+        Args:
+            expressions: RPN expressions to evaluate
+            trace: Trace level of each result, as for BatchEvaluator.evaluate
+
+        Returns:
+            One dictionary per expression with either "result" or "error"
+        """
+        trace = TraceLevel(trace)
+        self.batches += 1
+        if self.max_workers == 1 or len(expressions) <= self.chunk_size:
+            return _evaluate(self._local, expressions, trace)
+
+        executor = self._get_executor()
+        chunks = self._chunks(expressions)
+        futures = [executor.submit(evaluate_chunk, chunk, trace) for chunk in chunks]
+
+        results: List[Dict[str, Any]] = []
+        for chunk, future in zip(chunks, futures):
+            try:
+                outcome = future.result()
+            except Exception as e:
+                outcome = e
+            results.extend(self._chunk_result(executor, chunk, outcome))
+        return results
+
+    async def evaluate_async(
+        self,
+        expressions: Sequence[str],
+        trace: TraceLevel = TraceLevel.NONE,
+        in_process: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        Evaluate a batch of expressions without blocking the event loop.
+
+        Small batches run on the loop's default thread pool and larger ones
+        are sharded across the worker processes. With in_process the batch
+        is evaluated on the calling thread instead, blocking the loop, so a
+        profiler running there sees the evaluation.
+        """
+        with metrics.timed(BATCH_EVALUATE_SECONDS, "evaluate"):
+            trace = TraceLevel(trace)
+            loop = asyncio.get_running_loop()
+            self.batches += 1
+            if in_process:
+                return _evaluate(self._local, expressions, trace)
+            if self.max_workers == 1 or len(expressions) <= self.chunk_size:
+                return await loop.run_in_executor(None, _evaluate, self._local, expressions, trace)
+
+            executor = self._get_executor()
+            chunks = self._chunks(expressions)
+            outcomes = await asyncio.gather(
+                *(loop.run_in_executor(executor, evaluate_chunk, chunk, trace) for chunk in chunks),
+                return_exceptions=True
+            )
+
+            results: List[Dict[str, Any]] = []
+            for chunk, outcome in zip(chunks, outcomes):
+                results.extend(self._chunk_result(executor, chunk, outcome))
+            return results
+
+    def _chunk_result(self, executor: Executor, chunk: Sequence[str], outcome) -> List[Dict[str, Any]]:
+        # outcome is the chunk's results, or the exception that failed it
+        self.chunks += 1
+        if not isinstance(outcome, BaseException):
+            return outcome
+
+        self.failed_chunks += 1
+        logger.error("Failed to evaluate a chunk of %d expressions: %r", len(chunk), outcome)
+        if isinstance(outcome, BrokenProcessPool):
+            self._reset_executor(executor)
+        return _failed_chunk(chunk, outcome)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return the pool configuration and evaluation counters.
+        """
+        return {
+            "max_workers": self.max_workers,
+            "chunk_size": self.chunk_size,
+            "started": self._executor is not None,
+            "batches": self.batches,
+            "chunks": self.chunks,
+            "failed_chunks": self.failed_chunks
+        }
+
+
+class IsolatedCalculator(_WorkerPool):
+    """
+    Runs single calculations in worker processes with a wall-clock timeout,
+    for programs too expensive to evaluate on the event loop.
+
+    A calculation that overruns the timeout is stopped by terminating the
+    pool's workers; other calculations running in the pool at that moment
+    fail too, and the pool is restarted for later calls.
+    """
+
+    def __init__(self, max_workers: int = 2, timeout: float = 5.0, limits: Optional[Limits] = None):
+        super().__init__(max_workers, limits)
+        self.timeout = timeout
+
+        # Metrics
+        self.calculations = 0
+        self.timeouts = 0
+
+    async def calculate(
+        self,
+        expression: str,
+        variables: Optional[Dict[str, Any]] = None,
+        trace: TraceLevel = TraceLevel.FULL
+    ) -> Dict[str, Any]:
+        """
+        Evaluate an expression in a worker process.
+
+        Returns:
+            The result of RPNCalculator.calculate
+
+        Raises:
+            EvaluationTimeout: If evaluation takes longer than the timeout
+            ValueError: If the expression is invalid or cannot be evaluated
+        """
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        self.calculations += 1
+        try:
+            return await asyncio.wait_for(
+                loop.run_in_executor(executor, calculate_one, expression, variables, TraceLevel(trace)),
+                self.timeout
+            )
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            self._reset_executor(executor, terminate=True)
+            raise EvaluationTimeout(f"Evaluation timed out after {self.timeout:g} seconds")
+        except BrokenProcessPool:
+            self._reset_executor(executor)
+            raise EvaluationTimeout("Evaluation was cancelled")
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return the pool configuration and calculation counters.
+        """
+        return {
+            "max_workers": self.max_workers,
+            "timeout_seconds": self.timeout,
+            "started": self._executor is not None,
+            "calculations": self.calculations,
+            "timeouts": self.timeouts
+        }
@@ -0,0 +1,224 @@
+"""
+Evaluation cache keyed by token prefixes.
+
+Expressions often share a long common prefix, such as the same base
+computation followed by different trailing operators. PrefixCache keeps a
+trie of token prefixes whose nodes hold the stack left after their prefix,
+so evaluating an expression only computes the tokens after its longest
+cached prefix. Stacks are persistent linked frames shared between a node
+and its descendants, so each node only stores the values it adds.
+"""
+
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence
+import sys
+import threading
+
+from core.rpn.compiler import CompiledProgram, TraceLevel, operator_guard, parse_literal
+
+# Approximate bytes held by a trie node besides its value: the node, its
+# stack frame, its children dictionary and its operations log entry (whose
+# operands are values of other frames, so they are not counted again)
+NODE_OVERHEAD = 400
+
+
+class StackFrame:
+    """
+    One value on a persistent stack, linked to the frame below it. Frames
+    are never modified, so a stack can be shared by every state built on it.
+    """
+
+    __slots__ = ("value", "below", "depth")
+
+    def __init__(self, value: Any, below: Optional["StackFrame"]):
+        self.value = value
+        self.below = below
+        self.depth = below.depth + 1 if below is not None else 1
+
+
+class _Node:
+    __slots__ = ("token", "parent", "children", "top", "entry", "size")
+
+    def __init__(self, token, parent, top, entry, size):
+        self.token = token
+        self.parent = parent
+        self.children: Dict[str, "_Node"] = {}
+        self.top = top
+        self.entry = entry
+        self.size = size
+
+
+class PrefixCache:
+    """
+    A memory-bounded trie of evaluated token prefixes.
+
+    Cold branches are evicted leaf first in least-recently-used order once
+    the estimated size of the cached stacks exceeds max_bytes. A max_bytes
+    of 0 disables the cache. Only expressions without variables can be
+    cached, as their prefixes evaluate to the same stack every time.
+    """
+
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024):
+        if max_bytes < 0:
+            raise ValueError("Cache size cannot be negative")
+
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.lookups = 0
+        self.tokens = 0
+        self.reused = 0
+        self.evictions = 0
+        self._root = _Node(None, None, None, None, 0)
+        # Every node but the root, least recently used first. A node is always
+        # touched after its descendants, so the first node is always a leaf.
+        self._lru: "OrderedDict[int, _Node]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._lru)
+
+    def _longest_prefix(self, tokens: Sequence[str]) -> List[_Node]:
+        with self._lock:
+            path = []
+            node = self._root
+            for token in tokens:
+                node = node.children.get(token)
+                if node is None:
+                    break
+                path.append(node)
+            if path:
+                self._touch(path[-1])
+
+            self.lookups += 1
+            self.tokens += len(tokens)
+            self.reused += len(path)
+            return path
+
+    def _touch(self, node: _Node) -> None:
+        while node is not self._root:
+            self._lru.move_to_end(id(node))
+            node = node.parent
+
+    def _attach(self, node: _Node, chain: List[_Node]) -> None:
+        with self._lock:
+            if node is not self._root and node.parent is None:
+                # The prefix was evicted while the rest was computed
+                return
+            for child in chain:
+                existing = node.children.get(child.token)
+                if existing is not None:
+                    node = existing
+                    continue
+                child.parent = node
+                node.children[child.token] = child
+                self._lru[id(child)] = child
+                self.current_bytes += child.size
+                node = child
+            self._touch(node)
+            self._evict()
+
+    def _evict(self) -> None:
+        while self.current_bytes > self.max_bytes and self._lru:
+            _, node = self._lru.popitem(last=False)
+            del node.parent.children[node.token]
+            node.parent = None
+            self.current_bytes -= node.size
+            self.evictions += 1
+
+    def run(
+        self,
+        program: CompiledProgram,
+        operations: Dict[str, Callable],
+        arity: Dict[str, int],
+        trace: TraceLevel = TraceLevel.FULL
+    ) -> Dict[str, Any]:
+        """
+        Evaluate a compiled program token by token, resuming from the longest
+        cached prefix of its tokens and caching the prefixes evaluated.
+
+        Compiling first keeps validation errors (invalid tokens, unbalanced
+        stacks) ahead of any arithmetic, exactly as CompiledProgram.run.
+
+        Args:
+            program: A compiled program without variables
+            operations: Mapping of operator token to callable
+            arity: Mapping of operator token to number of operands
+            trace: How much of the evaluation to record, as CompiledProgram.run
+
+        Returns:
+            A dictionary containing the result and execution details
+
+        Raises:
+            ValueError: If an operation is outside its domain; the prefix
+                        evaluated before it is still cached
+        """
+        tokens = program.tokens
+        path = self._longest_prefix(tokens)
+        node = path[-1] if path else self._root
+        top = node.top
+        chain: List[_Node] = []
+        try:
+            for token in tokens[len(path):]:
+                entry = None
+                if token in operations:
+                    required_operands = arity[token]
+                    below = top
+                    operands = []
+                    for _ in range(required_operands):
+                        operands.append(below.value)
+                        below = below.below
+                    operands.reverse()
+
+                    guard = operator_guard(token, program.limits)
+                    if guard is not None:
+                        guard(*operands)
+                    result = operations[token](*operands)
+                    top = StackFrame(result, below)
+                    entry = {"operator": token, "operands": operands, "result": result}
+                else:
+                    top = StackFrame(parse_literal(token), top)
+                chain.append(_Node(token, None, top, entry, NODE_OVERHEAD + sys.getsizeof(top.value)))
+        finally:
+            if chain and self.max_bytes:
+                self._attach(node, chain)
+
+        output = {"expression": program.expression, "result": top.value, "operations": []}
+        if trace == TraceLevel.SUMMARY:
+            output["summary"] = program.summary()
+        elif trace == TraceLevel.FULL:
+            # Copy so callers cannot mutate the cached entries
+            output["operations"] = [
+                {"operator": n.entry["operator"], "operands": list(n.entry["operands"]), "result": n.entry["result"]}
+                for n in path + chain
+                if n.entry is not None
+            ]
+        return output
+
+    def clear(self) -> None:
+        """
+        Drop every cached prefix and reset the counters.
+        """
+        with self._lock:
+            self._root.children.clear()
+            self._lru.clear()
+            self.current_bytes = 0
+            self.lookups = 0
+            self.tokens = 0
+            self.reused = 0
+            self.evictions = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return a snapshot of the cache counters. reuse_ratio is the share of
+        evaluated tokens served from cached prefixes.
+        """
+        return {
+            "nodes": len(self._lru),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "lookups": self.lookups,
+            "tokens": self.tokens,
+            "reused_tokens": self.reused,
+            "reuse_ratio": self.reused / self.tokens if self.tokens else 0.0,
+            "evictions": self.evictions
+        }
@@ -0,0 +1,362 @@
+"""
+Interactive, stateful evaluation on top of RPNCalculator.
+
+A session's stack is persistent: every push or operator builds a new frame
+on top of the frames it keeps, and frames are never modified. Each state is
+recorded as a Snapshot that points at its stack and at the state before it,
+so taking a snapshot, rolling back to one and branching from an earlier
+state all cost O(1), and an edited expression resumes from the longest
+prefix it shares with the tokens already fed instead of starting over.
+"""
+
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+from core.rpn.calculator import RPNCalculator
+from core.rpn.compiler import TraceLevel, is_variable, operator_guard, parse_literal
+from core.rpn.prefix_cache import StackFrame
+
+
+def check_number(value: Any, name: str = "Value") -> None:
+    """
+    Check that a pushed or bound value is a number.
+
+    Raises:
+        ValueError: If the value is not an int or float (bools included)
+    """
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"{name} must be a number, got {type(value).__name__}")
+
+
+class Snapshot:
+    """
+    The state of a session after a token, linked to the state before it.
+
+    Snapshots are immutable, so they stay valid however the session moves on
+    and can be handed back to RPNSession.rollback at any time.
+
+    Attributes:
+        token: The token that produced this state (None for the empty
+               starting state and for states produced by pop)
+        entry: The operations log entry when the token was an operator
+        parent: The state before the token
+        position: Number of states before this one
+    """
+
+    __slots__ = ("token", "entry", "parent", "position", "version", "_top")
+
+    def __init__(
+        self,
+        token: Optional[str],
+        top: Optional[StackFrame],
+        parent: Optional["Snapshot"] = None,
+        entry: Optional[Dict[str, Any]] = None,
+        version: Optional[int] = None
+    ):
+        self.token = token
+        self.entry = entry
+        self.parent = parent
+        self.position = parent.position + 1 if parent is not None else 0
+        # Variable bindings the state was computed with (None if it read none)
+        self.version = version if version is not None else (parent.version if parent is not None else None)
+        self._top = top
+
+    @property
+    def depth(self) -> int:
+        return self._top.depth if self._top is not None else 0
+
+    @property
+    def stack(self) -> List[Any]:
+        """
+        The stack's values from bottom to top.
+        """
+        values = []
+        frame = self._top
+        while frame is not None:
+            values.append(frame.value)
+            frame = frame.below
+        values.reverse()
+        return values
+
+
+class RPNSession:
+    """
+    Evaluation state kept across calls, for interactive clients.
+
+    The session owns a value stack that operands are pushed onto and
+    operators are applied to one at a time, so a client can build up a
+    calculation without resending the whole expression. Variables bound to
+    the session are available to every later push and evaluation. Compiled
+    programs come from the calculator's shared cache.
+    """
+
+    def __init__(self, calculator: Optional[RPNCalculator] = None):
+        self.calculator = calculator or RPNCalculator()
+        self.variables: Dict[str, Any] = {}
+        self._version = 1
+        self._root = Snapshot(None, None)
+        # States along the current branch; _path[i] is the state after i tokens
+        self._path: List[Snapshot] = [self._root]
+
+    @property
+    def state(self) -> Snapshot:
+        return self._path[-1]
+
+    @property
+    def stack(self) -> List[Any]:
+        """
+        The current stack's values from bottom to top.
+        """
+        return self.state.stack
+
+    @property
+    def depth(self) -> int:
+        return self.state.depth
+
+    @property
+    def tokens(self) -> List[str]:
+        """
+        The tokens fed since the session was last cleared.
+        """
+        return [snapshot.token for snapshot in self._path[1:]]
+
+    def bind(self, **variables) -> None:
+        """
+        Bind variables for later pushes and evaluations.
+
+        Values already on the stack keep the bindings they were pushed with,
+        but resume no longer reuses states that read a variable.
+
+        Raises:
+            ValueError: If a value is not a number or is outside the limits
+        """
+        limits = self.calculator.limits
+        for name, value in variables.items():
+            check_number(value, f"Variable {name}")
+            if limits is not None:
+                limits.check_operand(value)
+        self.variables.update(variables)
+        self._version += 1
+
+    def push(self, value: Any) -> Any:
+        """
+        Push a value onto the stack.
+
+        Args:
+            value: A number, or a token: a numeric literal, constant or bound
+                   variable name
+
+        Returns:
+            The pushed value
+
+        Raises:
+            ValueError: If the value is neither a number nor a string, or the
+                        token is invalid, unbound or outside the limits
+        """
+        version = None
+        if isinstance(value, str):
+            token = value
+            value = parse_literal(token)
+            if value is None:
+                # Without any bindings an identifier is a mistyped token
+                if not is_variable(token) or not self.variables:
+                    raise ValueError(f"Invalid token: {token}")
+                if token not in self.variables:
+                    raise ValueError(f"Unbound variable: {token}")
+                value = self.variables[token]
+                version = self._version
+        else:
+            check_number(value)
+            token = repr(value)
+
+        limits = self.calculator.limits
+        if limits is not None:
+            limits.check_operand(value)
+
+        state = self.state
+        self._path.append(Snapshot(token, StackFrame(value, state._top), state, version=version))
+        return value
+
+    def pop(self) -> Any:
+        """
+        Remove and return the top of the stack.
+
+        Raises:
+            ValueError: If the stack is empty
+        """
+        state = self.state
+        if state._top is None:
+            raise ValueError("Stack is empty")
+        self._path.append(Snapshot(None, state._top.below, state))
+        return state._top.value
+
+    def apply(self, token: str) -> Dict[str, Any]:
+        """
+        Apply an operator to the top of the stack, replacing its operands
+        with the result.
+
+        Returns:
+            The operation as an operations log entry
+
+        Raises:
+            ValueError: If the operator is unknown, the stack holds too few
+                        operands or the operation is outside its domain; the
+                        stack is left unchanged
+        """
+        func = self.calculator.operations.get(token)
+        if func is None:
+            raise ValueError(f"Invalid token: {token}")
+
+        state = self.state
+        required_operands = self.calculator.arity[token]
+        if state.depth < required_operands:
+            raise ValueError(f"Insufficient operands for operator '{token}'")
+
+        below = state._top
+        operands = []
+        for _ in range(required_operands):
+            operands.append(below.value)
+            below = below.below
+        operands.reverse()
+
+        guard = operator_guard(token, self.calculator.limits)
+        if guard is not None:
+            guard(*operands)
+        result = func(*operands)
+
+        entry = {"operator": token, "operands": operands, "result": result}
+        self._path.append(Snapshot(token, StackFrame(result, below), state, entry))
+        return entry
+
+    def feed(self, tokens: Union[str, Sequence[str]]) -> List[Dict[str, Any]]:
+        """
+        Feed tokens to the session, pushing operands and applying operators.
+
+        Args:
+            tokens: A whitespace-separated expression fragment or a sequence
+                    of tokens
+
+        Returns:
+            The operations log entries of the operators applied
+
+        Raises:
+            ValueError: If a token fails; the tokens before it stay fed
+        """
+        if isinstance(tokens, str):
+            tokens = tokens.split()
+
+        operations = []
+        for token in tokens:
+            if token in self.calculator.operations:
+                operations.append(self.apply(token))
+            else:
+                self.push(token)
+        return operations
+
+    def resume(self, expression: str) -> int:
+        """
+        Bring the session to the state after the given expression, reusing
+        the longest prefix it shares with the tokens already fed, so an edit
+        only costs its new tokens.
+
+        Returns:
+            The number of tokens reused
+
+        Raises:
+            ValueError: If one of the new tokens fails; the session is left at
+                        the state before it
+        """
+        tokens = expression.split()
+        path = self._path
+        limit = min(len(tokens), len(path) - 1)
+
+        shared = 0
+        while shared < limit:
+            snapshot = path[shared + 1]
+            if snapshot.token != tokens[shared]:
+                break
+            if snapshot.version is not None and snapshot.version != self._version:
+                # Computed with variables that have been rebound since
+                break
+            shared += 1
+
+        del path[shared + 1:]
+        self.feed(tokens[shared:])
+        return shared
+
+    def result(self) -> Any:
+        """
+        Return the value of the expression fed so far.
+
+        Raises:
+            ValueError: If the stack does not hold exactly one value
+        """
+        depth = self.depth
+        if depth == 0:
+            raise ValueError("Expression cannot be empty")
+        if depth > 1:
+            raise ValueError("Invalid expression: too many operands")
+        return self.state._top.value
+
+    def operations(self) -> List[Dict[str, Any]]:
+        """
+        Return the operations log of the tokens fed so far.
+        """
+        return [snapshot.entry for snapshot in self._path[1:] if snapshot.entry is not None]
+
+    def snapshot(self) -> Snapshot:
+        """
+        Capture the current state in O(1).
+        """
+        return self.state
+
+    def rollback(self, snapshot: Snapshot) -> None:
+        """
+        Return to a captured state.
+
+        Rolling back along the current branch only drops the later states;
+        a snapshot from another branch rebuilds the path from its parents.
+        """
+        path = self._path
+        if snapshot.position < len(path) and path[snapshot.position] is snapshot:
+            del path[snapshot.position + 1:]
+            return
+
+        rebuilt = []
+        while snapshot is not None:
+            rebuilt.append(snapshot)
+            snapshot = snapshot.parent
+        if rebuilt[-1] is not self._root:
+            raise ValueError("Snapshot belongs to another session")
+        rebuilt.reverse()
+        self._path = rebuilt
+
+    def clear(self) -> None:
+        """
+        Empty the stack and forget the tokens fed, keeping bound variables.
+        """
+        self._path = [self._root]
+
+    def evaluate(
+        self,
+        expression: str,
+        variables: Optional[Dict[str, Any]] = None,
+        trace: TraceLevel = TraceLevel.FULL
+    ) -> Dict[str, Any]:
+        """
+        Evaluate a whole expression with the session's variables, leaving the
+        stack untouched. Variables passed here override the session's.
+        """
+        return self.calculator.calculate(expression, self.bindings(variables), trace)
+
+    def bindings(self, variables: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Return the session's variables overridden by the given ones, or None
+        when nothing is bound.
+
+        Raises:
+            ValueError: If a given value is not a number
+        """
+        for name, value in (variables or {}).items():
+            check_number(value, f"Variable {name}")
+        bound = dict(self.variables, **variables) if variables else self.variables
+        return bound or None
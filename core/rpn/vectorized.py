@@ -0,0 +1,423 @@
+"""
+Vectorized batch evaluation of RPN expressions with NumPy.
+
+Expressions that share the same shape (the same operators in the same order,
+differing only in their numeric literals) are grouped into a template. Each
+template is compiled once and evaluated over a stack of operand arrays, so a
+batch of N rows costs one pass per token instead of N interpreter passes.
+"""
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import math
+
+import numpy as np
+
+from core.rpn.cache import LRUCache
+from core.rpn.calculator import RPNCalculator
+from core.rpn.compiler import (
+    CompiledProgram, ExpressionError, TraceLevel, unbound_variable_error, unused_value_position, is_variable,
+    parse_literal
+)
+
+# Marker used in template keys for a literal operand slot
+SLOT = "#"
+
+# Instruction marker for a variable column
+VARIABLE = "$"
+
+# Largest n for which n! fits in a float64
+_FACTORIALS = np.array([float(math.factorial(i)) for i in range(171)])
+
+# Integers beyond this magnitude are not all representable in a float64,
+# while the scalar calculator computes them exactly
+MAX_EXACT_INTEGER = 2.0 ** 53
+
+
+def _factorial(a):
+    # Clip as floats before casting: huge values and inf wrap as int64
+    n = np.clip(np.nan_to_num(a, nan=0.0), 0, 170).astype(np.int64)
+    return np.where(a <= 170, _FACTORIALS[n], np.inf)
+
+
+def _inexact(values: np.ndarray) -> np.ndarray:
+    # Finite values too large for float64 to hold every integer exactly
+    magnitudes = np.abs(values)
+    return (magnitudes > MAX_EXACT_INTEGER) & (magnitudes != np.inf)
+
+
+# Vectorized implementation of each operator and the domain checks that
+# mirror the scalar calculator, as (mask of invalid rows, error message).
+UFUNCS = {
+    "+": np.add,
+    "-": np.subtract,
+    "*": np.multiply,
+    "/": np.divide,
+    "^": np.power,
+    "%": np.mod,
+    "sqrt": np.sqrt,
+    "sin": lambda a: np.sin(np.radians(a)),
+    "cos": lambda a: np.cos(np.radians(a)),
+    "tan": lambda a: np.tan(np.radians(a)),
+    "log": np.log10,
+    "ln": np.log,
+    "!": _factorial
+}
+
+DOMAIN_CHECKS = {
+    "/": lambda a, b: (b == 0, "Division by zero is not allowed"),
+    "%": lambda a, b: (b == 0, "Modulo by zero is not allowed"),
+    "^": lambda a, b: ((a < 0) & (b != np.floor(b)), "Result is not a real number"),
+    "sqrt": lambda a: (a < 0, "Cannot calculate square root of a negative number"),
+    "log": lambda a: (a <= 0, "Cannot calculate logarithm of zero or negative number"),
+    "ln": lambda a: (a <= 0, "Cannot calculate logarithm of zero or negative number"),
+    "!": lambda a: (
+        (a < 0) | (a != np.floor(a)) | ~np.isfinite(a), "Factorial is only defined for non-negative integers"
+    )
+}
+
+ARITY = RPNCalculator().arity
+
+OVERFLOW_ERROR = "Numerical result out of range"
+
+
+def split_template(expression: str, operations: Dict[str, Any]) -> Tuple[Tuple[str, ...], List[float]]:
+    """
+    Split an expression into its template key and literal operand values.
+
+    Raises:
+        ExpressionError: If the expression is empty or contains an invalid
+                         token
+    """
+    tokens = expression.strip().split()
+
+    if not tokens:
+        raise ExpressionError("Expression cannot be empty")
+
+    key = []
+    values = []
+    for position, token in enumerate(tokens, 1):
+        if token in operations:
+            key.append(token)
+            continue
+
+        value = parse_literal(token)
+        if value is not None:
+            key.append(SLOT)
+            values.append(value)
+        elif is_variable(token):
+            key.append(token)
+        else:
+            raise ExpressionError(f"Invalid token: {token}", position)
+    return tuple(key), values
+
+
+class BatchResult:
+    """
+    Results of evaluating one template over many rows.
+
+    Attributes:
+        results: float64 array of results (undefined where failed is True)
+        failed: Boolean mask of rows that raised an error
+        errors: Object array holding the first error message of each failed row
+        inexact: Boolean mask of rows with an operand or intermediate result
+                 beyond MAX_EXACT_INTEGER, whose results (or errors) may
+                 differ from the scalar calculator's
+        steps: Per-operator (token, operand arrays, result array) when traced
+    """
+
+    def __init__(self, results, failed, errors, steps=None, inexact=None):
+        self.results = results
+        self.failed = failed
+        self.errors = errors
+        self.inexact = inexact if inexact is not None else np.zeros(len(results), dtype=bool)
+        self.steps = steps
+
+    def __len__(self) -> int:
+        return len(self.results)
+
+    def operations(self, row: int) -> List[Dict[str, Any]]:
+        """
+        Rebuild the scalar-style operations log for a single row.
+        """
+        if self.steps is None:
+            return []
+        return [
+            {
+                "operator": token,
+                "operands": [float(operand[row]) for operand in operands],
+                "result": float(result[row])
+            }
+            for token, operands, result in self.steps
+        ]
+
+
+class VectorizedProgram:
+    """
+    A compiled template that evaluates over arrays of literal operands and
+    variable columns.
+    """
+
+    __slots__ = ("template", "instructions", "slots", "variables", "summary")
+
+    def __init__(self, template: Tuple[str, ...], arity: Dict[str, int]):
+        self.template = template
+        self.instructions = []
+        self.slots = 0
+        self.variables = []
+
+        operator_counts: Dict[str, int] = {}
+        depth = 0
+        max_depth = 0
+        # Templates keep the token positions of the expressions they match
+        for position, token in enumerate(template, 1):
+            if token == SLOT or token not in arity:
+                if token == SLOT:
+                    self.instructions.append((SLOT, self.slots))
+                    self.slots += 1
+                else:
+                    self.instructions.append((VARIABLE, token))
+                    if token not in self.variables:
+                        self.variables.append(token)
+                depth += 1
+                max_depth = max(max_depth, depth)
+                continue
+
+            required_operands = arity[token]
+            if depth < required_operands:
+                raise ExpressionError(f"Insufficient operands for operator '{token}'", position)
+            self.instructions.append((token, required_operands))
+            depth -= required_operands - 1
+            operator_counts[token] = operator_counts.get(token, 0) + 1
+
+        if depth != 1:
+            raise ExpressionError(
+                f"Invalid expression: too many operands, {depth} values left",
+                unused_value_position(template, arity)
+            )
+
+        # Shared by every row evaluated with this template
+        self.summary = {
+            "steps": sum(operator_counts.values()),
+            "operators": operator_counts,
+            "max_depth": max_depth
+        }
+
+    def evaluate(
+        self,
+        operands: np.ndarray,
+        trace: bool = False,
+        variables: Optional[Dict[str, np.ndarray]] = None
+    ) -> BatchResult:
+        """
+        Evaluate the program over a (rows, slots) array of literal operands.
+
+        Args:
+            operands: Literal values for every row, one column per slot
+            trace: Keep per-operator arrays so operations logs can be rebuilt
+            variables: One array of values per variable, each of length rows
+
+        Returns:
+            A BatchResult with per-row results and errors
+
+        Raises:
+            ValueError: If a variable is unbound
+        """
+        for name in self.variables:
+            if not variables or name not in variables:
+                raise unbound_variable_error(name, self.template, bool(variables))
+
+        rows = operands.shape[0]
+        failed = np.zeros(rows, dtype=bool)
+        inexact = np.zeros(rows, dtype=bool)
+        errors = np.full(rows, None, dtype=object)
+        steps = [] if trace else None
+        stack = []
+
+        with np.errstate(all="ignore"):
+            for token, arg in self.instructions:
+                if token == SLOT or token == VARIABLE:
+                    values = operands[:, arg] if token == SLOT else variables[arg]
+                    inexact |= _inexact(values)
+                    stack.append(values)
+                    continue
+
+                args = stack[-arg:]
+                del stack[-arg:]
+
+                check = DOMAIN_CHECKS.get(token)
+                if check is not None:
+                    invalid, message = check(*args)
+                    newly_failed = invalid & ~failed
+                    errors[newly_failed] = message
+                    failed |= newly_failed
+
+                result = UFUNCS[token](*args)
+
+                # Flag overflow that the scalar path would raise on
+                finite_inputs = np.logical_and.reduce([np.isfinite(a) for a in args])
+                overflow = ~np.isfinite(result) & finite_inputs & ~failed
+                errors[overflow] = OVERFLOW_ERROR
+                failed |= overflow
+
+                inexact |= _inexact(result)
+                if trace:
+                    steps.append((token, args, result))
+                stack.append(result)
+
+        return BatchResult(stack[0], failed, errors, steps, inexact)
+
+
+class BatchEvaluator:
+    """
+    Evaluates many RPN expressions at once using NumPy.
+
+    Rows are grouped by template and each group runs as a single vectorized
+    program. Templates using operators without a vectorized implementation,
+    and rows whose values leave the range where float64 integers are exact,
+    fall back to the scalar calculator.
+    """
+
+    def __init__(self, calculator: Optional[RPNCalculator] = None, cache_size: int = 256):
+        self.calculator = calculator or RPNCalculator()
+        self.program_cache = LRUCache(cache_size)
+
+    def compile(self, template: Tuple[str, ...]) -> VectorizedProgram:
+        """
+        Compile a template, reusing a cached program when available.
+        """
+        program = self.program_cache.get(template)
+        if program is None:
+            program = VectorizedProgram(template, self.calculator.arity)
+            self.program_cache.put(template, program)
+        return program
+
+    def evaluate(
+        self,
+        expressions: Sequence[str],
+        trace: TraceLevel = TraceLevel.NONE
+    ) -> List[Dict[str, Any]]:
+        """
+        Evaluate a batch of expressions, preserving input order.
+
+        Args:
+            expressions: RPN expressions to evaluate
+            trace: FULL includes a per-row operations log and SUMMARY the
+                   template's operator counts; NONE returns results only
+
+        Returns:
+            One dictionary per expression with either "result" (plus
+            "operations" or "summary" depending on trace) or "error"
+        """
+        trace = TraceLevel(trace)
+        full = trace == TraceLevel.FULL
+        output: List[Optional[Dict[str, Any]]] = [None] * len(expressions)
+        groups: Dict[Tuple[str, ...], Tuple[List[int], List[List[float]]]] = {}
+
+        for index, expression in enumerate(expressions):
+            try:
+                template, values = split_template(expression, self.calculator.operations)
+            except ValueError as e:
+                output[index] = {"expression": expression, "error": str(e)}
+                continue
+            indices, rows = groups.setdefault(template, ([], []))
+            indices.append(index)
+            rows.append(values)
+
+        for template, (indices, rows) in groups.items():
+            if any(token in self.calculator.operations and token not in UFUNCS for token in template):
+                for index in indices:
+                    output[index] = self._evaluate_scalar(expressions[index], trace)
+                continue
+
+            try:
+                program = self.compile(template)
+            except ValueError as e:
+                for index in indices:
+                    output[index] = {"expression": expressions[index], "error": str(e)}
+                continue
+
+            operands = np.array(rows, dtype=np.float64).reshape(len(rows), program.slots)
+            too_large = self._oversized_rows(operands)
+            try:
+                batch = program.evaluate(operands, trace=full)
+            except ValueError as e:
+                for index in indices:
+                    output[index] = {"expression": expressions[index], "error": str(e)}
+                continue
+
+            for row, index in enumerate(indices):
+                if too_large is not None and too_large[row]:
+                    message = f"Operand exceeds the maximum magnitude of {self.calculator.limits.max_operand:g}"
+                    output[index] = {"expression": expressions[index], "error": message}
+                    continue
+                if batch.inexact[row]:
+                    output[index] = self._evaluate_scalar(expressions[index], trace)
+                    continue
+                if batch.failed[row]:
+                    output[index] = {"expression": expressions[index], "error": batch.errors[row]}
+                    continue
+                item = {"expression": expressions[index], "result": float(batch.results[row])}
+                if full:
+                    item["operations"] = batch.operations(row)
+                elif trace == TraceLevel.SUMMARY:
+                    item["summary"] = program.summary
+                output[index] = item
+
+        return output
+
+    def _oversized_rows(self, operands: np.ndarray) -> Optional[np.ndarray]:
+        # Mirror the scalar calculator's operand limit for literal slots
+        limits = self.calculator.limits
+        if limits is None or limits.max_operand is None or operands.shape[1] == 0:
+            return None
+        too_large = (np.abs(operands) > limits.max_operand).any(axis=1)
+        return too_large if too_large.any() else None
+
+    def _evaluate_scalar(self, expression: str, trace: TraceLevel) -> Dict[str, Any]:
+        try:
+            calc_result = self.calculator.calculate(expression, trace=trace)
+        except Exception as e:
+            return {"expression": expression, "error": str(e)}
+
+        item = {"expression": expression, "result": calc_result["result"]}
+        if trace == TraceLevel.FULL:
+            item["operations"] = calc_result["operations"]
+        elif trace == TraceLevel.SUMMARY:
+            item["summary"] = calc_result["summary"]
+        return item
+
+
+def evaluate_columns(program: CompiledProgram, columns: Dict[str, Sequence[Any]], rows: int) -> List[float]:
+    """
+    Evaluate a compiled program over columns of variable bindings.
+
+    Args:
+        program: The compiled program to evaluate
+        columns: One sequence of values per variable
+        rows: Number of rows in every column
+
+    Returns:
+        The result of every row
+
+    Raises:
+        ValueError: If any row fails, naming the first failing row
+    """
+    template, values = split_template(program.expression, UFUNCS)
+    vectorized = VectorizedProgram(template, ARITY)
+
+    # Literals are the same on every row, so broadcast instead of copying
+    literals = np.array(values, dtype=np.float64)
+    operands = np.broadcast_to(literals, (rows, len(values)))
+    variables = {name: np.asarray(column, dtype=np.float64) for name, column in columns.items()}
+
+    batch = vectorized.evaluate(operands, variables=variables)
+    results = batch.results.tolist()
+    # Rows beyond float64's exact integers are evaluated exactly, row by row
+    for row in np.flatnonzero(batch.failed | batch.inexact).tolist():
+        if not batch.inexact[row]:
+            raise ValueError(f"Row {row}: {batch.errors[row]}")
+        try:
+            results[row] = program.evaluate(**{name: column[row] for name, column in columns.items()})
+        except Exception as e:
+            raise ValueError(f"Row {row}: {e}") from e
+    return results
@@ -10,4 +10,7 @@ setup(
     install_requires=[
         "sqlalchemy>=2.0.0",
     ],
+    extras_require={
+        "numpy": ["numpy>=1.21"],
+    },
 ) 
\ No newline at end of file
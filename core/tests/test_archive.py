@@ -0,0 +1,153 @@
+import asyncio
+import datetime
+import pytest
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from core.db.models import Base, Calculation, CalculationArchive
+from core.db.bulk import save_calculations
+from core.db.archive import (
+    ArchiveCompactor, compact_calculations, compress_rows, decompress_rows,
+    read_history, read_history_async
+)
+
+START = datetime.datetime(2024, 1, 1)
+
+def seed(session):
+    # Ten days of history for two users, three calculations per user and day
+    for day in range(10):
+        for user_id in ("alice", "bob"):
+            save_calculations(session, user_id, [
+                {
+                    "expression": f"{day} {i} +",
+                    "result": day + i,
+                    "operations": [{"operator": "+", "operands": [day, i], "result": day + i}],
+                    "timestamp": START + datetime.timedelta(days=day, hours=i)
+                }
+                for i in range(3)
+            ])
+
+@pytest.fixture
+def db_session():
+    """Create a session on an in-memory database with ten days of history."""
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine)
+    session = Session(engine)
+    seed(session)
+    try:
+        yield session
+    finally:
+        session.close()
+
+def fetch_all_pages(session, user_id=None, limit=7, include_operations=False):
+    rows = []
+    cursor = None
+    while True:
+        page, cursor = read_history(session, user_id, limit, cursor, include_operations)
+        rows.extend(page)
+        if cursor is None:
+            return rows
+
+def test_compress_round_trip():
+    rows = [{
+        "id": 1, "user_id": "alice", "expression": "3 4 +", "result": 7.0,
+        "timestamp": START, "operations": [{"operator": "+", "operands": [3, 4], "result": 7}]
+    }]
+    assert decompress_rows(compress_rows(rows)) == rows
+
+def test_compaction_moves_old_rows(db_session):
+    before = fetch_all_pages(db_session, include_operations=True)
+    
+    moved = compact_calculations(db_session, START + datetime.timedelta(days=6))
+    
+    assert moved == 36
+    assert db_session.scalar(select(func.count()).select_from(Calculation)) == 24
+    # One chunk per user and day
+    assert db_session.scalar(select(func.count()).select_from(CalculationArchive)) == 12
+    assert db_session.scalar(select(func.sum(CalculationArchive.row_count))) == 36
+    
+    # Nothing left to archive for the same cutoff
+    assert compact_calculations(db_session, START + datetime.timedelta(days=6)) == 0
+    
+    # History reads the same rows, in the same order, across both tiers
+    assert fetch_all_pages(db_session, include_operations=True) == before
+
+def test_history_across_tiers_by_user(db_session):
+    compact_calculations(db_session, START + datetime.timedelta(days=4))
+    
+    rows = fetch_all_pages(db_session, user_id="bob", limit=4)
+    
+    assert len(rows) == 30
+    assert {row["user_id"] for row in rows} == {"bob"}
+    keys = [(row["timestamp"], row["id"]) for row in rows]
+    assert keys == sorted(keys, reverse=True)
+    assert all("operations" not in row for row in rows)
+
+def test_history_fully_archived(db_session):
+    # Small batches split days across several chunks
+    assert compact_calculations(db_session, START + datetime.timedelta(days=30), batch_size=7) == 60
+    
+    page, cursor = read_history(db_session, limit=5)
+    
+    assert [row["timestamp"] for row in page] == sorted((row["timestamp"] for row in page), reverse=True)
+    assert page[0]["timestamp"] == START + datetime.timedelta(days=9, hours=2)
+    assert cursor is not None
+    assert len(fetch_all_pages(db_session)) == 60
+
+def test_invalid_cursor(db_session):
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        read_history(db_session, cursor="not-a-cursor")
+
+def test_read_history_async(tmp_path):
+    """Test the async reader against a file-backed SQLite database."""
+    path = tmp_path / "archive.db"
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        seed(session)
+        compact_calculations(session, START + datetime.timedelta(days=5))
+        expected = fetch_all_pages(session, user_id="alice")
+    engine.dispose()
+    
+    async def scenario():
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        rows = []
+        cursor = None
+        async with AsyncSession(async_engine) as db:
+            while True:
+                page, cursor = await read_history_async(db, "alice", 7, cursor)
+                rows.extend(page)
+                if cursor is None:
+                    break
+        await async_engine.dispose()
+        return rows
+    
+    pytest.importorskip("aiosqlite")
+    assert asyncio.run(scenario()) == expected
+
+def test_compactor_runs_in_background(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'compactor.db'}")
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+    with factory() as session:
+        seed(session)
+    
+    # Everything seeded is far older than the retention window
+    compactor = ArchiveCompactor(factory, retention_days=1, interval=60)
+    
+    async def scenario():
+        await compactor.start()
+        while compactor.runs == 0:
+            await asyncio.sleep(0.01)
+        await compactor.stop()
+    
+    asyncio.run(scenario())
+    
+    stats = compactor.stats()
+    assert stats["archived"] == 60
+    assert stats["failed_runs"] == 0
+    assert not stats["running"]
+    with factory() as session:
+        assert session.scalar(select(func.count()).select_from(Calculation)) == 0
+    engine.dispose()
@@ -0,0 +1,254 @@
+import pytest
+import math
+from core.rpn.calculator import RPNCalculator
+from core.rpn.cache import LRUCache
+from core.rpn.compiler import (
+    ExpressionError, Limits, MAX_FOLD_COST, estimate_cost, estimate_result_bits, validate_tokens
+)
+from core.logs import error_kind
+
+# Test compilation
+def test_compile_resolves_literals_and_depth():
+    calculator = RPNCalculator(fold_constants=False)
+    program = calculator.compile("3 4 2 * + pi *")
+    assert program.max_depth == 3
+    assert program.instructions[0][2] == 3
+    assert program.instructions[-2][2] == pytest.approx(math.pi)
+
+def test_compiled_program_matches_calculate():
+    calculator = RPNCalculator(cache_size=0)
+    program = calculator.compile("5 6 + 2 *")
+    assert program.run() == calculator.calculate("5 6 + 2 *")
+
+def test_compile_rejects_invalid_expressions():
+    calculator = RPNCalculator()
+    with pytest.raises(ValueError, match="Invalid token: 2x"):
+        calculator.compile("1 2x +")
+    with pytest.raises(ValueError, match="Insufficient operands"):
+        calculator.compile("1 +")
+    with pytest.raises(ValueError, match="too many operands"):
+        calculator.compile("1 2")
+
+def test_validation_reports_positions():
+    arity = RPNCalculator().arity
+    cases = [
+        ("1 2x +", "Invalid token: 2x (at token 2)", 2),
+        ("3 4 + * 5", "Insufficient operands for operator '*' (at token 4)", 4),
+        ("3 4 + 5", "Invalid expression: too many operands, 2 values left (at token 4)", 4),
+        ("1 2 3 4 + *", "Invalid expression: too many operands, 2 values left (at token 2)", 2),
+        ("", "Expression cannot be empty", None)
+    ]
+    for expression, message, position in cases:
+        with pytest.raises(ExpressionError) as excinfo:
+            validate_tokens(expression.split(), arity)
+        assert str(excinfo.value) == message
+        assert excinfo.value.position == position
+
+def test_validation_returns_literals():
+    assert validate_tokens("2 x + pi *".split(), RPNCalculator().arity) == [2, None, None, math.pi, None]
+
+def test_error_kind_leaves_out_the_position():
+    with pytest.raises(ExpressionError) as excinfo:
+        RPNCalculator().compile("1 2 3 +")
+    assert error_kind(excinfo.value) == "Invalid expression"
+
+def test_malformed_expressions_are_rejected_before_folding(monkeypatch):
+    calls = []
+    calculator = RPNCalculator()
+    factorial = calculator.operations["!"]
+    monkeypatch.setitem(calculator.operations, "!", lambda a: calls.append(a) or factorial(a))
+    for expression in ("300 ! 200 ! 100 !", "300 ! 200 ! + 1 + &", "300 ! * 2"):
+        with pytest.raises(ExpressionError):
+            calculator.compile(expression)
+    assert calls == []
+
+def test_runtime_errors_are_raised_on_each_run():
+    calculator = RPNCalculator()
+    for _ in range(2):
+        with pytest.raises(ValueError, match="Division by zero"):
+            calculator.calculate("5 0 /")
+
+# Test constant folding
+def test_literal_expression_folds_to_single_constant():
+    calculator = RPNCalculator()
+    program = calculator.compile("3 4 + 2 * sqrt")
+    assert len(program.instructions) == 1
+
+def test_folded_program_replays_operations_log():
+    folded = RPNCalculator().calculate("3 4 + 2 *")
+    unfolded = RPNCalculator(fold_constants=False).calculate("3 4 + 2 *")
+    assert folded == unfolded
+    assert [op["operator"] for op in folded["operations"]] == ["+", "*"]
+
+def test_folding_leaves_errors_for_evaluation():
+    calculator = RPNCalculator()
+    program = calculator.compile("5 0 / 1 +")
+    assert len(program.instructions) == 5
+    with pytest.raises(ValueError, match="Division by zero"):
+        program.run()
+
+# Test result memoization
+def test_result_memoization():
+    calculator = RPNCalculator(result_cache_size=10)
+    first = calculator.calculate("3 4 +")
+    first["operations"].clear()
+    second = calculator.calculate("3 4 +")
+    assert second["result"] == 7
+    assert len(second["operations"]) == 1
+    assert calculator.result_cache.stats()["hits"] == 1
+
+def test_result_memoization_is_memory_bounded():
+    calculator = RPNCalculator(result_cache_size=10, result_cache_bytes=2000)
+    for i in range(10):
+        calculator.calculate(f"{i} 1 + 2 * 3 -")
+    stats = calculator.result_cache.stats()
+    assert stats["bytes"] <= 2000
+    assert stats["evictions"] > 0
+
+# Test program cache
+def test_program_cache_hits_and_misses():
+    calculator = RPNCalculator()
+    first = calculator.compile("3 4 +")
+    second = calculator.compile("3 4 +")
+    assert first is second
+    stats = calculator.program_cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+def test_program_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert "a" in cache
+    assert "b" not in cache
+    assert cache.stats()["evictions"] == 1
+
+def test_program_cache_disabled():
+    calculator = RPNCalculator(cache_size=0)
+    calculator.calculate("3 4 +")
+    assert len(calculator.program_cache) == 0
+
+# Test variables
+def test_compile_collects_variables():
+    program = RPNCalculator().compile("x y + x *")
+    assert program.variables == ("x", "y")
+
+def test_evaluate_with_bindings():
+    program = RPNCalculator().compile("x y + 2 *")
+    assert program.evaluate(x=3, y=4) == 14
+    assert program.evaluate(x=1, y=1) == 4
+
+def test_unbound_variable():
+    calculator = RPNCalculator()
+    with pytest.raises(ValueError, match="Unbound variable: y"):
+        calculator.compile("x y +").evaluate(x=1)
+    with pytest.raises(ValueError, match="Unbound variable: x"):
+        calculator.calculate("x 1 +", variables={"y": 2})
+    with pytest.raises(ValueError, match="Unbound variable: y"):
+        calculator.compile("x y +").evaluate_many(x=[1, 2])
+
+def test_identifiers_are_invalid_tokens_without_bindings():
+    calculator = RPNCalculator()
+    with pytest.raises(ExpressionError, match=r"Invalid token: foo \(at token 2\)"):
+        calculator.calculate("1 foo +")
+    with pytest.raises(ExpressionError, match="Invalid token: x"):
+        calculator.compile("x 1 +").evaluate()
+    with pytest.raises(ExpressionError, match="Invalid token: x"):
+        calculator.compile("x 1 +").evaluate_many()
+
+def test_calculate_with_variables():
+    result = RPNCalculator().calculate("x 2 ^", variables={"x": 3})
+    assert result["result"] == 9
+    assert result["operations"][0]["operands"] == [3, 2]
+
+def test_constant_subtrees_fold_around_variables():
+    program = RPNCalculator().compile("x 2 3 * +")
+    assert len(program.instructions) == 3
+    assert program.evaluate(x=1) == 7
+
+def test_evaluate_many():
+    program = RPNCalculator().compile("x y + 2 *")
+    assert program.evaluate_many(x=[1, 2, 3], y=[4, 5, 6]) == [10, 14, 18]
+
+def test_evaluate_many_reports_failing_row():
+    program = RPNCalculator().compile("1 x /")
+    with pytest.raises(ValueError, match="Row 1: Division by zero"):
+        program.evaluate_many(x=[1, 0, 2])
+
+# Test trace levels
+def test_trace_none_returns_result_only():
+    result = RPNCalculator().calculate("3 4 + 2 *", trace="none")
+    assert result["result"] == 14
+    assert result["operations"] == []
+    assert "summary" not in result
+
+def test_trace_summary_counts_operators():
+    result = RPNCalculator(fold_constants=False).calculate("3 4 + 2 * 5 +", trace="summary")
+    assert result["operations"] == []
+    assert result["summary"] == {"steps": 3, "operators": {"+": 2, "*": 1}, "max_depth": 2}
+
+def test_trace_levels_are_memoized_separately():
+    calculator = RPNCalculator(result_cache_size=10)
+    calculator.calculate("3 4 +", trace="none")
+    result = calculator.calculate("3 4 +")
+    assert len(result["operations"]) == 1
+
+# Test limits and cost estimation
+def test_result_size_limit():
+    calculator = RPNCalculator(limits=Limits(max_result_bits=1000))
+    assert calculator.calculate("100 !")["result"] == math.factorial(100)
+    with pytest.raises(ValueError, match="Result is too large"):
+        calculator.calculate("500 !")
+    with pytest.raises(ValueError, match="Result is too large"):
+        calculator.calculate("10 x ^", variables={"x": 1000})
+
+def test_operand_limit():
+    calculator = RPNCalculator(limits=Limits(max_operand=1000))
+    assert calculator.calculate("999 -1000 +")["result"] == -1
+    with pytest.raises(ValueError, match="Operand exceeds the maximum magnitude of 1000"):
+        calculator.compile("1001 1 +")
+    with pytest.raises(ValueError, match="Operand exceeds"):
+        calculator.calculate("x 1 +", variables={"x": 5000})
+    with pytest.raises(ValueError, match="Operand exceeds"):
+        calculator.compile("x 1 +").evaluate_many(x=[1, 2, 5000])
+
+def test_check_operands_columns():
+    limits = Limits(max_operand=1000)
+    limits.check_operands([1, -1000, 2.5])
+    with pytest.raises(ValueError, match="Operand exceeds"):
+        limits.check_operands([1, -1001])
+    # Integers too large for a float array are checked one by one
+    with pytest.raises(ValueError, match="Operand exceeds"):
+        limits.check_operands([1, 10 ** 400])
+    Limits().check_operands([10 ** 400])
+
+def test_estimate_result_bits():
+    assert estimate_result_bits("!", [1000]) == pytest.approx(math.factorial(1000).bit_length(), abs=1)
+    assert estimate_result_bits("^", [10, 1000]) == pytest.approx((10 ** 1000).bit_length(), abs=1)
+    assert estimate_result_bits("*", [2 ** 100, 2 ** 50]) == 152
+    assert estimate_result_bits("^", [2.5, 1000]) is None
+    assert estimate_result_bits("+", [1, 2]) is None
+
+def test_expensive_literals_are_not_folded():
+    calculator = RPNCalculator()
+    cheap = calculator.compile("3 4 + 2 *")
+    expensive = calculator.compile("5000 !")
+    
+    assert cheap.cost == 1
+    assert len(expensive.instructions) == 2
+    assert expensive.cost > MAX_FOLD_COST
+
+def test_folding_stops_at_cost_budget():
+    power = estimate_cost("^", [2, 13000])
+    program = RPNCalculator().compile("2 13000 ^ 2 13000 ^ - 2 13000 ^ 2 13000 ^ - +")
+    
+    # Two powers fit the budget and fold; the other two are left for run time
+    assert 2 * power <= MAX_FOLD_COST < 3 * power
+    assert program.cost > 2 * power
+    assert program.evaluate() == 0
+
+def test_rejected_literals_are_cheap():
+    program = RPNCalculator(limits=Limits(max_result_bits=1000)).compile("10 100000 ^")
+    assert program.cost < 10
@@ -1,9 +1,11 @@
+import asyncio
 import pytest
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, func, select
 from sqlalchemy.orm import Session
 
 from core.db.models import Base, User, Calculation
-from core.db.db import init_db
+from core.db.db import init_db, to_async_url
+from core.db.bulk import ensure_user, save_calculations, save_calculations_async
 
 # Use in-memory SQLite for testing
 TEST_DB_URL = "sqlite:///:memory:"
@@ -65,4 +67,75 @@ def test_calculation_creation(db_session):
     assert retrieved_calc.result == 7
     assert retrieved_calc.user_id == "test_user"
     assert len(retrieved_calc.operations) == 1
-    assert retrieved_calc.operations[0]["operator"] == "+" 
\ No newline at end of file
+    assert retrieved_calc.operations[0]["operator"] == "+" 
+
+
+def test_ensure_user_is_idempotent(db_session):
+    """Test that upserting an existing user does not fail or duplicate it."""
+    ensure_user(db_session, "test_user")
+    ensure_user(db_session, "test_user")
+    db_session.commit()
+    
+    assert db_session.query(User).filter(User.id == "test_user").count() == 1
+
+def test_save_calculations_bulk(db_session):
+    """Test inserting a batch of calculations in one transaction."""
+    rows = [
+        {"expression": f"{i} 1 +", "result": i + 1, "operations": None}
+        for i in range(100)
+    ]
+    rows[0]["operations"] = [{"operator": "+", "operands": [0, 1], "result": 1}]
+    save_calculations(db_session, "bulk_user", rows)
+    
+    assert db_session.query(User).filter(User.id == "bulk_user").count() == 1
+    calculations = db_session.query(Calculation).order_by(Calculation.id).all()
+    assert len(calculations) == 100
+    assert calculations[0].operations[0]["operator"] == "+"
+    assert calculations[99].result == 100
+    assert all(calc.timestamp is not None for calc in calculations)
+
+def test_to_async_url():
+    """Test converting synchronous database URLs to async drivers."""
+    assert to_async_url("postgresql://u:p@db:5432/rpn") == "postgresql+asyncpg://u:p@db:5432/rpn"
+    assert to_async_url("postgresql+psycopg2://u:p@db/rpn") == "postgresql+asyncpg://u:p@db/rpn"
+    assert to_async_url("sqlite:///:memory:") == "sqlite+aiosqlite:///:memory:"
+
+def test_save_calculations_async(tmp_path):
+    """Test the async bulk persistence path with an AsyncSession."""
+    pytest.importorskip("aiosqlite")
+    from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+    
+    async def scenario():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'async.db'}")
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        async with AsyncSession(engine) as db:
+            await save_calculations_async(db, "async_user", [{"expression": "3 4 +", "result": 7}])
+            await save_calculations_async(db, "async_user", [{"expression": "1 1 +", "result": 2}])
+            users = await db.scalar(select(func.count()).select_from(User))
+            calculations = await db.scalar(select(func.count()).select_from(Calculation))
+        await engine.dispose()
+        return users, calculations
+    
+    assert asyncio.run(scenario()) == (1, 2)
+
+def test_memory_database_shared_by_sync_and_async_engines():
+    """Test that tables created by init_db are visible to async sessions on in-memory SQLite."""
+    pytest.importorskip("aiosqlite")
+    from core.db import db as database
+    
+    original = database.DATABASE_URL, dict(database._pool_options)
+    database.configure_database("sqlite://")
+    
+    async def scenario():
+        async with database.AsyncSessionLocal() as db:
+            await save_calculations_async(db, "memory_user", [{"expression": "3 4 +", "result": 7}])
+        await database.dispose_async_engine()
+    
+    try:
+        init_db()
+        asyncio.run(scenario())
+        with database.SessionLocal() as session:
+            assert session.query(Calculation).filter(Calculation.user_id == "memory_user").count() == 1
+    finally:
+        database.configure_database(original[0], **original[1])
@@ -0,0 +1,134 @@
+import json
+import logging
+import queue
+
+import pytest
+
+from core.logs import (
+    MAX_ERROR_KINDS, DroppingQueueHandler, JsonFormatter, SampledErrorLog, configure_logging, error_kind,
+    shutdown_logging
+)
+from core.rpn import RPNCalculator
+from core import metrics
+from core.rpn.calculator import error_log, record_error
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+@pytest.fixture
+def captured():
+    logger = logging.getLogger("test_logs.sampled")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    handler = ListHandler()
+    logger.addHandler(handler)
+    yield logger, handler.records
+    logger.removeHandler(handler)
+
+def test_error_kind_leaves_out_values():
+    assert error_kind(ValueError("Invalid token: foo")) == "Invalid token"
+    assert error_kind(ValueError("Division by zero is not allowed")) == "Division by zero is not allowed"
+    assert error_kind(ZeroDivisionError()) == "ZeroDivisionError"
+
+def test_logs_a_burst_per_kind_then_counts(captured, monkeypatch):
+    logger, records = captured
+    now = [100.0]
+    monkeypatch.setattr("core.logs.time.monotonic", lambda: now[0])
+    errors = SampledErrorLog(logger, burst=2, interval=10)
+
+    for i in range(5):
+        errors.record(f"{i} 0 /", ValueError("Division by zero is not allowed"))
+    errors.record("1 &", ValueError("Invalid token: &"))
+
+    assert len(records) == 3
+    assert errors.counts() == {"Division by zero is not allowed": 5, "Invalid token": 1}
+    assert errors.suppressed == 3
+    assert records[0].error_kind == "Division by zero is not allowed"
+    assert records[0].expression == "0 0 /"
+
+    # The next window reports what the previous one suppressed
+    now[0] += 10
+    errors.record("9 0 /", ValueError("Division by zero is not allowed"))
+    assert len(records) == 4
+    assert records[-1].suppressed == 3
+    assert "3 similar errors suppressed" in records[-1].getMessage()
+
+def test_disabled_logger_only_counts(captured):
+    logger, records = captured
+    logger.setLevel(logging.CRITICAL)
+    errors = SampledErrorLog(logger)
+    errors.record("1 0 /", ValueError("Division by zero is not allowed"))
+    assert records == []
+    assert errors.counts() == {"Division by zero is not allowed": 1}
+
+def test_kinds_are_bounded(captured):
+    logger, _ = captured
+    errors = SampledErrorLog(logger, burst=0)
+    for i in range(MAX_ERROR_KINDS + 5):
+        errors.record("x", ValueError(f"Kind {i}"))
+    counts = errors.counts()
+    assert len(counts) == MAX_ERROR_KINDS + 1
+    assert counts["other"] == 5
+
+def test_long_expressions_are_truncated(captured):
+    logger, records = captured
+    SampledErrorLog(logger).record("1 " * 1000, ValueError("Invalid expression: too many operands"))
+    assert len(records[0].expression) < 300
+
+def test_calculator_records_errors():
+    before = error_log.counts().get("Invalid token", 0)
+    with pytest.raises(ValueError):
+        RPNCalculator().calculate("1 &")
+    assert error_log.counts()["Invalid token"] == before + 1
+
+def test_record_error_counts_failures_outside_calculate(monkeypatch):
+    monkeypatch.setattr(metrics.registry, "enabled", True)
+    errors = metrics.CALCULATIONS.value("error")
+    before = error_log.counts().get("Unbalanced", 0)
+    record_error("1 +", ValueError("Unbalanced: 1 +"))
+    assert metrics.CALCULATIONS.value("error") == errors + 1
+    assert error_log.counts()["Unbalanced"] == before + 1
+
+def test_queue_handler_drops_when_full():
+    handler = DroppingQueueHandler(queue.Queue(2))
+    for i in range(5):
+        handler.handle(logging.makeLogRecord({"msg": f"record {i}"}))
+    assert handler.queue.qsize() == 2
+    assert handler.dropped == 3
+
+def test_json_formatter_includes_extra_fields():
+    record = logging.makeLogRecord({
+        "name": "rpn", "levelname": "ERROR", "msg": "failed %s", "args": ("x",), "error_kind": "Invalid token"
+    })
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "failed x"
+    assert entry["error_kind"] == "Invalid token"
+    assert entry["level"] == "ERROR"
+
+def test_configure_logging_writes_from_a_thread():
+    root = logging.getLogger()
+    level = root.level
+    handler = ListHandler()
+    original = list(root.handlers)
+    for existing in original:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    try:
+        listener = configure_logging("warning")
+        assert root.level == logging.WARNING
+        assert handler not in root.handlers
+        logging.getLogger("test_logs.queued").warning("queued %d", 1)
+        shutdown_logging()
+        assert [record.getMessage() for record in handler.records] == ["queued 1"]
+        assert handler in root.handlers
+        assert listener._thread is None
+    finally:
+        root.removeHandler(handler)
+        for existing in original:
+            root.addHandler(existing)
+        root.setLevel(level)
@@ -0,0 +1,90 @@
+import pytest
+from sqlalchemy import create_engine, text
+
+from core import metrics
+from core.metrics import MetricsRegistry, start_timings, timed
+from core.db.timing import QUERY_SECONDS, instrument_queries
+from core.rpn import RPNCalculator
+
+@pytest.fixture
+def enabled():
+    metrics.registry.enabled = True
+    yield metrics.registry
+    metrics.registry.enabled = False
+
+def test_render_format():
+    registry = MetricsRegistry(enabled=True)
+    counter = registry.counter("jobs_total", "Jobs run", ["kind"])
+    counter.inc(1, "a")
+    counter.inc(2, "a")
+    counter.update({"b": 5})
+    histogram = registry.histogram("job_seconds", "Job time", buckets=(0.1, 1.0))
+    histogram.observe(0.05)
+    histogram.observe(0.1)
+    histogram.observe(3)
+    registry.register_collector(lambda: [
+        ("queue_depth", "gauge", "Queued jobs", {"queue": 'x"y'}, 4),
+        ("skipped", "gauge", "Unavailable", {}, None)
+    ])
+    
+    lines = registry.render().splitlines()
+    assert "# TYPE jobs_total counter" in lines
+    assert 'jobs_total{kind="a"} 3' in lines
+    assert 'jobs_total{kind="b"} 5' in lines
+    assert 'job_seconds_bucket{le="0.1"} 2' in lines
+    assert 'job_seconds_bucket{le="1"} 2' in lines
+    assert 'job_seconds_bucket{le="+Inf"} 3' in lines
+    assert "job_seconds_count 3" in lines
+    assert "job_seconds_sum 3.15" in lines
+    assert 'queue_depth{queue="x\\"y"} 4' in lines
+    assert not any(line.startswith("skipped") for line in lines)
+    
+    # Registering the same name returns the existing metric
+    assert registry.counter("jobs_total", "Jobs run", ["kind"]) is counter
+
+def test_calculator_disabled_records_nothing():
+    calculations = metrics.CALCULATIONS.value("ok")
+    RPNCalculator().calculate("3 4 +")
+    assert metrics.CALCULATIONS.value("ok") == calculations
+
+def test_calculator_instrumentation(enabled):
+    calculator = RPNCalculator()
+    ok = metrics.CALCULATIONS.value("ok")
+    errors = metrics.CALCULATIONS.value("error")
+    additions = metrics.OPERATORS.value("+")
+    parses = metrics.PARSE_SECONDS.count()
+    
+    timings = start_timings()
+    calculator.calculate("x 4 + 2 + sqrt", variables={"x": 10})
+    with pytest.raises(ValueError):
+        calculator.calculate("1 0 /")
+    
+    assert metrics.CALCULATIONS.value("ok") == ok + 1
+    assert metrics.CALCULATIONS.value("error") == errors + 1
+    assert metrics.OPERATORS.value("+") == additions + 2
+    assert metrics.PARSE_SECONDS.count() == parses + 2
+    assert set(timings) == {"parse", "evaluate"}
+
+def test_timed(enabled):
+    histogram = enabled.histogram("test_block_seconds", "Test block")
+    timings = start_timings()
+    with timed(histogram, "block"):
+        pass
+    assert histogram.count() == 1
+    assert timings["block"] >= 0
+
+def test_query_timing(enabled):
+    instrument_queries()
+    instrument_queries()
+    engine = create_engine("sqlite:///:memory:")
+    selects = QUERY_SECONDS.count("SELECT")
+    
+    timings = start_timings()
+    with engine.connect() as connection:
+        connection.execute(text("select 1"))
+        connection.execute(text("pragma user_version"))
+    
+    # Counted once even though instrument_queries was called twice
+    assert QUERY_SECONDS.count("SELECT") == selects + 1
+    assert QUERY_SECONDS.count("OTHER") >= 1
+    assert timings["db"] > 0
@@ -0,0 +1,92 @@
+import asyncio
+import pytest
+
+from core.rpn import Limits, TraceLevel
+from core.rpn.parallel import EvaluationTimeout, IsolatedCalculator, ParallelEvaluator, evaluate_chunk
+
+EXPRESSIONS = [f"{i} 2 *" for i in range(40)] + ["1 0 /", "2x", "3 4 + sqrt"]
+
+@pytest.fixture(scope="module")
+def evaluator():
+    """A two-process evaluator with small chunks, shared by the module."""
+    evaluator = ParallelEvaluator(max_workers=2, chunk_size=7)
+    try:
+        yield evaluator
+    finally:
+        evaluator.shutdown()
+
+def test_evaluate_chunk():
+    results = evaluate_chunk(["3 4 +", "1 0 /"], TraceLevel.FULL)
+    assert results[0]["result"] == 7
+    assert results[0]["operations"][0]["operator"] == "+"
+    assert results[1]["error"] == "Division by zero is not allowed"
+
+def test_order_and_errors_match_in_process(evaluator):
+    results = evaluator.evaluate(EXPRESSIONS)
+    
+    assert results == evaluate_chunk(EXPRESSIONS)
+    assert [item["expression"] for item in results] == EXPRESSIONS
+    assert results[5]["result"] == 10
+    assert results[40]["error"] == "Division by zero is not allowed"
+    assert results[41]["error"] == "Invalid token: 2x (at token 1)"
+    assert evaluator.stats()["started"]
+
+def test_evaluate_async(evaluator):
+    results = asyncio.run(evaluator.evaluate_async(EXPRESSIONS, TraceLevel.SUMMARY))
+    
+    assert results == evaluate_chunk(EXPRESSIONS, TraceLevel.SUMMARY)
+    assert results[0]["summary"]["steps"] == 1
+
+def test_small_batches_stay_in_process():
+    evaluator = ParallelEvaluator(max_workers=4, chunk_size=100)
+    
+    assert evaluator.evaluate(["3 4 +"])[0]["result"] == 7
+    assert asyncio.run(evaluator.evaluate_async(["5 1 -"]))[0]["result"] == 4
+    assert not evaluator.stats()["started"]
+
+def test_failed_chunk_is_isolated(evaluator):
+    class Unpicklable(str):
+        def __reduce__(self):
+            raise TypeError("cannot pickle expression")
+    
+    expressions = [f"{i} 1 +" for i in range(14)]
+    expressions[9] = Unpicklable("9 1 +")
+    failed_before = evaluator.failed_chunks
+    
+    results = evaluator.evaluate(expressions)
+    
+    # Only the second chunk (rows 7-13) fails
+    assert [item["result"] for item in results[:7]] == [i + 1 for i in range(7)]
+    assert all(item["error"] == "cannot pickle expression" for item in results[7:])
+    assert evaluator.failed_chunks == failed_before + 1
+
+def test_isolated_calculator():
+    calculator = IsolatedCalculator(max_workers=1, timeout=30, limits=Limits(max_result_bits=1000))
+    
+    async def scenario():
+        result = await calculator.calculate("3 4 +")
+        with pytest.raises(ValueError, match="Result is too large"):
+            await calculator.calculate("500 !")
+        return result
+    
+    try:
+        assert asyncio.run(scenario())["result"] == 7
+    finally:
+        calculator.shutdown()
+
+def test_isolated_calculator_timeout():
+    calculator = IsolatedCalculator(max_workers=1, timeout=0.5)
+    
+    async def scenario():
+        # Warm the worker so the timeout only covers evaluation
+        await calculator.calculate("1 1 +")
+        with pytest.raises(EvaluationTimeout, match="timed out after 0.5 seconds"):
+            await calculator.calculate("10 100000000 ^", trace="none")
+        # The pool is replaced after the runaway worker is terminated
+        return await calculator.calculate("2 2 *")
+    
+    try:
+        assert asyncio.run(scenario())["result"] == 4
+        assert calculator.stats()["timeouts"] == 1
+    finally:
+        calculator.shutdown()
@@ -0,0 +1,65 @@
+import logging
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import StaticPool
+
+from core.db.pool import TimedQueuePool, engine_options, pool_stats, shared_memory_url
+
+def test_sqlite_memory_uses_static_pool():
+    """Test that in-memory SQLite shares one connection."""
+    options = engine_options("sqlite:///:memory:", pool_size=20)
+    assert options["poolclass"] is StaticPool
+    assert "pool_size" not in options
+
+def test_postgres_options():
+    """Test pool sizing and statement timeout for PostgreSQL."""
+    options = engine_options(
+        "postgresql://u:p@db/rpn", pool_size=20, max_overflow=5,
+        pool_pre_ping=True, statement_timeout_ms=2000
+    )
+    assert options["poolclass"] is TimedQueuePool
+    assert options["pool_size"] == 20
+    assert options["max_overflow"] == 5
+    assert options["pool_pre_ping"] is True
+    assert options["connect_args"] == {"options": "-c statement_timeout=2000"}
+    
+    async_options = engine_options("postgresql+asyncpg://u:p@db/rpn", statement_timeout_ms=2000, is_async=True)
+    assert async_options["connect_args"] == {"server_settings": {"statement_timeout": "2000"}}
+
+def test_pool_stats_track_checkouts(tmp_path):
+    """Test checkout counters on a file-backed SQLite pool."""
+    url = f"sqlite:///{tmp_path / 'pool.db'}"
+    engine = create_engine(url, **engine_options(url, pool_size=2, max_overflow=1))
+    
+    first = engine.connect()
+    second = engine.connect()
+    first.execute(text("select 1"))
+    stats = pool_stats(engine.pool)
+    assert stats["size"] == 2
+    assert stats["checked_out"] == 2
+    assert stats["checkouts"] == 2
+    
+    first.close()
+    second.close()
+    stats = pool_stats(engine.pool)
+    assert stats["checked_out"] == 0
+    assert stats["checked_in"] == 2
+    engine.dispose()
+
+def test_shared_memory_url():
+    """Test that unnamed in-memory SQLite gets a shared-cache name."""
+    url = shared_memory_url("sqlite://")
+    assert url.startswith("sqlite:///file:rpn-")
+    assert "mode=memory" in url and "cache=shared" in url and "uri=true" in url
+    assert url != shared_memory_url("sqlite:///:memory:")
+    assert engine_options(url)["poolclass"] is StaticPool
+    assert shared_memory_url("sqlite:////tmp/rpn.db") == "sqlite:////tmp/rpn.db"
+    assert shared_memory_url("postgresql://u:p@db/rpn") == "postgresql://u:p@db/rpn"
+
+def test_timed_pools_log_under_sqlalchemy(tmp_path):
+    """Test that the timed pools stay quiet at the application's INFO level."""
+    url = f"sqlite:///{tmp_path / 'pool.db'}"
+    engine = create_engine(url, **engine_options(url))
+    assert engine.pool.logger.name.startswith("sqlalchemy.pool.")
+    assert not engine.pool.logger.isEnabledFor(logging.INFO)
+    engine.dispose()
@@ -0,0 +1,133 @@
+import pytest
+
+from core.rpn import Limits, PrefixCache, RPNCalculator, TraceLevel
+
+def make_calculator(**kwargs):
+    kwargs.setdefault("prefix_cache_bytes", 1024 * 1024)
+    kwargs.setdefault("prefix_cache_min_cost", 0)
+    return RPNCalculator(**kwargs)
+
+def test_matches_compiled_evaluation():
+    cached = make_calculator()
+    plain = RPNCalculator()
+    expressions = ["3 4 + 2 *", "3 4 + 2 /", "5 1 2 + 4 * + 3 -", "2 3 ^ !", "pi 2 / sin", "3 4 +"]
+    
+    for expression in expressions:
+        for trace in TraceLevel:
+            assert cached.calculate(expression, trace=trace) == plain.calculate(expression, trace=trace)
+
+def test_reuses_longest_prefix():
+    calculator = make_calculator()
+    calculator.calculate("20 ! 3 +")
+    calculator.calculate("20 ! 3 -")
+    calculator.calculate("20 ! 3 - 2 *")
+    
+    stats = calculator.prefix_cache.stats()
+    assert stats["lookups"] == 3
+    assert stats["tokens"] == 14
+    # "20 ! 3", then "20 ! 3 -"
+    assert stats["reused_tokens"] == 3 + 4
+    assert stats["reuse_ratio"] == pytest.approx(7 / 14)
+
+def test_skips_recomputing_prefix():
+    calls = []
+    calculator = make_calculator()
+    factorial = calculator.operations["!"]
+    calculator.operations["!"] = lambda a: calls.append(a) or factorial(a)
+    
+    assert calculator.calculate("30 ! 7 %")["result"] == 0
+    result = calculator.calculate("30 ! 31 %", trace="full")
+    
+    assert result["result"] == 30
+    assert result["operations"][0] == {"operator": "!", "operands": [30], "result": factorial(30)}
+    assert calls == [30]
+
+def test_cached_operations_are_copied():
+    calculator = make_calculator()
+    calculator.calculate("3 4 +")["operations"][0]["operands"].append(99)
+    assert calculator.calculate("3 4 +")["operations"][0]["operands"] == [3, 4]
+
+def test_errors():
+    calculator = make_calculator()
+    # Validation still runs before any arithmetic
+    with pytest.raises(ValueError, match="Invalid token: &"):
+        calculator.calculate("1 0 / &")
+    with pytest.raises(ValueError, match="Division by zero is not allowed"):
+        calculator.calculate("1 2 + 0 /")
+    
+    # The prefix before the failing operator was cached
+    assert calculator.calculate("1 2 + 3 /")["result"] == 1
+    assert calculator.prefix_cache.stats()["reused_tokens"] == 3
+
+def test_limits():
+    calculator = make_calculator(limits=Limits(max_result_bits=100))
+    with pytest.raises(ValueError, match="Result is too large"):
+        calculator.calculate("50 ! 1 +")
+
+def test_variables_bypass_cache():
+    calculator = make_calculator()
+    assert calculator.calculate("x 2 *", variables={"x": 4})["result"] == 8
+    assert calculator.prefix_cache.stats()["lookups"] == 0
+
+def test_eviction_is_bounded():
+    cache = PrefixCache(max_bytes=5000)
+    calculator = make_calculator()
+    calculator.prefix_cache = cache
+    
+    for i in range(50):
+        calculator.calculate(f"{i} 1 + 2 *")
+    
+    stats = cache.stats()
+    assert stats["bytes"] <= 5000
+    assert stats["evictions"] > 0
+    assert len(cache) == stats["nodes"]
+    
+    # The most recent expression is still fully cached
+    before = cache.stats()["reused_tokens"]
+    calculator.calculate("49 1 + 2 *")
+    assert cache.stats()["reused_tokens"] - before == 5
+
+def test_evicts_cold_leaves_first():
+    cache = PrefixCache(max_bytes=4000)
+    calculator = make_calculator()
+    calculator.prefix_cache = cache
+    
+    calculator.calculate("1 2 + 3 +")
+    calculator.calculate("1 2 + 4 +")
+    calculator.calculate("1 2 + 3 +")
+    for i in range(5):
+        calculator.calculate(f"{i + 10} 1 +")
+        calculator.calculate("1 2 + 3 +")
+    
+    # The hot branch survives while the cold one was evicted
+    before = cache.stats()["reused_tokens"]
+    calculator.calculate("1 2 + 3 +")
+    assert cache.stats()["reused_tokens"] - before == 5
+
+def test_cheap_programs_bypass_cache():
+    calculator = RPNCalculator(prefix_cache_bytes=1024 * 1024)
+    # Cheap programs keep constant folding and compiled execution
+    assert calculator.calculate("3 4 + 2 *", trace="none")["result"] == 14
+    assert len(calculator.compile("3 4 + 2 *").instructions) == 1
+    assert calculator.prefix_cache.stats()["lookups"] == 0
+    
+    # Expensive ones are evaluated through the trie
+    assert calculator.compile("2000 ! 7 %").cost > calculator.prefix_cache_min_cost
+    assert calculator.calculate("2000 ! 7 %")["result"] == 0
+    assert calculator.calculate("2000 ! 11 %")["result"] == 0
+    assert calculator.prefix_cache.stats()["reused_tokens"] == 2
+
+def test_disabled():
+    calculator = RPNCalculator()
+    assert calculator.calculate("3 4 +")["result"] == 7
+    assert calculator.prefix_cache.stats()["nodes"] == 0
+    
+    with pytest.raises(ValueError, match="negative"):
+        PrefixCache(-1)
+
+def test_clear():
+    calculator = make_calculator()
+    calculator.calculate("3 4 +")
+    calculator.prefix_cache.clear()
+    stats = calculator.prefix_cache.stats()
+    assert stats["nodes"] == 0 and stats["bytes"] == 0 and stats["lookups"] == 0
@@ -0,0 +1,77 @@
+import json
+
+import pytest
+
+from core.profiling import Profiler, ProfilerBusy, format_report, profile_corpus, profiler_running, read_corpus
+from core.rpn import RPNCalculator
+
+def test_report_lists_functions_and_allocations():
+    calculator = RPNCalculator()
+    with Profiler(top=10) as profiler:
+        retained = [calculator.calculate(f"{n} ! 3 +")["result"] for n in range(50, 80)]
+
+    report = profiler.report()
+    assert report["wall_seconds"] > 0
+    assert len(report["functions"]) <= 10
+    assert any(entry["function"] == "calculate" for entry in report["functions"])
+    cumulative = [entry["cumulative_seconds"] for entry in report["functions"]]
+    assert cumulative == sorted(cumulative, reverse=True)
+    assert report["peak_memory_bytes"] > 0
+    assert report["allocations"] and all(entry["size_bytes"] > 0 for entry in report["allocations"])
+    assert retained
+    json.dumps(report)
+    assert "Top functions by cumulative time" in format_report(report)
+
+def test_without_memory_tracing():
+    with Profiler(memory=False, sort="calls") as profiler:
+        RPNCalculator().calculate("1 2 +")
+
+    report = profiler.report()
+    assert "allocations" not in report
+    calls = [entry["calls"] for entry in report["functions"]]
+    assert calls == sorted(calls, reverse=True)
+
+def test_one_profiler_at_a_time():
+    with Profiler(memory=False):
+        assert profiler_running()
+        with pytest.raises(ProfilerBusy):
+            Profiler(memory=False).start()
+    assert not profiler_running()
+
+def test_unknown_sort():
+    with pytest.raises(ValueError):
+        Profiler(sort="name")
+
+def test_read_corpus_formats(tmp_path):
+    jsonl = tmp_path / "corpus.jsonl"
+    jsonl.write_text("\n".join([
+        json.dumps({"expression": "x 2 *", "variables": {"x": 3}}),
+        json.dumps("1 2 +"),
+        json.dumps({"request_id": "a", "title": "not an expression"}),
+        "not json",
+        ""
+    ]))
+    entries, skipped = read_corpus(str(jsonl))
+    assert entries == [("x 2 *", {"x": 3}), ("1 2 +", None)]
+    assert skipped == 2
+
+    csv_file = tmp_path / "corpus.csv"
+    csv_file.write_text("expression\n3 4 +,ignored\n\n5 !\n")
+    assert read_corpus(str(csv_file)) == ([("3 4 +", None), ("5 !", None)], 0)
+
+    text = tmp_path / "corpus.txt"
+    text.write_text("# comment\n2 3 ^\n\n")
+    assert read_corpus(str(text)) == ([("2 3 ^", None)], 0)
+
+def test_profile_corpus_counts_errors():
+    entries = [("x 2 *", {"x": 3}), ("1 0 /", None), ("1 +", None)]
+    report = profile_corpus(entries, Profiler(memory=False))
+    assert report["expressions"] == 3
+    assert report["errors"] == 2
+
+def test_profile_corpus_counts_arithmetic_errors():
+    # Neither raises ValueError from the scalar calculator
+    entries = [("0 -1 ^", None), ("10.5 400 ^", None), ("3 4 +", None)]
+    report = profile_corpus(entries, Profiler(memory=False))
+    assert report["expressions"] == 3
+    assert report["errors"] == 2
@@ -0,0 +1,68 @@
+import datetime
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from core.db.models import Base
+from core.db.bulk import save_calculations
+from core.db.queries import decode_cursor, encode_cursor, history_statement, split_page
+
+@pytest.fixture
+def db_session():
+    """Create a session on an in-memory database with seeded history."""
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine)
+    session = Session(engine)
+    
+    # Two batches, each sharing a single timestamp, to exercise the id tie-breaker
+    early = datetime.datetime(2024, 1, 1)
+    late = datetime.datetime(2024, 1, 2)
+    save_calculations(session, "alice", [
+        {"expression": f"{i} 1 +", "result": i + 1, "timestamp": early} for i in range(15)
+    ])
+    save_calculations(session, "bob", [
+        {"expression": f"{i} 2 +", "result": i + 2, "timestamp": late} for i in range(10)
+    ])
+    try:
+        yield session
+    finally:
+        session.close()
+
+def fetch_all_pages(session, user_id=None, limit=10):
+    ids = []
+    cursor = None
+    pages = 0
+    while True:
+        rows = session.scalars(history_statement(user_id, limit, cursor)).all()
+        page, cursor = split_page(rows, limit)
+        ids.extend(row.id for row in page)
+        pages += 1
+        if cursor is None:
+            return ids, pages
+
+def test_cursor_round_trip():
+    timestamp = datetime.datetime(2024, 5, 6, 7, 8, 9, 123456)
+    assert decode_cursor(encode_cursor(timestamp, 42)) == (timestamp, 42)
+
+def test_invalid_cursor():
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        decode_cursor("not-a-cursor")
+
+def test_pages_cover_history_in_order(db_session):
+    ids, pages = fetch_all_pages(db_session)
+    assert pages == 3
+    assert len(ids) == 25
+    assert len(set(ids)) == 25
+    # Newest batch first, then descending id within equal timestamps
+    assert ids == list(range(25, 15, -1)) + list(range(15, 0, -1))
+
+def test_pages_filtered_by_user(db_session):
+    ids, pages = fetch_all_pages(db_session, user_id="alice", limit=5)
+    assert ids == list(range(15, 0, -1))
+    assert pages == 3
+
+def test_last_page_has_no_cursor(db_session):
+    rows = db_session.scalars(history_statement("bob", limit=10)).all()
+    page, cursor = split_page(rows, 10)
+    assert len(page) == 10
+    assert cursor is None
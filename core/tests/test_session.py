@@ -0,0 +1,204 @@
+import pytest
+
+from core.rpn import Limits, RPNCalculator
+from core.rpn.session import RPNSession
+
+def test_push_and_apply():
+    session = RPNSession()
+    session.push(3)
+    session.push("4")
+    entry = session.apply("+")
+    
+    assert entry == {"operator": "+", "operands": [3, 4], "result": 7}
+    assert session.stack == [7]
+    
+    session.push("pi")
+    session.apply("*")
+    assert session.stack == [pytest.approx(7 * 3.141592653589793)]
+
+def test_unary_operator():
+    session = RPNSession()
+    session.push(16)
+    session.apply("sqrt")
+    assert session.stack == [4.0]
+
+def test_pop():
+    session = RPNSession()
+    session.push(1)
+    session.push(2)
+    
+    assert session.pop() == 2
+    assert session.stack == [1]
+    session.clear()
+    with pytest.raises(ValueError, match="Stack is empty"):
+        session.pop()
+
+def test_failed_apply_leaves_stack_unchanged():
+    session = RPNSession()
+    session.push(1)
+    with pytest.raises(ValueError, match="Insufficient operands for operator '\\+'"):
+        session.apply("+")
+    
+    session.push(0)
+    with pytest.raises(ValueError, match="Division by zero is not allowed"):
+        session.apply("/")
+    assert session.stack == [1, 0]
+    
+    with pytest.raises(ValueError, match="Invalid token: \\?"):
+        session.apply("?")
+
+def test_variables():
+    session = RPNSession()
+    with pytest.raises(ValueError, match="Invalid token: x"):
+        session.push("x")
+    with pytest.raises(ValueError, match="Invalid token: 2x"):
+        session.push("2x")
+    
+    session.bind(x=5)
+    with pytest.raises(ValueError, match="Unbound variable: y"):
+        session.push("y")
+    session.push("x")
+    assert session.stack == [5]
+    assert session.evaluate("x 2 *")["result"] == 10
+    # Per-call variables override the session's
+    assert session.evaluate("x 2 *", variables={"x": 1})["result"] == 2
+    assert session.evaluate("3 4 +", trace="none")["result"] == 7
+
+@pytest.mark.parametrize("value", [[1, 2], None, True, {"x": 1}])
+def test_rejects_non_numeric_values(value):
+    session = RPNSession()
+    with pytest.raises(ValueError, match="must be a number"):
+        session.push(value)
+    with pytest.raises(ValueError, match="Variable x must be a number"):
+        session.bind(x=value)
+    with pytest.raises(ValueError, match="Variable x must be a number"):
+        session.evaluate("x 1 +", variables={"x": value})
+    with pytest.raises(ValueError, match="Variable x must be a number"):
+        session.bind(x="5")
+    assert session.stack == []
+    assert session.variables == {}
+
+def test_shares_compiled_programs():
+    calculator = RPNCalculator()
+    RPNSession(calculator).evaluate("3 4 +")
+    RPNSession(calculator).evaluate("3 4 +")
+    assert calculator.program_cache.stats()["hits"] == 1
+
+def test_limits():
+    session = RPNSession(RPNCalculator(limits=Limits(max_operand=1000, max_result_bits=100)))
+    with pytest.raises(ValueError, match="Operand exceeds"):
+        session.push(5000)
+    with pytest.raises(ValueError, match="Operand exceeds"):
+        session.bind(x=5000)
+    
+    session.push(100)
+    with pytest.raises(ValueError, match="Result is too large"):
+        session.apply("!")
+    assert session.stack == [100]
+
+def test_feed():
+    session = RPNSession()
+    operations = session.feed("3 4 + 2")
+    
+    assert operations == [{"operator": "+", "operands": [3, 4], "result": 7}]
+    assert session.stack == [7, 2]
+    assert session.tokens == ["3", "4", "+", "2"]
+    
+    session.feed(["*"])
+    assert session.result() == 14
+    assert len(session.operations()) == 2
+
+def test_result_requires_single_value():
+    session = RPNSession()
+    with pytest.raises(ValueError, match="Expression cannot be empty"):
+        session.result()
+    session.feed("1 2")
+    with pytest.raises(ValueError, match="too many operands"):
+        session.result()
+
+def test_snapshot_and_rollback():
+    session = RPNSession()
+    session.feed("2 3")
+    snapshot = session.snapshot()
+    
+    session.feed("+ 10 *")
+    assert session.stack == [50]
+    
+    session.rollback(snapshot)
+    assert session.stack == [2, 3]
+    assert snapshot.stack == [2, 3]
+    
+    session.feed("*")
+    other_branch = session.snapshot()
+    assert session.stack == [6]
+    
+    # Snapshots from an abandoned branch remain valid
+    session.rollback(snapshot)
+    session.feed("-")
+    session.rollback(other_branch)
+    assert session.stack == [6]
+    assert session.tokens == ["2", "3", "*"]
+    
+    with pytest.raises(ValueError, match="another session"):
+        session.rollback(RPNSession().snapshot())
+
+def test_snapshot_shares_stack():
+    session = RPNSession()
+    session.feed(" ".join(["1"] * 100))
+    before = session.snapshot()
+    session.feed("+")
+    
+    # The new state reuses every frame below the operands
+    assert session.state._top.below is before._top.below.below
+
+def test_pop_and_clear():
+    session = RPNSession()
+    session.feed("1 2")
+    snapshot = session.snapshot()
+    
+    assert session.pop() == 2
+    session.rollback(snapshot)
+    assert session.stack == [1, 2]
+    
+    session.clear()
+    assert session.stack == [] and session.tokens == []
+
+def test_resume_reuses_prefix():
+    calls = []
+    calculator = RPNCalculator()
+    factorial = calculator.operations["!"]
+    calculator.operations["!"] = lambda a: calls.append(a) or factorial(a)
+    session = RPNSession(calculator)
+    
+    assert session.resume("20 ! 3 +") == 0
+    assert session.result() == 2432902008176640003
+    
+    # Appending and editing the tail keep the shared prefix
+    assert session.resume("20 ! 3 + 2 *") == 4
+    assert session.result() == 4865804016353280006
+    assert session.resume("20 ! 5 -") == 2
+    assert session.result() == 2432902008176639995
+    assert calls == [20]
+    
+    assert session.resume("4 !") == 0
+    assert session.result() == 24
+
+def test_resume_failure_keeps_valid_prefix():
+    session = RPNSession()
+    with pytest.raises(ValueError, match="Division by zero is not allowed"):
+        session.resume("1 2 + 0 /")
+    assert session.tokens == ["1", "2", "+", "0"]
+    
+    assert session.resume("1 2 + 4 /") == 3
+    assert session.result() == 0.75
+
+def test_resume_after_rebinding():
+    session = RPNSession()
+    session.bind(x=2)
+    session.resume("3 x *")
+    assert session.result() == 6
+    
+    session.bind(x=5)
+    assert session.stack == [6]
+    assert session.resume("3 x * 1 +") == 1
+    assert session.result() == 16
@@ -0,0 +1,120 @@
+import asyncio
+import datetime
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import Session
+
+from core.db.models import Base
+from core.db.bulk import save_calculations, save_calculations_async
+from core.db.archive import compact_calculations
+from core.db.stats import get_user_stats, get_user_stats_async, rebuild_user_stats
+
+START = datetime.datetime(2024, 1, 1, 9, 30)
+
+@pytest.fixture
+def db_session():
+    """Create a clean in-memory database session."""
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine)
+    session = Session(engine)
+    try:
+        yield session
+    finally:
+        session.close()
+
+def seed(session):
+    save_calculations(session, "alice", [
+        {"expression": "3 4 +", "result": 7, "timestamp": START},
+        {"expression": "2 sqrt 3 *", "result": 4.24, "timestamp": START + datetime.timedelta(minutes=10)},
+        {"expression": "5 1 -", "result": -1, "timestamp": START + datetime.timedelta(hours=2)}
+    ], errors=1)
+    save_calculations(session, "alice", [
+        {"expression": "1 2 + 3 +", "result": 6, "timestamp": START + datetime.timedelta(hours=2, minutes=5)}
+    ], errors=2)
+    save_calculations(session, "bob", [{"expression": "9 9 *", "result": 81, "timestamp": START}])
+
+def test_stats_accumulate_across_inserts(db_session):
+    seed(db_session)
+    
+    stats = get_user_stats(db_session, "alice")
+    
+    assert stats["calculations"] == 4
+    assert stats["errors"] == 3
+    assert stats["error_rate"] == pytest.approx(3 / 7)
+    assert stats["result"]["min"] == -1
+    assert stats["result"]["max"] == 7
+    assert stats["result"]["mean"] == pytest.approx((7 + 4.24 - 1 + 6) / 4)
+    assert stats["first_at"] == START
+    assert stats["last_at"] == START + datetime.timedelta(hours=2, minutes=5)
+    assert stats["operators"] == {"+": 3, "sqrt": 1, "*": 1, "-": 1}
+    assert stats["activity"] == [
+        {"bucket": datetime.datetime(2024, 1, 1, 9), "count": 2},
+        {"bucket": datetime.datetime(2024, 1, 1, 11), "count": 2}
+    ]
+
+def test_activity_since(db_session):
+    seed(db_session)
+    
+    stats = get_user_stats(db_session, "alice", since=START + datetime.timedelta(hours=1, minutes=45))
+    
+    # Totals are unaffected; activity starts at the bucket containing since
+    assert stats["calculations"] == 4
+    assert stats["activity"] == [{"bucket": datetime.datetime(2024, 1, 1, 11), "count": 2}]
+
+def test_unknown_user(db_session):
+    stats = get_user_stats(db_session, "nobody")
+    
+    assert stats["calculations"] == 0
+    assert stats["error_rate"] == 0.0
+    assert stats["result"] == {"min": None, "max": None, "mean": None}
+    assert stats["operators"] == {}
+    assert stats["activity"] == []
+
+def test_errors_only(db_session):
+    save_calculations(db_session, "carol", [], errors=2)
+    
+    stats = get_user_stats(db_session, "carol")
+    
+    assert stats["calculations"] == 0
+    assert stats["errors"] == 2
+    assert stats["error_rate"] == 1.0
+    assert stats["result"]["min"] is None
+
+def test_rebuild_matches_incremental(db_session):
+    seed(db_session)
+    before = get_user_stats(db_session, "alice")
+    
+    # Archived rows still count once the aggregates are rebuilt
+    compact_calculations(db_session, START + datetime.timedelta(hours=1))
+    rebuild_user_stats(db_session)
+    
+    assert get_user_stats(db_session, "alice") == before
+    assert get_user_stats(db_session, "bob")["calculations"] == 1
+
+def test_stats_async(tmp_path):
+    """Test the async writer and reader against a file-backed SQLite database."""
+    pytest.importorskip("aiosqlite")
+    path = tmp_path / "stats.db"
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    engine.dispose()
+    
+    async def scenario():
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        async with AsyncSession(async_engine) as db:
+            await save_calculations_async(db, "alice", [
+                {"expression": "3 4 +", "result": 7},
+                {"expression": "2 3 ^", "result": 8}
+            ], errors=1)
+            await save_calculations_async(db, "alice", [{"expression": "1 1 +", "result": 2}])
+            stats = await get_user_stats_async(db, "alice")
+        await async_engine.dispose()
+        return stats
+    
+    stats = asyncio.run(scenario())
+    assert stats["calculations"] == 3
+    assert stats["errors"] == 1
+    assert stats["result"]["max"] == 8
+    assert stats["operators"] == {"+": 2, "^": 1}
+    assert sum(bucket["count"] for bucket in stats["activity"]) == 3
@@ -0,0 +1,111 @@
+import pytest
+import math
+
+np = pytest.importorskip("numpy")
+
+from core.rpn.calculator import RPNCalculator
+from core.rpn.compiler import Limits
+from core.rpn.vectorized import BatchEvaluator, VectorizedProgram, split_template
+
+evaluator = BatchEvaluator()
+
+# Test template grouping
+def test_split_template():
+    template, values = split_template("3 4 + pi *", RPNCalculator().operations)
+    assert template == ("#", "#", "+", "#", "*")
+    assert values == [3, 4, pytest.approx(math.pi)]
+
+def test_same_template_is_compiled_once():
+    batch_evaluator = BatchEvaluator()
+    batch_evaluator.evaluate(["1 2 +", "3 4 +", "5 6 +"])
+    assert len(batch_evaluator.program_cache) == 1
+
+# Test results match the scalar calculator
+@pytest.mark.parametrize("expression", [
+    "3 4 +", "5 6 + 2 *", "20 5 / 2 -", "16 sqrt", "45 sin", "5 !",
+    "100 log", "2 3 ^ 4 + 5 /", "e ln", "7 3 %", "60 cos 30 tan *"
+])
+def test_matches_scalar_results(expression):
+    [item] = evaluator.evaluate([expression])
+    expected = RPNCalculator().calculate(expression)["result"]
+    assert item["result"] == pytest.approx(expected)
+
+def test_preserves_order_across_templates():
+    results = evaluator.evaluate(["1 2 +", "4 sqrt", "3 4 +"])
+    assert [item["result"] for item in results] == [3, 2, 7]
+
+# Test per-row errors
+def test_masks_row_errors():
+    results = evaluator.evaluate(["4 2 /", "4 0 /", "-1 sqrt", "2.5 !", "0 log", "1 +", "1x"])
+    assert results[0]["result"] == 2
+    assert results[1]["error"] == "Division by zero is not allowed"
+    assert results[2]["error"] == "Cannot calculate square root of a negative number"
+    assert results[3]["error"] == "Factorial is only defined for non-negative integers"
+    assert results[4]["error"] == "Cannot calculate logarithm of zero or negative number"
+    assert "Insufficient operands" in results[5]["error"]
+    assert results[6]["error"] == "Invalid token: 1x (at token 1)"
+
+def test_overflow_is_reported():
+    [item] = evaluator.evaluate(["200 !"])
+    assert item["error"] == "Numerical result out of range"
+
+def test_factorial_of_huge_or_infinite_operand_fails():
+    program = VectorizedProgram(("#", "!"), {"#": 0, "!": 1})
+    batch = program.evaluate(np.array([[1e19], [1e300], [np.inf]]))
+    assert batch.failed.all()
+    assert list(batch.errors) == [
+        "Numerical result out of range",
+        "Numerical result out of range",
+        "Factorial is only defined for non-negative integers"
+    ]
+
+    results = evaluator.evaluate(["1e19 !", "inf !"])
+    assert "result" not in results[0]
+    assert results[1]["error"] == "Factorial is only defined for non-negative integers"
+
+# Test integers beyond float64 precision fall back to the scalar calculator
+@pytest.mark.parametrize("expression", ["2 60 ^ 1 + 2 60 ^ -", "25 ! 1 + 25 ! -"])
+def test_large_integers_match_scalar_results(expression):
+    [item] = evaluator.evaluate([expression])
+    assert item["result"] == RPNCalculator().calculate(expression)["result"] == 1
+
+def test_evaluate_columns_keeps_large_integers_exact():
+    program = RPNCalculator().compile("x 1 + x -")
+    assert program.evaluate_many(x=[2 ** 60, 5]) == [1, 1]
+
+# Test traced operations log
+def test_trace_rebuilds_operations_log():
+    [item] = evaluator.evaluate(["3 4 + 2 *"], trace="full")
+    assert item["operations"] == [
+        {"operator": "+", "operands": [3, 4], "result": 7},
+        {"operator": "*", "operands": [7, 2], "result": 14}
+    ]
+
+def test_large_batch():
+    expressions = [f"{i} 2 * 1 +" for i in range(10000)]
+    results = evaluator.evaluate(expressions)
+    assert results[9999]["result"] == 19999
+
+# Test variable columns
+def test_evaluate_columns_broadcasts_literals():
+    program = RPNCalculator().compile("x 2 * y +")
+    results = program.evaluate_many(x=np.arange(100000), y=np.ones(100000))
+    assert len(results) == 100000
+    assert results[-1] == 199999
+
+def test_identifiers_are_invalid_tokens_in_batches():
+    [item] = evaluator.evaluate(["1 x +"])
+    assert item["error"] == "Invalid token: x (at token 2)"
+
+def test_trace_summary_is_shared_per_template():
+    results = evaluator.evaluate(["1 2 +", "3 4 +"], trace="summary")
+    assert results[0]["summary"] == {"steps": 1, "operators": {"+": 1}, "max_depth": 2}
+    assert "operations" not in results[1]
+
+def test_operand_limit_matches_scalar():
+    calculator = RPNCalculator(limits=Limits(max_operand=100))
+    results = BatchEvaluator(calculator).evaluate(["3 4 +", "300 4 +", "3 -400 *"])
+    
+    assert results[0]["result"] == 7
+    assert results[1]["error"] == "Operand exceeds the maximum magnitude of 100"
+    assert results[2]["error"] == "Operand exceeds the maximum magnitude of 100"
@@ -0,0 +1,142 @@
+import asyncio
+import datetime
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from core.db.models import Base, User, Calculation, UserStats
+from core.db.writer import ErrorCounter, WriteBehindWriter
+
+@pytest.fixture
+def session_factory(tmp_path):
+    """Create a file-backed SQLite database usable from worker threads."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'writer.db'}")
+    Base.metadata.create_all(engine)
+    try:
+        yield sessionmaker(bind=engine)
+    finally:
+        engine.dispose()
+
+def test_flushes_by_batch_size(session_factory):
+    """Test that full batches are written without waiting for the interval."""
+    writer = WriteBehindWriter(session_factory, batch_size=10, flush_interval=60)
+    
+    async def scenario():
+        await writer.start()
+        for i in range(25):
+            await writer.enqueue(f"user{i % 2}", {"expression": f"{i} 1 +", "result": i + 1})
+        while writer.written < 20:
+            await asyncio.sleep(0.01)
+        stats = writer.stats()
+        await writer.stop()
+        return stats
+    
+    stats = asyncio.run(scenario())
+    assert stats["flushes"] >= 2
+    
+    db = session_factory()
+    assert db.query(Calculation).count() == 25
+    assert db.query(User).count() == 2
+    db.close()
+    assert writer.stats()["written"] == 25
+
+def test_stop_flushes_pending_rows(session_factory):
+    """Test that stopping the writer drains the queue."""
+    writer = WriteBehindWriter(session_factory, batch_size=100, flush_interval=60)
+    
+    async def scenario():
+        await writer.start()
+        for i in range(5):
+            await writer.enqueue("user", {"expression": "1 1 +", "result": 2})
+        await writer.stop()
+    
+    asyncio.run(scenario())
+    db = session_factory()
+    assert db.query(Calculation).count() == 5
+    db.close()
+    assert not writer.running
+
+def test_rows_keep_the_time_they_were_queued(session_factory):
+    """Test that rows are timestamped when queued, not when written."""
+    writer = WriteBehindWriter(session_factory, batch_size=100, flush_interval=60)
+    requested = datetime.datetime(2024, 1, 1, 12, 0)
+    
+    async def scenario():
+        await writer.start()
+        await writer.enqueue("user", {"expression": "1 1 +", "result": 2, "timestamp": requested})
+        await writer.enqueue("user", {"expression": "2 2 +", "result": 4})
+        queued = datetime.datetime.utcnow()
+        await asyncio.sleep(0.2)
+        await writer.stop()
+        return queued
+    
+    queued = asyncio.run(scenario())
+    db = session_factory()
+    timestamps = dict(db.query(Calculation.expression, Calculation.timestamp))
+    db.close()
+    assert timestamps["1 1 +"] == requested
+    assert timestamps["2 2 +"] <= queued
+
+def test_backpressure_waits_for_room(session_factory):
+    """Test that enqueue blocks while the queue is full."""
+    writer = WriteBehindWriter(session_factory, max_queue_size=2, batch_size=1, flush_interval=0.01)
+    
+    async def scenario():
+        await writer.start()
+        await asyncio.gather(*[
+            writer.enqueue("user", {"expression": "1 1 +", "result": 2})
+            for _ in range(10)
+        ])
+        await writer.stop()
+    
+    asyncio.run(scenario())
+    assert writer.stats()["written"] == 10
+
+def test_enqueue_requires_start(session_factory):
+    """Test that rows cannot be queued before the writer starts."""
+    writer = WriteBehindWriter(session_factory)
+    with pytest.raises(RuntimeError):
+        asyncio.run(writer.enqueue("user", {"expression": "1 1 +", "result": 2}))
+
+def test_error_counter_writes_counts_in_batches(session_factory):
+    """Test that failures are counted in memory and written together."""
+    counter = ErrorCounter(session_factory, flush_interval=60)
+    
+    async def scenario():
+        await counter.start()
+        for i in range(10):
+            counter.add(f"user{i % 2}")
+        pending = counter.pending()
+        await counter.stop()
+        return pending
+    
+    assert asyncio.run(scenario()) == 10
+    assert counter.stats()["flushes"] == 1
+    assert counter.stats()["written"] == 10
+    
+    db = session_factory()
+    assert {stats.user_id: stats.error_count for stats in db.query(UserStats)} == {"user0": 5, "user1": 5}
+    db.close()
+
+def test_error_counter_flushes_early_when_many_users(session_factory):
+    """Test that reaching max_users flushes before the interval."""
+    counter = ErrorCounter(session_factory, flush_interval=60, max_users=3)
+    
+    async def scenario():
+        await counter.start()
+        for i in range(4):
+            counter.add(f"user{i}")
+        while counter.written < 3:
+            await asyncio.sleep(0.01)
+        await counter.stop()
+    
+    asyncio.run(scenario())
+    assert counter.stats()["written"] == 4
+
+def test_error_counter_bounded_before_start(session_factory):
+    """Test that counts for new users are dropped once full before starting."""
+    counter = ErrorCounter(session_factory, max_users=2)
+    for user_id in ["a", "b", "c", "a"]:
+        counter.add(user_id)
+    assert counter.pending() == 3
+    assert counter.dropped == 1
@@ -64,6 +64,46 @@ export const uploadCSV = async (file: File): Promise<CSVUploadResult> => {
   }
 };
 
+/**
+ * Evaluate many expressions in a single request
+ */
+export interface BatchCalculationResult {
+  results: Array<{
+    expression: string;
+    result?: number;
+    operations?: Array<{
+      operator: string;
+      operands: number[];
+      result: number;
+    }>;
+    error?: string;
+  }>;
+}
+
+export const calculateBatch = async (expressions: string[]): Promise<BatchCalculationResult> => {
+  try {
+    const response = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/api/calculate/batch`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({
+        expressions: expressions,
+        user_id: 'user1',
+      }),
+    });
+
+    if (!response.ok) {
+      throw new Error('Failed to calculate expressions');
+    }
+
+    return await response.json();
+  } catch (err) {
+    console.error('Error calculating expressions:', err);
+    throw err;
+  }
+};
+
 /**
  * Get a list of all supported operations
  */
@@ -16,7 +16,7 @@ export interface HistoryItem {
 
 export const fetchHistory = async (): Promise<HistoryItem[]> => {
     try {
-      const response = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/api/history`);
+      const response = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/api/history?include_operations=true`);
       if (!response.ok) {
         throw new Error('Failed to fetch history');
       }
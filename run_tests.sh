@@ -19,6 +19,10 @@ cd core
 python -m tests.run_all_tests
 cd ..
 
+# Run backend API tests
+echo -e "\n${BLUE}Running backend tests...${NC}"
+python -m pytest -q backend/tests
+
 # Run frontend linting if available
 if [ -d "frontend" ]; then
     echo -e "\n${BLUE}Running frontend linting...${NC}"